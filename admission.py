@@ -0,0 +1,242 @@
+"""
+Admission control for the expensive endpoints: chat generation, uploads and
+background URL ingestion jobs.
+
+Two layers, both keyed by the authenticated user (see `auth_required`):
+
+- Token buckets per (lane, user) with rate and burst set per role, checked
+  on arrival. An empty bucket is refused at once with the time until the
+  next token.
+- A bounded fair queue per lane in front of the actual work. At most
+  `concurrency` requests run; the rest wait, and freed slots are handed out
+  round-robin across users, so one user with many queued requests cannot
+  starve the others. Full queues and waits past `max_wait` are refused.
+
+Refusals raise `Saturated`, which app.py turns into 429 with Retry-After.
+"""
+import os
+import logging
+import math
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional, Tuple
+
+import metrics
+from cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# lane -> role -> (requests per minute, burst); override with
+# RATE_LIMIT_<LANE>_<ROLE>="<per minute>:<burst>", e.g. RATE_LIMIT_CHAT_USER="30:10"
+DEFAULT_RATE_LIMITS = {
+    "chat": {"user": (20, 5), "admin": (120, 30)},
+    "ingestion": {"user": (6, 3), "admin": (30, 10)},
+}
+# Idle buckets are dropped after this long (a full bucket carries no state)
+BUCKET_IDLE_SECONDS = 600
+
+
+class Saturated(Exception):
+    """A request refused by admission control; `retry_after` is in seconds."""
+
+    def __init__(self, lane: str, reason: str, retry_after: float):
+        super().__init__(f"{lane} is saturated ({reason}); retry in {retry_after:.0f}s")
+        self.lane = lane
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class TokenBucket:
+    """`rate` tokens per second up to `burst`; thread-safe."""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def try_acquire(self, tokens: float = 1.0) -> Tuple[bool, float]:
+        """Take `tokens` if available; otherwise return the seconds until they will be."""
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= tokens:
+                self.tokens -= tokens
+                return True, 0.0
+            return False, (tokens - self.tokens) / self.rate if self.rate > 0 else float("inf")
+
+
+def _rate_limit(lane: str, role: str) -> Optional[Tuple[float, float]]:
+    override = os.getenv(f"RATE_LIMIT_{lane}_{role}".upper())
+    if override:
+        per_minute, _, burst = override.partition(":")
+        return float(per_minute), float(burst or per_minute)
+    limits = DEFAULT_RATE_LIMITS.get(lane, {})
+    return limits.get(role) or limits.get("user")
+
+
+class RateLimits:
+    """Token buckets per (lane, user), sized by the user's role."""
+
+    def __init__(self, idle_seconds: float = BUCKET_IDLE_SECONDS):
+        self._buckets = TTLCache(maxsize=100000, ttl=idle_seconds)
+        self._lock = threading.Lock()
+
+    def check(self, lane: str, user: str, role: Optional[str]) -> None:
+        """Spend one token for `user` in `lane`, or raise Saturated."""
+        limit = _rate_limit(lane, role or "user")
+        if limit is None:
+            return
+        per_minute, burst = limit
+        key = (lane, user)
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                bucket = TokenBucket(per_minute / 60.0, burst)
+            # Re-set on every use so the idle TTL only drops quiet users
+            self._buckets.set(key, bucket)
+        allowed, retry_after = bucket.try_acquire()
+        if not allowed:
+            metrics.inc("admission_rejected_total", lane=lane, reason="rate_limit")
+            raise Saturated(lane, "rate limit", retry_after)
+
+
+class _Waiter:
+    __slots__ = ("event", "granted")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.granted = False
+
+
+class FairQueue:
+    """
+    At most `concurrency` holders at a time; waiters are admitted round-robin
+    across users. Refuses new waiters beyond `max_queue` in total or
+    `max_per_user` for one user, and waiters not admitted within `max_wait`.
+    """
+
+    def __init__(self, lane: str, concurrency: int, max_queue: int, max_per_user: int, max_wait: float):
+        self.lane = lane
+        self.concurrency = concurrency
+        self.max_queue = max_queue
+        self.max_per_user = max_per_user
+        self.max_wait = max_wait
+        self.running = 0
+        self.queued = 0
+        # user -> waiters, in the order users get their next turn
+        self._waiters: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Smoothed seconds a slot is held, for Retry-After estimates
+        self._service_seconds = 1.0
+
+    def _retry_after(self) -> float:
+        return self._service_seconds * (self.queued + 1) / self.concurrency
+
+    def _acquire(self, user: str) -> None:
+        with self._lock:
+            if self.running < self.concurrency and not self.queued:
+                self.running += 1
+                metrics.observe("admission_queue_wait_seconds", 0.0, lane=self.lane)
+                return
+            mine = self._waiters.get(user)
+            if self.queued >= self.max_queue or (mine is not None and len(mine) >= self.max_per_user):
+                reason = "queue_full" if self.queued >= self.max_queue else "user_queue_full"
+                metrics.inc("admission_rejected_total", lane=self.lane, reason=reason)
+                raise Saturated(self.lane, reason.replace("_", " "), self._retry_after())
+            waiter = _Waiter()
+            self._waiters.setdefault(user, deque()).append(waiter)
+            self.queued += 1
+
+        started = time.perf_counter()
+        waiter.event.wait(self.max_wait)
+        with self._lock:
+            if not waiter.granted:
+                self._waiters[user].remove(waiter)
+                if not self._waiters[user]:
+                    del self._waiters[user]
+                self.queued -= 1
+                metrics.inc("admission_rejected_total", lane=self.lane, reason="queue_timeout")
+                raise Saturated(self.lane, "queue timeout", self._retry_after())
+        metrics.observe("admission_queue_wait_seconds", time.perf_counter() - started, lane=self.lane)
+
+    def _release(self, held_seconds: float) -> None:
+        with self._lock:
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds
+            if not self._waiters:
+                self.running -= 1
+                return
+            # Hand the slot straight to the next user in turn
+            user, waiters = self._waiters.popitem(last=False)
+            waiter = waiters.popleft()
+            if waiters:
+                self._waiters[user] = waiters
+            self.queued -= 1
+            waiter.granted = True
+            waiter.event.set()
+
+    @contextmanager
+    def slot(self, user: str) -> Iterator[None]:
+        """Hold one of the lane's slots for the duration of the block."""
+        self._acquire(user)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._release(time.perf_counter() - started)
+
+    def status(self) -> Dict[str, float]:
+        with self._lock:
+            return {
+                "running": self.running,
+                "queued": self.queued,
+                "waiting_users": len(self._waiters),
+                "concurrency": self.concurrency,
+                "max_queue": self.max_queue,
+            }
+
+
+rate_limits = RateLimits()
+# Generation slots match the Gemini client's own limit so admitted requests
+# don't pile up again inside it
+queues = {
+    "chat": FairQueue(
+        "chat",
+        concurrency=int(os.getenv("CHAT_QUEUE_CONCURRENCY", os.getenv("GENERATION_MAX_CONCURRENCY", 8))),
+        max_queue=int(os.getenv("CHAT_QUEUE_SIZE", 64)),
+        max_per_user=int(os.getenv("CHAT_QUEUE_PER_USER", 4)),
+        max_wait=float(os.getenv("CHAT_QUEUE_WAIT_SECONDS", 15)),
+    ),
+    "ingestion": FairQueue(
+        "ingestion",
+        concurrency=int(os.getenv("INGESTION_QUEUE_CONCURRENCY", 2)),
+        max_queue=int(os.getenv("INGESTION_QUEUE_SIZE", 8)),
+        max_per_user=int(os.getenv("INGESTION_QUEUE_PER_USER", 2)),
+        max_wait=float(os.getenv("INGESTION_QUEUE_WAIT_SECONDS", 60)),
+    ),
+    # Bulk URL ingestion jobs run for minutes in the background; their own
+    # lane keeps them from holding the slots interactive uploads wait on
+    "ingest_jobs": FairQueue(
+        "ingest_jobs",
+        concurrency=int(os.getenv("INGEST_JOB_QUEUE_CONCURRENCY", 2)),
+        max_queue=int(os.getenv("INGEST_JOB_QUEUE_SIZE", 16)),
+        max_per_user=int(os.getenv("INGEST_JOB_QUEUE_PER_USER", 4)),
+        max_wait=float(os.getenv("INGEST_JOB_QUEUE_WAIT_SECONDS", 3600)),
+    ),
+}
+
+
+def admit(lane: str, user: dict) -> None:
+    """Rate-limit check for a `request.user` from `auth_required`."""
+    rate_limits.check(lane, user.get("email", ""), user.get("role"))
+
+
+@contextmanager
+def slot(lane: str, user: dict) -> Iterator[None]:
+    """Wait for a fair-queue slot in `lane` on behalf of `user`."""
+    with queues[lane].slot(user.get("email", "")):
+        yield
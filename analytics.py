@@ -0,0 +1,409 @@
+"""
+Admin analytics over the `chat_logs` collection.
+
+- Scans page through the collection by document id with a field projection,
+  so only the requested fields are read (no transcripts for id-only or
+  metadata scans) and at most one page is held in memory.
+- `export_jsonl` / `export_parquet` stream conversations out with constant
+  memory.
+- Aggregates (questions and unanswered replies per day, top queries) are
+  counted as messages are sent, buffered briefly, and written as increments to
+  small summary documents, so dashboards read a few documents instead of
+  rescanning the logs. `rebuild_summaries` backfills them from the logs.
+
+    python analytics.py export --format parquet --since 2025-01-01 --out chats.parquet
+    python analytics.py summary --days 14
+    python analytics.py rebuild
+"""
+import os
+import atexit
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from datetime import date, datetime, timedelta, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import metrics
+from chatbot import normalize_query
+from utils import COLLECTION, get_db
+
+logger = logging.getLogger(__name__)
+
+DAILY_COL = "analytics_daily"
+QUERIES_COL = "analytics_queries"
+# Documents fetched per page by the scans and exports
+SCAN_PAGE_SIZE = int(os.getenv("ANALYTICS_PAGE_SIZE", 500))
+# Buffered counters are written at least this often
+FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", 10))
+# Firestore allows 500 writes per batch
+MAX_BATCH_WRITES = 500
+# Stored queries are cut to this length (top-query lists only need the gist)
+MAX_QUERY_CHARS = 300
+
+# The system prompt's fallback when the official resources have no answer
+UNANSWERED_REPLY = re.compile(r"don[’']t have that information", re.IGNORECASE)
+
+CHAT_METADATA_FIELDS = ["userId", "userName", "created_at", "updated_at", "favorite"]
+
+
+def is_unanswered(reply: str) -> bool:
+    return bool(reply and UNANSWERED_REPLY.search(reply))
+
+
+def _query_key(query: str) -> str:
+    return hashlib.blake2b(query.encode("utf-8"), digest_size=12).hexdigest()
+
+
+def _day(when: Optional[datetime]) -> str:
+    when = when or datetime.now(timezone.utc)
+    if when.tzinfo is not None:
+        when = when.astimezone(timezone.utc)
+    return when.date().isoformat()
+
+
+def _iso(value: Any) -> Any:
+    return value.isoformat() if isinstance(value, (datetime, date)) else value
+
+
+def iter_chat_docs(
+    fields: Optional[List[str]] = None,
+    since: Optional[datetime] = None,
+    page_size: int = SCAN_PAGE_SIZE
+) -> Iterator[Tuple[str, Dict[str, Any]]]:
+    """
+    Yield (chat id, projected fields) for every chat, one page at a time.
+
+    Args:
+        fields: Fields to fetch; [] fetches ids only, None whole documents
+        since: Only chats created at or after this time
+        page_size: Documents per Firestore query
+    """
+    query = get_db().collection(COLLECTION)
+    if since is not None:
+        # The range field has to lead the ordering (and be in the cursor snapshot)
+        query = query.where("created_at", ">=", since).order_by("created_at")
+        if fields is not None and "created_at" not in fields:
+            fields = fields + ["created_at"]
+    query = query.order_by("__name__")
+    if fields is not None:
+        query = query.select(fields)
+
+    last = None
+    while True:
+        page = query.start_after(last) if last is not None else query
+        docs = list(page.limit(page_size).stream())
+        metrics.inc("analytics_docs_scanned_total", len(docs))
+        for doc in docs:
+            yield doc.id, doc.to_dict() or {}
+        if len(docs) < page_size:
+            return
+        last = docs[-1]
+
+
+def iter_chat_ids(page_size: int = SCAN_PAGE_SIZE) -> Iterator[str]:
+    """Every chat id, without reading any document fields."""
+    for chat_id, _ in iter_chat_docs(fields=[], page_size=page_size):
+        yield chat_id
+
+
+def _messages(chat: List[dict]) -> List[Dict[str, str]]:
+    return [
+        {"role": role, "text": text}
+        for entry in chat or [] for role, text in entry.items() if role != "timestamp"
+    ]
+
+
+def _export_row(chat_id: str, data: Dict[str, Any], transcripts: bool) -> Dict[str, Any]:
+    row = {"id": chat_id, **{f: _iso(data.get(f)) for f in CHAT_METADATA_FIELDS}}
+    if transcripts:
+        messages = _messages(data.get("chat"))
+        row["questions"] = sum(m["role"] == "user" for m in messages)
+        row["unanswered"] = sum(m["role"] == "assistant" and is_unanswered(m["text"]) for m in messages)
+        row["messages"] = messages
+    return row
+
+
+def iter_export_rows(since: Optional[datetime] = None, transcripts: bool = True,
+                     page_size: int = SCAN_PAGE_SIZE) -> Iterator[Dict[str, Any]]:
+    fields = CHAT_METADATA_FIELDS + (["chat"] if transcripts else [])
+    for chat_id, data in iter_chat_docs(fields=fields, since=since, page_size=page_size):
+        yield _export_row(chat_id, data, transcripts)
+
+
+def export_jsonl(since: Optional[datetime] = None, transcripts: bool = True,
+                 page_size: int = SCAN_PAGE_SIZE) -> Iterator[str]:
+    """Yield one JSON line per chat, suitable for a streamed HTTP response."""
+    for row in iter_export_rows(since, transcripts, page_size):
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def export_parquet(sink, since: Optional[datetime] = None, transcripts: bool = True,
+                   page_size: int = SCAN_PAGE_SIZE) -> int:
+    """
+    Write chats to `sink` (path or binary file) as Parquet, one row group per
+    page. Needs pyarrow. Returns the number of rows written.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow (pip install pyarrow)")
+
+    columns = [pa.field("id", pa.string()), pa.field("userId", pa.string()), pa.field("userName", pa.string()),
+               pa.field("created_at", pa.string()), pa.field("updated_at", pa.string()),
+               pa.field("favorite", pa.bool_())]
+    if transcripts:
+        columns += [pa.field("questions", pa.int32()), pa.field("unanswered", pa.int32()),
+                    pa.field("messages", pa.list_(pa.struct([("role", pa.string()), ("text", pa.string())])))]
+    schema = pa.schema(columns)
+
+    rows, written = [], 0
+    with pq.ParquetWriter(sink, schema) as writer:
+        for row in iter_export_rows(since, transcripts, page_size):
+            rows.append(row)
+            if len(rows) == page_size:
+                writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+                written, rows = written + len(rows), []
+        if rows or not written:
+            writer.write_table(pa.Table.from_pylist(rows, schema=schema))
+            written += len(rows)
+    return written
+
+
+class AnalyticsRecorder:
+    """
+    Counts questions and unanswered replies per day and per query, and writes
+    the buffered counts as Firestore increments every FLUSH_SECONDS from a
+    daemon thread. A failed flush keeps its counts for the next one.
+    """
+
+    def __init__(self, flush_seconds: float = FLUSH_SECONDS):
+        self.flush_seconds = flush_seconds
+        self._days: Dict[str, Dict[str, int]] = {}
+        self._queries: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def record_turn(self, question: str, reply: str, when: Optional[datetime] = None) -> None:
+        unanswered = int(is_unanswered(reply))
+        query = normalize_query(question)[:MAX_QUERY_CHARS]
+        when = when or datetime.now(timezone.utc)
+        with self._lock:
+            day = self._days.setdefault(_day(when), {"questions": 0, "unanswered": 0})
+            day["questions"] += 1
+            day["unanswered"] += unanswered
+            entry = self._queries.setdefault(_query_key(query), {"query": query, "count": 0, "unanswered": 0})
+            entry["count"] += 1
+            entry["unanswered"] += unanswered
+            entry["last_asked"] = when
+        self._ensure_thread()
+
+    @property
+    def pending(self) -> int:
+        with self._lock:
+            return sum(d["questions"] for d in self._days.values())
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None and self.flush_seconds > 0:
+            with self._flush_lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True, name="analytics-flush")
+                    self._thread.start()
+                    atexit.register(self.flush)
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.flush_seconds)
+            self.flush()
+
+    def flush(self) -> int:
+        """Write buffered counts; returns the number of summary documents updated."""
+        from firebase_admin import firestore
+
+        with self._flush_lock:
+            with self._lock:
+                days, queries = self._days, self._queries
+                self._days, self._queries = {}, {}
+            if not days and not queries:
+                return 0
+            db = get_db()
+            writes = [
+                (db.collection(DAILY_COL).document(day), {
+                    "date": day,
+                    "questions": firestore.Increment(counts["questions"]),
+                    "unanswered": firestore.Increment(counts["unanswered"]),
+                    "updated_at": firestore.SERVER_TIMESTAMP,
+                })
+                for day, counts in days.items()
+            ] + [
+                (db.collection(QUERIES_COL).document(key), {
+                    "query": entry["query"],
+                    "count": firestore.Increment(entry["count"]),
+                    "unanswered": firestore.Increment(entry["unanswered"]),
+                    "last_asked": entry["last_asked"],
+                })
+                for key, entry in queries.items()
+            ]
+            try:
+                with metrics.timer("analytics_flush"):
+                    for start in range(0, len(writes), MAX_BATCH_WRITES):
+                        batch = db.batch()
+                        for ref, data in writes[start:start + MAX_BATCH_WRITES]:
+                            batch.set(ref, data, merge=True)
+                        batch.commit()
+            except Exception as e:
+                # Batches are atomic, but earlier ones may have landed; a rare
+                # double count beats losing the whole interval
+                logger.warning(f"Analytics flush failed, keeping counts for the next one: {e}")
+                self._merge_back(days, queries)
+                return 0
+            return len(writes)
+
+    def _merge_back(self, days: Dict[str, Dict[str, int]], queries: Dict[str, Dict[str, Any]]) -> None:
+        with self._lock:
+            for day, counts in days.items():
+                current = self._days.setdefault(day, {"questions": 0, "unanswered": 0})
+                for field, value in counts.items():
+                    current[field] += value
+            for key, entry in queries.items():
+                current = self._queries.setdefault(key, {"query": entry["query"], "count": 0, "unanswered": 0})
+                current["count"] += entry["count"]
+                current["unanswered"] += entry["unanswered"]
+                current["last_asked"] = max(current.get("last_asked", entry["last_asked"]), entry["last_asked"])
+
+
+recorder = AnalyticsRecorder()
+
+
+def record_turn(question: str, reply: str, when: Optional[datetime] = None) -> None:
+    """Count one answered user message in the summary documents."""
+    recorder.record_turn(question, reply, when)
+
+
+def top_queries(top: int = 20, flush: bool = True) -> List[Dict[str, Any]]:
+    """The `top` most asked normalized queries (all time), most asked first."""
+    from firebase_admin import firestore
+
+    if flush:
+        recorder.flush()
+    return [
+        {"query": data.get("query"), "count": data.get("count", 0), "unanswered": data.get("unanswered", 0),
+         "last_asked": _iso(data.get("last_asked"))}
+        for data in (doc.to_dict() for doc in get_db().collection(QUERIES_COL)
+                     .order_by("count", direction=firestore.Query.DESCENDING).limit(top).stream())
+    ]
+
+
+def summary(days: int = 30, top: int = 20) -> Dict[str, Any]:
+    """
+    Questions, unanswered replies and unanswered rate per day for the last
+    `days` days, their totals, and the `top` most asked queries (all time),
+    read from the summary documents only.
+    """
+    recorder.flush()
+    db = get_db()
+    first = (datetime.now(timezone.utc).date() - timedelta(days=days - 1)).isoformat()
+    per_day = []
+    for doc in db.collection(DAILY_COL).where("date", ">=", first).stream():
+        data = doc.to_dict()
+        per_day.append({"date": data["date"], "questions": data.get("questions", 0),
+                        "unanswered": data.get("unanswered", 0)})
+    per_day.sort(key=lambda d: d["date"])
+    for entry in per_day:
+        entry["unanswered_rate"] = entry["unanswered"] / entry["questions"] if entry["questions"] else 0.0
+
+    questions = sum(d["questions"] for d in per_day)
+    unanswered = sum(d["unanswered"] for d in per_day)
+    return {
+        "since": first,
+        "days": per_day,
+        "totals": {"questions": questions, "unanswered": unanswered,
+                   "unanswered_rate": unanswered / questions if questions else 0.0},
+        "top_queries": top_queries(top, flush=False),
+    }
+
+
+def _delete_all(collection: str, page_size: int = MAX_BATCH_WRITES) -> None:
+    db = get_db()
+    while True:
+        docs = list(db.collection(collection).select([]).limit(page_size).stream())
+        if not docs:
+            return
+        batch = db.batch()
+        for doc in docs:
+            batch.delete(doc.reference)
+        batch.commit()
+        if len(docs) < page_size:
+            return
+
+
+def rebuild_summaries(page_size: int = SCAN_PAGE_SIZE) -> Dict[str, int]:
+    """
+    Recompute the summary documents from `chat_logs`. Messages carry no
+    timestamps, so each question counts on its chat's creation day. Run it
+    while the app is idle: live increments made during the rebuild are lost.
+    """
+    recorder.flush()
+    rebuilt = AnalyticsRecorder(flush_seconds=0)
+    chats = 0
+    for _, data in iter_chat_docs(fields=["created_at", "chat"], page_size=page_size):
+        chats += 1
+        created = data.get("created_at") if isinstance(data.get("created_at"), datetime) else None
+        question = None
+        for message in _messages(data.get("chat")):
+            if message["role"] == "user":
+                question = message["text"]
+            elif message["role"] == "assistant" and question is not None:
+                rebuilt.record_turn(question, message["text"], when=created)
+                question = None
+    questions = rebuilt.pending
+    _delete_all(DAILY_COL)
+    _delete_all(QUERIES_COL)
+    written = rebuilt.flush()
+    logger.info(f"Rebuilt analytics from {chats} chats: {questions} questions, {written} summary documents")
+    return {"chats": chats, "questions": questions, "summary_documents": written}
+
+
+def main():
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Export and summarize chat logs.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Stream chats to JSONL or Parquet")
+    export.add_argument("--format", choices=["jsonl", "parquet"], default="jsonl")
+    export.add_argument("--since", help="Only chats created on or after this date (YYYY-MM-DD)")
+    export.add_argument("--no-transcripts", action="store_true", help="Metadata only")
+    export.add_argument("--out", help="Output file (JSONL defaults to stdout)")
+    report = sub.add_parser("summary", help="Print the materialized aggregates")
+    report.add_argument("--days", type=int, default=30)
+    report.add_argument("--top", type=int, default=20)
+    sub.add_parser("rebuild", help="Recompute the aggregates from chat_logs")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        # Naive datetimes are read as UTC by Firestore, matching how created_at is written
+        since = datetime.fromisoformat(args.since) if args.since else None
+        if args.format == "parquet":
+            if not args.out:
+                parser.error("--out is required for Parquet")
+            print(f"Wrote {export_parquet(args.out, since, not args.no_transcripts)} chats to {args.out}")
+            return
+        out = open(args.out, "w", encoding="utf-8") if args.out else sys.stdout
+        try:
+            out.writelines(export_jsonl(since, not args.no_transcripts))
+        finally:
+            if args.out:
+                out.close()
+    elif args.command == "summary":
+        print(json.dumps(summary(args.days, args.top), indent=2))
+    else:
+        print(json.dumps(rebuild_summaries(), indent=2))
+
+
+if __name__ == "__main__":
+    main()
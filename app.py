@@ -1,4 +1,8 @@
-from flask import Flask, request, jsonify, abort
+import time
+# Start of the "import" phase in the startup report
+IMPORT_STARTED = time.perf_counter()
+
+from flask import Flask, Request, Response, g, request, jsonify, abort, send_file, stream_with_context
 import uuid
 from flask_cors import CORS
 import logging
@@ -6,56 +10,117 @@ from typing import Dict, Any
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
-import time
-import random
 from functools import wraps
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import hashlib
+from tempfile import SpooledTemporaryFile
 import jwt
 
 # Import your RAG-chatbot module
 from chatbot import (
-    init_embedding_settings,
     init_pinecone_client,
     load_index,
     init_gemini_client,
+    init_generation_client,
     init_chat_session,
     answer_query,
     retrieve_relevant_context,  # Add this
     build_prompt,               # Add this
+    condense_query,
+    is_self_contained,
+    normalize_query,
+    query_embeddings,
+    ingestion_listeners,
     PINECONE_API_KEY,
     INDEX_NAME,
     GEMINI_API_KEY,
 )
-from firebase_admin import firestore
+import admission
+import analytics
+import components
+import metrics
+from faq import FAQCache
+from url_ingestion import ingest_urls, load_sitemap, summarize
+from cache import SingleFlight, TTLCache
 from utils import (
     get_all_chat_ids,
     create_chat_log,
     delete_chat_log,
+    list_chats_page,
+    InvalidCursor,
+    set_chat_favorite,
     create_user,
     authenticate_user,
-    add_message_to_log,
+    get_user,
+    get_user_role,
+    update_user,
+    add_turn_to_log,
     get_chat_history,
     init_document_settings,
     allowed_file,
     process_document,
+    open_upload_stream,
+    UploadTooLarge,
+    MAX_UPLOAD_BYTES,
+    UPLOAD_SPOOL_BYTES,
 )
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
+if os.getenv("LOG_TRACE_IDS", "false").lower() == "true":
+    metrics.install_trace_logging()
 
-# Initialize RAG components and embedding settings
-init_embedding_settings()
-pinecone_client = init_pinecone_client(PINECONE_API_KEY)
-index = load_index(pinecone_client, INDEX_NAME)
-gemini_client = init_gemini_client(GEMINI_API_KEY)
-db = firestore.client()
+# RAG components are built on first use (and warmed up concurrently, see the end
+# of this module), so importing the app stays fast enough to answer health checks
+pinecone_client = components.register("pinecone", lambda: init_pinecone_client(PINECONE_API_KEY))
+website_index = components.register("website_index", lambda: load_index(pinecone_client.get(), INDEX_NAME))
+# Uploaded documents are optional context; chat keeps working without them
+doc_index = components.register(
+    "doc_index", lambda: load_index(pinecone_client.get(), "su-rag-doc"), required=False
+)
+# All Gemini calls go through one shared wrapper (concurrency limit, breaker, deadlines)
+gemini_client = components.register(
+    "gemini", lambda: init_generation_client(init_gemini_client(GEMINI_API_KEY))
+)
 USERS_COL = "users"
+MAX_INGEST_URLS = int(os.getenv("MAX_INGEST_URLS", 1000))
+# Upper bounds for the caller-chosen fetch concurrency and rate of an ingestion job
+MAX_INGEST_CONCURRENCY = int(os.getenv("MAX_INGEST_CONCURRENCY", 16))
+MAX_INGEST_RATE = float(os.getenv("MAX_INGEST_RATE", 20))
+# Signup never takes a role from the caller; these emails sign up as admins
+ADMIN_EMAILS = {e.strip().lower() for e in os.getenv("ADMIN_EMAILS", "").split(",") if e.strip()}
 CHATS_COL = "chat_logs"
+GENERATION_FAILED_REPLY = "I'm sorry, I'm having trouble responding right now. Please try again shortly."
+# Share one in-flight answer between identical questions that don't depend on
+# chat history: first messages, or messages sent with {"coalesce": true}
+COALESCE_QUESTIONS = os.getenv("COALESCE_QUESTIONS", "true").lower() == "true"
+# What a shared answer depends on besides the question (see gather_context)
+ANSWER_SCOPE = ("su-rag-doc", 3, INDEX_NAME, "poc_rag")
+answer_flights = SingleFlight("answer")
+
+# Serve precomputed answers to frequent questions (see faq.py)
+FAQ_ANSWERS = os.getenv("FAQ_ANSWERS", "true").lower() == "true"
 
 # In-memory store for active chat sessions
 chats: Dict[str, Any] = {}
 
+class SpooledUploadRequest(Request):
+    """
+    Buffer multipart file parts in memory up to UPLOAD_SPOOL_BYTES (Werkzeug's
+    default is 500 KB), spilling larger ones to an anonymous temp file.
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode="rb+")
+
+
 app = Flask(__name__)
+app.request_class = SpooledUploadRequest
+# Whole-request cap, rejected with 413 before the body is read; files are also
+# checked individually against MAX_UPLOAD_BYTES
+app.config['MAX_CONTENT_LENGTH'] = int(os.getenv("MAX_UPLOAD_REQUEST_BYTES", 5 * MAX_UPLOAD_BYTES))
 CORS(app, origins=["http://localhost:3000"])
 
 load_dotenv(".env.local")
@@ -63,10 +128,28 @@ JWT_SECRET = os.getenv("JWT_SECRET")
 JWT_ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
 JWT_EXP = int(os.getenv("JWT_EXP_DELTA_SECONDS", 3600))
 
+# sha256(token) -> request.user dict; entries never outlive the token's own exp
+token_cache = TTLCache(maxsize=4096, ttl=int(os.getenv("TOKEN_CACHE_TTL", 300)), name="jwt")
+
 # Initialize document upload settings
 UPLOAD_FOLDER, ALLOWED_EXTENSIONS = init_document_settings()
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 
+@app.before_request
+def start_request_trace():
+    g.request_started = time.perf_counter()
+    metrics.new_trace_id(request.headers.get("X-Request-ID"))
+
+@app.after_request
+def finish_request_trace(response):
+    if request.endpoint and hasattr(g, "request_started"):
+        metrics.observe(
+            "http_request_seconds", time.perf_counter() - g.request_started,
+            endpoint=request.endpoint, status=response.status_code
+        )
+    response.headers["X-Request-ID"] = metrics.trace_id.get()
+    return response
+
 def generate_token(user: dict):
     payload = {
         "sub": user["email"],
@@ -83,20 +166,66 @@ def auth_required(f):
         if not auth or not auth.startswith("Bearer "):
             abort(401)
         token = auth.split(" ",1)[1]
-        try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
-            request.user = {
+        started = time.perf_counter()
+        token_key = hashlib.sha256(token.encode()).hexdigest()
+        user = token_cache.get(token_key)
+        cache_state = "hit" if user is not None else "miss"
+        if user is None:
+            try:
+                data = jwt.decode(token, JWT_SECRET, algorithms=[JWT_ALGORITHM])
+            except jwt.ExpiredSignatureError:
+                abort(401, "Token expired")
+            except Exception:
+                abort(401)
+            user = {
                 "email": data["sub"], 
                 "role": data["role"],
                 "name": data.get("name")  # Get name from token
             }
-        except jwt.ExpiredSignatureError:
-            abort(401, "Token expired")
-        except Exception:
-            abort(401)
+            remaining = data["exp"] - time.time() if "exp" in data else token_cache.ttl
+            if remaining > 0:
+                token_cache.set(token_key, user, ttl=min(token_cache.ttl, remaining))
+        request.user = dict(user)
+        metrics.observe(
+            "auth_overhead_seconds", time.perf_counter() - started,
+            endpoint=request.endpoint, cache=cache_state
+        )
         return f(*args, **kw)
     return decorated
 
+def require_admin(allow_listed: bool = False) -> None:
+    """
+    403 unless the stored user record (not only the token's claim) says admin.
+    With `allow_listed`, the email must also be in ADMIN_EMAILS, which keeps
+    accounts that gave themselves the role before signup stopped accepting it
+    away from the most sensitive endpoints.
+    """
+    email = request.user.get("email", "")
+    if request.user.get("role") != "admin" or get_user_role(email) != "admin":
+        abort(403)
+    if allow_listed and email.lower() not in ADMIN_EMAILS:
+        abort(403)
+
+def rate_limited(lane: str):
+    """
+    Spend one of the caller's tokens for `lane` (bucket size set by role), or
+    answer 429. Goes below `auth_required`, which identifies the caller.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kw):
+            admission.admit(lane, request.user)
+            return f(*args, **kw)
+        return decorated
+    return decorator
+
+@app.errorhandler(admission.Saturated)
+def too_many_requests(e):
+    response = jsonify({"error": str(e), "reason": e.reason, "retry_after": e.retry_after})
+    response.status_code = 429
+    response.headers["Retry-After"] = str(e.retry_after)
+    return response
+
 # Auth endpoints
 #
 @app.route("/auth/signup", methods=["POST"])
@@ -105,9 +234,9 @@ def signup():
     email = data.get("email")
     password = data.get("password")
     name = data.get("name")    
-    role = data.get("role", "user")
     if not email or not password:
         abort(400, "Email+password required")
+    role = "admin" if email.strip().lower() in ADMIN_EMAILS else "user"
     try:
         create_user(email, password, name, role)
     except ValueError as e:
@@ -137,7 +266,7 @@ def create_chat():
     chat_id = str(uuid.uuid4())
     
     # Initialize the chat session in memory
-    chats[chat_id] = init_chat_session(gemini_client)
+    chats[chat_id] = init_chat_session(gemini_client.get())
     
     # Get user info from token data
     user_email = request.user["email"]
@@ -164,57 +293,26 @@ def create_chat():
 @auth_required
 def list_chats():
     """
-    Return list of chat metadata for the current user only, sorted newest first.
+    Return chat metadata for the current user only, sorted newest first.
+    Paginated with ?limit=<n>&cursor=<next_cursor from the previous page>.
     """
     try:
         # Get current user email from the auth token
         current_user_email = request.user["email"]
-        
+        limit = min(max(request.args.get("limit", 50, type=int), 1), 200)
+        cursor = request.args.get("cursor")
+
         try:
-            # Try with ordering (this will work once the index is created)
-            docs = (
-                db.collection(CHATS_COL)
-                .where("userId", "==", current_user_email)
-                .order_by("created_at", direction=firestore.Query.DESCENDING)
-                .stream()
-            )
-            
-            out = []
-            for doc in docs:
-                d = doc.to_dict()
-                out.append({
-                    "id": doc.id,
-                    "created_at": d["created_at"].isoformat(),
-                    "userId": d.get("userId"),
-                    "userName": d.get("userName"),
-                    "favorite": d.get("favorite", False),
-                })
-                
-        except Exception as index_error:
-            logger.warning(f"Index error, falling back to client-side sorting: {index_error}")
-            # Fallback: get data without ordering and sort client-side
-            docs = (
-                db.collection(CHATS_COL)
-                .where("userId", "==", current_user_email)
-                .stream()
-            )
-            
-            out = []
-            for doc in docs:
-                d = doc.to_dict()
-                out.append({
-                    "id": doc.id,
-                    "created_at": d["created_at"].isoformat(),
-                    "userId": d.get("userId"),
-                    "userName": d.get("userName"),
-                    "favorite": d.get("favorite", False),
-                })
-            
-            # Sort manually
-            out.sort(key=lambda x: x["created_at"], reverse=True)
-        
+            page, next_cursor = list_chats_page(current_user_email, limit=limit, cursor=cursor)
+        except InvalidCursor as e:
+            return jsonify({"error": str(e)}), 400
+        out = [
+            {**item, "created_at": item["created_at"].isoformat() if item["created_at"] else None}
+            for item in page
+        ]
+
         logger.info(f"Retrieved {len(out)} chats for user {current_user_email}")
-        return jsonify({"chats": out})
+        return jsonify({"chats": out, "next_cursor": next_cursor})
         
     except Exception as e:
         logger.error(f"Error listing chats: {e}")
@@ -229,37 +327,19 @@ def favorite_chat(chat_id):
     fav = request.json.get("favorite")
     if fav is None:
         abort(400, "Missing 'favorite'")
-    db.collection(CHATS_COL).document(chat_id).update({
-        "favorite": bool(fav)
-    })
+    set_chat_favorite(chat_id, bool(fav), user_id=request.user["email"])
     return jsonify({"favorite": fav})
 
 
-@app.route("/chats/<chat_id>/message", methods=["POST"])
-@auth_required
-def send_message(chat_id: str):
-    """Send a user message to the specified chat and return the assistant's reply."""
-    logger.info(f"Received message for chat {chat_id}")
-    logger.info(f"Active chats: {list(chats.keys())}")
-    
-    if chat_id not in chats:
-        logger.error(f"Chat {chat_id} not found in active sessions")
-        abort(404, description="Chat not found.")
-    
-    payload = request.get_json()
-    if not payload or "message" not in payload:
-        abort(400, description="Missing 'message' in request body.")
-    
-    user_msg = payload["message"]
-    add_message_to_log(chat_id, "user", user_msg)
-    
-    # Initialize context array
+def gather_context(retrieval_query: str, query_kind: str) -> list:
+    """Retrieve up to 3 contexts, uploaded documents first, then website pages."""
     combined_context = []
     
     # First check document pipeline
     try:
-        doc_index = load_index(pinecone_client, "su-rag-doc")
-        doc_context = retrieve_relevant_context(doc_index, user_msg, top_k=3)
+        doc_context = retrieve_relevant_context(
+            doc_index.get(), retrieval_query, top_k=3, query_kind=query_kind
+        )
         combined_context.extend(doc_context)
         logger.info(f"Found {len(doc_context)} relevant documents in uploaded content")
     except Exception as e:
@@ -274,50 +354,126 @@ def send_message(chat_id: str):
             
             # Get additional context from the website data
             main_context = retrieve_relevant_context(
-                index, 
-                user_msg, 
+                website_index.get(), 
+                retrieval_query, 
                 namespace="poc_rag", 
-                top_k=additional_results_needed
+                top_k=additional_results_needed,
+                query_kind=query_kind
             )
             combined_context.extend(main_context)
         except Exception as e:
             logger.warning(f"Error retrieving context from main index: {e}")
+    return combined_context
+
+def generate_reply(chat_session, user: dict, user_msg: str, retrieval_query: str, query_kind: str,
+                   stateless: bool = False) -> str:
+    """
+    Retrieve context and answer `user_msg` once `user` gets a slot in the
+    fair chat queue; generation failures become an apology reply.
+    """
+    with admission.slot("chat", user):
+        # Build a custom prompt with the combined context
+        prompt = build_prompt(user_msg, gather_context(retrieval_query, query_kind))
+        
+        # Retries, deadlines and fail-fast during outages are handled by the generation client
+        try:
+            with metrics.timer("generate"):
+                response = chat_session.send_message(prompt, user_message=user_msg, stateless=stateless)
+            return response.text
+        except Exception as e:
+            logger.error(f"Gemini generation failed: {e}")
+            return GENERATION_FAILED_REPLY
+
+def answer_faq(question: str) -> tuple:
+    """Answer a FAQ with no conversation, for the warm cache; raises on failure."""
+    context = gather_context(question, "faq")
+    chat_session = init_chat_session(gemini_client.get())
+    response = chat_session.send_message(build_prompt(question, context), user_message=question, stateless=True)
+    if not response.text:
+        raise ValueError("empty reply")
+    return response.text, context
+
+
+faq_cache = FAQCache(answer_faq)
+# Re-ingested pages and documents stale the FAQ answers built from them
+ingestion_listeners.append(faq_cache.sources_ingested)
+
+@app.route("/chats/<chat_id>/message", methods=["POST"])
+@auth_required
+@rate_limited("chat")
+def send_message(chat_id: str):
+    """
+    Send a user message to the specified chat and return the assistant's reply.
+    With {"coalesce": true}, the question is answered without the earlier
+    conversation so it can share an in-flight answer with identical questions
+    (first messages of a chat are shared that way by default).
+    """
+    logger.info(f"Received message for chat {chat_id}")
     
-    # Use the chat session to answer with combined context
-    chat_session = chats[chat_id]
-    
-    # Build a custom prompt with the combined context
-    prompt = build_prompt(user_msg, combined_context)
+    if chat_id not in chats:
+        logger.error(f"Chat {chat_id} not found in active sessions")
+        abort(404, description="Chat not found.")
     
-    # Send to Gemini with retry logic
-    max_retries = 3
-    retry_delay = 1
+    payload = request.get_json()
+    if not payload or "message" not in payload:
+        abort(400, description="Missing 'message' in request body.")
     
-    for attempt in range(max_retries):
-        try:
-            response = chat_session.send_message(prompt)
-            reply = response.text
-            break
-        except Exception as e:
-            if attempt < max_retries - 1:
-                sleep_time = retry_delay * (2 ** attempt) + (random.random())
-                logger.warning(f"Gemini API error. Retrying in {sleep_time:.1f}s. ({attempt+1}/{max_retries})")
-                time.sleep(sleep_time)
-            else:
-                logger.error(f"Failed after {max_retries} attempts: {e}")
-                reply = "I'm sorry, I'm having trouble responding right now. Please try again shortly."
+    user_msg = payload["message"]
+    user = request.user
+    chat_session = chats[chat_id]
+    coalesce = COALESCE_QUESTIONS and (chat_session.is_empty or bool(payload.get("coalesce")))
+
+    # Follow-ups ("what about its deadlines?") are rewritten into a standalone
+    # query for retrieval; the chat session itself still sees the raw message.
+    # Coalesced answers ignore the conversation, so they skip the rewrite too.
+    retrieval_query = user_msg
+    if not coalesce and not is_self_contained(user_msg):
+        retrieval_query = condense_query(
+            user_msg, get_chat_history(chat_id), chat_id=chat_id, client=gemini_client.get()
+        )
+    query_kind = "condensed" if retrieval_query != user_msg else "raw"
+
+    # Frequent questions are answered from the warm cache; like coalesced
+    # answers they don't depend on the conversation, so follow-ups are never
+    # looked up (a condensed query would match whatever its anchor terms match)
+    faq = None
+    if FAQ_ANSWERS and (chat_session.is_empty or is_self_contained(user_msg)):
+        faq = faq_cache.lookup(user_msg)
+    if faq is not None:
+        reply = faq["answer"]
+        chat_session.remember(user_msg, reply)
+        logger.info(f"Chat {chat_id} answered from FAQ {faq['question']!r} (score {faq['score']:.3f})")
+    elif coalesce:
+        # Identical questions in flight share one retrieval + generation; the
+        # key covers everything the answer depends on (question and scope)
+        key = (normalize_query(user_msg), ANSWER_SCOPE)
+        # A leader refused a chat slot fails alone; its followers queue for their own
+        reply, shared = answer_flights.do(
+            key, lambda: generate_reply(chat_session, user, user_msg, retrieval_query, query_kind, stateless=True),
+            retry_on=(admission.Saturated,),
+        )
+        chat_session.remember(user_msg, reply)
+        if shared:
+            logger.info(f"Chat {chat_id} shared an in-flight answer")
+    else:
+        reply = generate_reply(chat_session, user, user_msg, retrieval_query, query_kind)
     
-    add_message_to_log(chat_id, "assistant", reply)
+    # Logged only once there is a reply: a request refused admission (429)
+    # must not leave an unanswered user turn that `seed` would replay
+    add_turn_to_log(chat_id, user_msg, reply)
+    analytics.record_turn(user_msg, reply)
     return jsonify({"response": reply})
 
 @app.route("/chats/<chat_id>/history", methods=["GET"])
 @auth_required
 def get_history(chat_id: str):
     """Return nicely formatted history from Firestore."""
-    if chat_id not in chats:
-        chats[chat_id] = init_chat_session(gemini_client)
-      
     raw = get_chat_history(chat_id)
+    if chat_id not in chats:
+        # Restore the bounded conversation memory after a restart
+        chats[chat_id] = init_chat_session(gemini_client.get())
+        chats[chat_id].seed(raw)
+
     history = []
     for entry in raw:
         for role, text in entry.items():
@@ -332,7 +488,7 @@ def delete_chat(chat_id: str):
     """Remove both the in-memory session and the Firestore log."""
     if chat_id in chats:
         chats.pop(chat_id)
-    delete_chat_log(chat_id)
+    delete_chat_log(chat_id, user_id=request.user["email"])
     logger.info("Deleted chat %s", chat_id)
     return jsonify({"message": "deleted"})
 
@@ -340,10 +496,9 @@ def delete_chat(chat_id: str):
 @auth_required
 def get_profile():
     """Get user profile from Firestore"""
-    doc = db.collection(USERS_COL).document(request.user["email"]).get()
-    if not doc.exists:
+    data = get_user(request.user["email"])
+    if data is None:
         abort(404)
-    data = doc.to_dict()
     return jsonify({
         "email": data["email"],
         "name": data.get("name", ""),
@@ -366,59 +521,275 @@ def update_profile():
         "department": data.get("department")
     }
     
-    db.collection(USERS_COL).document(request.user["email"]).update(allowed_updates)
+    update_user(request.user["email"], allowed_updates)
     
     return get_profile()
 
+@app.route("/healthz", methods=["GET"])
+def healthz():
+    """Liveness: the process is up and serving, whatever its components are doing."""
+    return jsonify({"status": "ok"})
+
+@app.route("/readyz", methods=["GET"])
+def readyz():
+    """Readiness: 200 once every required component is built, else 503, with timings."""
+    report = components.startup_report()
+    return jsonify(report), 200 if report["ready"] else 503
+
+@app.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    """Per-stage latency histograms, token counts and cache hit rates for Prometheus."""
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+@app.route("/admin/stats", methods=["GET"])
+@auth_required
+def admin_stats():
+    """Return in-process metrics, including retrieval hit rate per query kind."""
+    require_admin()
+    hit_rates = {
+        kind: metrics.ratio("retrieval_hits_total", "retrieval_queries_total", query_kind=kind)
+        for kind in ("raw", "condensed")
+    }
+    coalescing = {
+        "leaders": answer_flights.leaders,
+        "followers": answer_flights.followers,
+        "in_flight": answer_flights.in_flight,
+        "collapse_rate": answer_flights.collapse_rate,
+    }
+    embedding_cache = {
+        "entries": len(query_embeddings),
+        "capacity": query_embeddings.capacity,
+        "bytes": query_embeddings.nbytes,
+        "hit_rate": query_embeddings.hit_rate,
+    }
+    return jsonify({
+        "retrieval_hit_rate": hit_rates,
+        "query_embedding_cache": embedding_cache,
+        "question_coalescing": coalescing,
+        "admission_queues": {lane: queue.status() for lane, queue in admission.queues.items()},
+        "faq_cache": faq_cache.status(),
+        **metrics.snapshot()
+    })
+
+@app.route("/admin/analytics", methods=["GET"])
+@auth_required
+def analytics_summary():
+    """
+    Questions, unanswered rate and top queries from the materialized summary
+    documents. Query params: days (default 30), top (default 20).
+    """
+    require_admin()
+    days = min(max(request.args.get("days", 30, type=int), 1), 366)
+    top = min(max(request.args.get("top", 20, type=int), 1), 100)
+    return jsonify(analytics.summary(days=days, top=top))
+
+@app.route("/admin/analytics/rebuild", methods=["POST"])
+@auth_required
+def analytics_rebuild():
+    """Recompute the summary documents from chat_logs."""
+    require_admin()
+    return jsonify(analytics.rebuild_summaries())
+
+@app.route("/admin/faq", methods=["GET", "POST", "DELETE"])
+@auth_required
+def admin_faq():
+    """
+    GET lists the cached FAQ answers. POST {"questions": [...]} pins curated
+    questions, answered in the background; DELETE {"question": ...} drops one.
+    """
+    require_admin()
+    if request.method == "GET":
+        return jsonify({**faq_cache.status(), "faqs": faq_cache.entries()})
+    data = request.get_json(silent=True) or {}
+    if request.method == "DELETE":
+        if not data.get("question"):
+            abort(400, description="Missing 'question'.")
+        return jsonify({"removed": faq_cache.remove(data["question"])})
+    questions = data.get("questions")
+    if not isinstance(questions, list) or not questions:
+        abort(400, description="Provide a non-empty 'questions' list.")
+    return jsonify({"added": len(faq_cache.add_curated([str(q) for q in questions]))}), 202
+
+@app.route("/admin/faq/refresh", methods=["POST"])
+@auth_required
+def admin_faq_refresh():
+    """Re-mine frequent questions and recompute new or stale answers in the background."""
+    require_admin()
+    faq_cache.request_rebuild()
+    return jsonify({"message": "FAQ refresh started"}), 202
+
+@app.route("/admin/export", methods=["GET"])
+@auth_required
+def export_chats():
+    """
+    Download chat logs. Query params: format (jsonl or parquet), since
+    (YYYY-MM-DD, by creation date), transcripts (default true). Every user's
+    transcripts are included, so only allow-listed admins may export.
+    """
+    require_admin(allow_listed=True)
+    fmt = request.args.get("format", "jsonl")
+    transcripts = request.args.get("transcripts", "true").lower() != "false"
+    since = None
+    if request.args.get("since"):
+        try:
+            since = datetime.fromisoformat(request.args["since"])
+        except ValueError:
+            abort(400, "'since' must be YYYY-MM-DD")
+    stamp = datetime.utcnow().strftime("%Y%m%d")
+
+    if fmt == "jsonl":
+        return Response(
+            stream_with_context(analytics.export_jsonl(since, transcripts)),
+            mimetype="application/x-ndjson",
+            headers={"Content-Disposition": f"attachment; filename=chat_logs-{stamp}.jsonl"},
+        )
+    if fmt != "parquet":
+        abort(400, "'format' must be jsonl or parquet")
+    # Row groups are written as pages arrive; the file spills to disk past the spool size
+    sink = SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES, mode="w+b")
+    try:
+        rows = analytics.export_parquet(sink, since, transcripts)
+    except RuntimeError as e:
+        sink.close()
+        return jsonify({"error": str(e)}), 501
+    sink.seek(0)
+    logger.info(f"Exported {rows} chats as Parquet for {request.user['email']}")
+    return send_file(sink, mimetype="application/vnd.apache.parquet", as_attachment=True,
+                     download_name=f"chat_logs-{stamp}.parquet")
+
+# job id -> state of a background URL ingestion job
+ingest_jobs = TTLCache(maxsize=256, ttl=int(os.getenv("INGEST_JOB_TTL", 24 * 3600)), name="ingest_jobs")
+ingest_job_pool = ThreadPoolExecutor(max_workers=admission.queues["ingest_jobs"].concurrency,
+                                     thread_name_prefix="ingest-job")
+
+
+def _run_ingest_job(job: dict, user: dict, urls: list, sitemap: dict, concurrency: int, rate: float) -> None:
+    job_id = job["id"]
+    try:
+        # Jobs have their own lane, so a long one never holds an upload's slot
+        with admission.slot("ingest_jobs", user):
+            job["status"] = "running"
+            if sitemap.get("url"):
+                urls = urls + load_sitemap(sitemap["url"], include=sitemap.get("include"),
+                                           limit=sitemap.get("limit"), public_only=True)
+            urls = urls[:MAX_INGEST_URLS]
+            report = ingest_urls(website_index.get(), urls, namespace="poc_rag",
+                                 concurrency=concurrency, rate=rate, public_only=True)
+        job.update(status="done", summary=summarize(report), results=list(report.values()))
+        logger.info(f"Ingest job {job_id} for {user['email']}: {job['summary']}")
+    except Exception as e:
+        logger.error(f"Ingest job {job_id} failed: {e}")
+        job.update(status="failed", error=str(e))
+    finally:
+        job["finished_at"] = datetime.utcnow().isoformat()
+
+
+@app.route("/admin/ingest-urls", methods=["POST"])
+@auth_required
+@rate_limited("ingestion")
+def ingest_urls_endpoint():
+    """
+    Start a background job that bulk-adds web pages to the website index.
+    Expects JSON {urls: [...]} and/or {sitemap: <url>, include: <regex>,
+    limit: <n>}, plus optional concurrency and rate (clamped). Only public
+    http(s) URLs are fetched. Answers 202 with the job id; poll
+    /admin/ingest-urls/<job_id> for the report.
+    """
+    require_admin()
+    data = request.get_json() or {}
+    urls = [str(u) for u in data.get("urls") or []]
+    if not urls and not data.get("sitemap"):
+        abort(400, "Provide 'urls' or 'sitemap'")
+    if len(urls) > MAX_INGEST_URLS:
+        abort(400, f"At most {MAX_INGEST_URLS} URLs per request")
+    bad = [u for u in urls + ([str(data["sitemap"])] if data.get("sitemap") else [])
+           if urlparse(u).scheme not in ("http", "https") or not urlparse(u).hostname]
+    if bad:
+        return jsonify({"error": "Only http(s) URLs can be ingested", "urls": bad[:20]}), 400
+    try:
+        concurrency = min(max(int(data.get("concurrency", 8)), 1), MAX_INGEST_CONCURRENCY)
+        rate = min(max(float(data.get("rate", 5)), 0.1), MAX_INGEST_RATE)
+        limit = int(data["limit"]) if data.get("limit") is not None else None
+    except (TypeError, ValueError):
+        abort(400, "'concurrency', 'rate' and 'limit' must be numbers")
+
+    job_id = str(uuid.uuid4())
+    job = {"id": job_id, "status": "queued", "user": request.user["email"], "urls": len(urls),
+           "created_at": datetime.utcnow().isoformat()}
+    ingest_jobs.set(job_id, job)
+    sitemap = {"url": data.get("sitemap"), "include": data.get("include"), "limit": limit}
+    ingest_job_pool.submit(_run_ingest_job, job, dict(request.user), urls, sitemap, concurrency, rate)
+    return jsonify({"job_id": job_id, "status": "queued",
+                    "status_url": f"/admin/ingest-urls/{job_id}"}), 202
+
+@app.route("/admin/ingest-urls/<job_id>", methods=["GET"])
+@auth_required
+def ingest_job_status(job_id: str):
+    """Status of a URL ingestion job, with its report once done."""
+    require_admin()
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        abort(404, description="Unknown or expired job.")
+    return jsonify(job)
+
 @app.route('/api/upload-documents', methods=['POST'])
 @auth_required
+@rate_limited("ingestion")
 def upload_documents():
     """Handle document upload request"""
     if 'documents' not in request.files:
         return jsonify({'error': 'No documents part'}), 400
     
-    files = request.files.getlist('documents')
+    files = [f for f in request.files.getlist('documents') if f and allowed_file(f.filename, ALLOWED_EXTENSIONS)]
     processed_files = []
+    upload_stats = []
     
+    # Reject oversized files before anything is embedded
     try:
-        # Load document index
-        doc_index = load_index(pinecone_client, "su-rag-doc")
-        
-        # Get user details from Firestore
-        user_doc = db.collection(USERS_COL).document(request.user["email"]).get()
-        if not user_doc.exists:
-            return jsonify({'error': 'User not found'}), 404
-        
-        # Convert DocumentSnapshot to dict first
-        user_data = user_doc.to_dict()
+        for file in files:
+            open_upload_stream(file)
+    except UploadTooLarge as e:
+        return jsonify({'error': str(e)}), 413
+    
+    # Embedding is CPU-bound; queue uploads fairly instead of running them all at once
+    with admission.slot("ingestion", request.user):
+        try:
+            # Get user details from Firestore
+            user_data = get_user(request.user["email"])
+            if user_data is None:
+                return jsonify({'error': 'User not found'}), 404
         
-        # Prepare user metadata
-        user_metadata = {
-            'email': request.user["email"],
-            'name': request.user.get("name", ""),
-            'role': request.user.get("role", ""),
-            'department': user_data.get('department') if user_data else "",
-        }
+            # Prepare user metadata
+            user_metadata = {
+                'email': request.user["email"],
+                'name': request.user.get("name", ""),
+                'role': request.user.get("role", ""),
+                'department': user_data.get('department') if user_data else "",
+            }
         
-        for file in files:
-            if file and allowed_file(file.filename, ALLOWED_EXTENSIONS):
-                filename = process_document(
+            for file in files:
+                stats = process_document(
                     file, 
-                    app.config['UPLOAD_FOLDER'], 
-                    doc_index,  # Pass VectorStoreIndex - our function will extract pinecone_index
+                    doc_index.get(),  # Pass VectorStoreIndex - our function will extract pinecone_index
                     user_metadata
                 )
-                processed_files.append(filename)
+                processed_files.append(stats['filename'])
+                upload_stats.append(stats)
         
-        return jsonify({
-            'message': 'Documents processed successfully',
-            'processed_files': processed_files,
-            'uploader': user_metadata
-        }), 200
+            return jsonify({
+                'message': 'Documents processed successfully',
+                'processed_files': processed_files,
+                'upload_stats': upload_stats,
+                'uploader': user_metadata
+            }), 200
         
-    except Exception as e:
-        logger.error(f"Error processing documents: {str(e)}")
-        return jsonify({'error': str(e)}), 500
+        except Exception as e:
+            logger.error(f"Error processing documents: {str(e)}")
+            return jsonify({'error': str(e)}), 500
+
+components.record_phase("import", time.perf_counter() - IMPORT_STARTED)
+if components.WARMUP != "off":
+    components.warm_up(background=components.WARMUP != "eager")
 
 if __name__ == "__main__":
     app.run(host="0.0.0.0", port=5050, debug=True)
@@ -0,0 +1,270 @@
+"""
+Batch (offline) question answering for evaluating prompts and indexes.
+
+Questions are read in batches of `batch_size`: each batch is embedded with
+one model call, retrieved concurrently, and handed to a bounded pool for
+generation while the next batch is embedded and retrieved. Results are
+appended to a JSONL file in input order, one line per question with the
+answer, contexts and per-stage timings. Questions whose id already has a
+result in that file are skipped, so an interrupted run resumes where it
+stopped; rows it is about to redo (errors, dry runs) are dropped from the file
+first, so every id keeps a single row. With `dry_run`, generation is skipped and only retrieval is recorded.
+"""
+import hashlib
+import json
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List, Optional, Set, Tuple
+
+import metrics
+from chatbot import (
+    build_prompt,
+    embed_queries,
+    init_chat_session,
+    retrieve_relevant_context,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def question_id(question: str) -> str:
+    """Stable id for a question without one, so reruns can match it up."""
+    return hashlib.blake2b(" ".join(question.split()).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def read_questions(path: str) -> Iterator[Dict[str, Any]]:
+    """
+    Yield {"id", "question", ...} from a text file with one question per line
+    or a JSONL file whose objects have "question" and optionally "id"; other
+    JSONL fields (e.g. expected answers) are carried into the results.
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            if line.startswith("{"):
+                item = json.loads(line)
+                if not item.get("question"):
+                    continue
+            else:
+                item = {"question": line}
+            item["id"] = str(item.get("id") or question_id(item["question"]))
+            yield item
+
+
+def _read_results(out_path: str) -> Tuple[Dict[str, Dict[str, Any]], int]:
+    """The last row per id in `out_path`, and how many lines the file has."""
+    rows: Dict[str, Dict[str, Any]] = {}
+    lines = 0
+    if not os.path.exists(out_path):
+        return rows, lines
+    with open(out_path, encoding="utf-8") as f:
+        for line in f:
+            lines += 1
+            try:
+                row = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut off by an interrupted run
+                continue
+            rows.pop(row["id"], None)
+            rows[row["id"]] = row
+    return rows, lines
+
+
+def _needs_rerun(row: Dict[str, Any], dry_run: bool) -> bool:
+    return bool(row.get("error") or (row.get("dry_run") and not dry_run))
+
+
+def completed_ids(out_path: str, dry_run: bool = False) -> Set[str]:
+    """
+    Ids already answered in `out_path`. Errored lines are retried, and so
+    are dry-run lines unless this is a dry run too.
+    """
+    rows, _ = _read_results(out_path)
+    return {row_id for row_id, row in rows.items() if not _needs_rerun(row, dry_run)}
+
+
+def compact_results(out_path: str, rerun_ids: Set[str], dry_run: bool = False) -> Set[str]:
+    """
+    Rewrite `out_path` with one row per id, dropping the rows of `rerun_ids`
+    that are about to be redone; returns the ids that are already complete.
+    """
+    rows, lines = _read_results(out_path)
+    kept = [row for row_id, row in rows.items() if not (row_id in rerun_ids and _needs_rerun(row, dry_run))]
+    if len(kept) != lines:
+        tmp_path = f"{out_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for row in kept:
+                f.write(json.dumps(row, default=str) + "\n")
+        os.replace(tmp_path, out_path)
+        logger.info(f"Compacted {out_path}: {lines} lines to {len(kept)}")
+    return {row["id"] for row in kept if not _needs_rerun(row, dry_run)}
+
+
+def _batches(items: Iterator[Dict[str, Any]], size: int) -> Iterator[List[Dict[str, Any]]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _retrieve(index: Any, item: Dict[str, Any], embedding: List[float], namespace: str,
+              top_k: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    started = time.perf_counter()
+    try:
+        contexts = retrieve_relevant_context(index, item["question"], namespace=namespace, top_k=top_k,
+                                             query_kind="batch", embedding=embedding)
+    except Exception as e:
+        item["error"] = f"retrieval: {e}"
+        contexts = []
+    item["timings"]["retrieve"] = time.perf_counter() - started
+    return item, contexts
+
+
+def _generate(chat_session: Any, item: Dict[str, Any], contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    started = time.perf_counter()
+    try:
+        prompt = build_prompt(item["question"], contexts)
+        response = chat_session.send_message(prompt, user_message=item["question"], stateless=True)
+        item["answer"] = response.text
+    except Exception as e:
+        item["error"] = f"generation: {e}"
+    item["timings"]["generate"] = time.perf_counter() - started
+    return item
+
+
+def _finish(item: Dict[str, Any], contexts: List[Dict[str, Any]], started: float) -> Dict[str, Any]:
+    item["contexts"] = contexts
+    item["timings"]["total"] = time.perf_counter() - started
+    metrics.inc("batch_questions_total", outcome="error" if item.get("error") else "ok")
+    return item
+
+
+def _percentiles(values: List[float]) -> Dict[str, float]:
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    return {"count": len(ordered), "mean": sum(ordered) / len(ordered),
+            "p50": pick(0.50), "p95": pick(0.95), "max": ordered[-1]}
+
+
+def run_batch(
+    index: Any,
+    generation_client: Any,
+    questions_path: str,
+    out_path: str,
+    namespace: Optional[str] = "poc_rag",
+    top_k: int = 3,
+    batch_size: int = 64,
+    retrieval_workers: int = 8,
+    generation_concurrency: int = 4,
+    dry_run: bool = False
+) -> Dict[str, Any]:
+    """
+    Answer every question in `questions_path`, appending results to `out_path`.
+
+    Args:
+        index: Index to retrieve from (see `chatbot.load_index`)
+        generation_client: GenerationClient for answers; unused with dry_run
+        questions_path: Questions file (see `read_questions`)
+        out_path: Results JSONL; ids already there are skipped, and rows
+            that are redone are replaced rather than repeated
+        batch_size: Questions embedded per model call
+        retrieval_workers: Concurrent vector queries
+        generation_concurrency: Concurrent Gemini calls
+        dry_run: Stop after retrieval and record the contexts only
+
+    Returns a summary with counts, wall time and per-stage latency percentiles.
+    """
+    done = compact_results(out_path, {item["id"] for item in read_questions(questions_path)}, dry_run)
+    # Each question is answered on its own, so one stateless session serves them all
+    chat_session = None if dry_run else init_chat_session(generation_client)
+    counts = {"answered": 0, "errors": 0, "skipped": 0}
+    stage_seconds: Dict[str, List[float]] = {}
+    started = time.perf_counter()
+
+    def pending_items() -> Iterator[Dict[str, Any]]:
+        seen = set()
+        for item in read_questions(questions_path):
+            if item["id"] in done or item["id"] in seen:
+                counts["skipped"] += 1
+                continue
+            seen.add(item["id"])
+            yield item
+
+    # (item, contexts, started, generation future or None), in input order
+    in_flight: deque = deque()
+
+    def write(out, entry: Tuple[Dict[str, Any], List[Dict[str, Any]], float, Optional[Future]]) -> None:
+        item, contexts, item_started, future = entry
+        if future is not None:
+            item = future.result()
+        row = _finish(item, contexts, item_started)
+        out.write(json.dumps(row, default=str) + "\n")
+        out.flush()
+        counts["errors" if row.get("error") else "answered"] += 1
+        for stage, seconds in row["timings"].items():
+            stage_seconds.setdefault(stage, []).append(seconds)
+
+    with ThreadPoolExecutor(max_workers=retrieval_workers, thread_name_prefix="batch-retrieve") as retrieval_pool, \
+            ThreadPoolExecutor(max_workers=generation_concurrency, thread_name_prefix="batch-generate") as generation_pool, \
+            open(out_path, "a", encoding="utf-8") as out:
+        for batch in _batches(pending_items(), batch_size):
+            batch_started = time.perf_counter()
+            try:
+                embeddings = embed_queries([item["question"] for item in batch])
+            except Exception as e:
+                logger.error(f"Embedding a batch of {len(batch)} questions failed: {e}")
+                embeddings = [None] * len(batch)
+            # The batch call is shared, so each question is charged its share of it
+            embed_share = (time.perf_counter() - batch_started) / len(batch)
+            for item in batch:
+                item["timings"] = {"embed": embed_share}
+                if dry_run:
+                    item["dry_run"] = True
+
+            retrievals = [retrieval_pool.submit(_retrieve, index, item, embedding, namespace, top_k)
+                          if embedding is not None else None
+                          for item, embedding in zip(batch, embeddings)]
+            for item, retrieval in zip(batch, retrievals):
+                if retrieval is None:
+                    item["error"] = "embedding failed"
+                    in_flight.append((item, [], batch_started, None))
+                    continue
+                item, contexts = retrieval.result()
+                future = None
+                if not dry_run and not item.get("error"):
+                    future = generation_pool.submit(_generate, chat_session, item, contexts)
+                in_flight.append((item, contexts, batch_started, future))
+
+            # Keep at most a few batches' worth of answers pending, writing
+            # finished ones in order while later batches are retrieved
+            while len(in_flight) > batch_size + generation_concurrency * 2 or \
+                    (in_flight and (in_flight[0][3] is None or in_flight[0][3].done())):
+                write(out, in_flight.popleft())
+        while in_flight:
+            write(out, in_flight.popleft())
+
+    wall = time.perf_counter() - started
+    processed = counts["answered"] + counts["errors"]
+    summary = {
+        **counts,
+        "dry_run": dry_run,
+        "out": out_path,
+        "wall_seconds": wall,
+        "questions_per_second": processed / wall if wall else None,
+        "stages": {stage: _percentiles(values) for stage, values in stage_seconds.items()},
+    }
+    logger.info(f"Batch run: {processed} questions in {wall:.1f}s "
+                f"({counts['errors']} errors, {counts['skipped']} skipped)")
+    return summary
@@ -0,0 +1,89 @@
+"""
+On-disk cache of text embeddings for offline tools (evaluation sweeps, benchmarks).
+
+Keys are sha1(model name + text); vectors are stored in one float32 .npy file
+next to a JSON list of keys, so a grid sweep only embeds each distinct chunk once.
+With `compression` (float16, int8 or pq, see quantization.py) the vectors are
+written as codes to a .npz file instead and decoded on load.
+"""
+import hashlib
+import json
+import os
+from typing import Callable, Dict, List, Sequence
+
+import numpy as np
+
+from quantization import make_codec
+
+
+class EmbeddingCache:
+    def __init__(self, path: str, model_name: str, dimension: int = 384, compression: str = "float32"):
+        self.path = path
+        self.model_name = model_name
+        self.dimension = dimension
+        self.compression = "float32" if compression in (None, "none") else compression
+        self.rows: Dict[str, int] = {}
+        self.vectors = np.zeros((0, dimension), dtype=np.float32)
+        self._pending: List[np.ndarray] = []
+        self.hits = 0
+        self.misses = 0
+        if os.path.exists(self._keys_path) and os.path.exists(self._vectors_path):
+            with open(self._keys_path) as f:
+                self.rows = {key: i for i, key in enumerate(json.load(f))}
+            self.vectors = self._load_vectors()
+
+    @property
+    def _keys_path(self) -> str:
+        return self.path + ".keys.json"
+
+    @property
+    def _vectors_path(self) -> str:
+        if self.compression == "float32":
+            return self.path + ".npy"
+        return f"{self.path}.{self.compression}.npz"
+
+    def _load_vectors(self) -> np.ndarray:
+        if self.compression == "float32":
+            return np.load(self._vectors_path)
+        with np.load(self._vectors_path) as data:
+            codes = tuple(data[f"codes{i}"] for i in range(int(data["arrays"])))
+            state = {k: data[k] for k in data.files if not k.startswith("codes") and k != "arrays"}
+        return make_codec(self.compression, self.dimension, state=state).decode(codes)
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\0{text}".encode()).hexdigest()
+
+    def embed(self, texts: Sequence[str], embed_batch: Callable[[List[str]], List[List[float]]],
+              batch_size: int = 64) -> np.ndarray:
+        """Return an (n, dim) array for `texts`, embedding only the ones not cached yet."""
+        keys = [self.key(t) for t in texts]
+        missing = list(dict.fromkeys(k for k in keys if k not in self.rows))
+        self.hits += len(keys) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            text_by_key = dict(zip(keys, texts))
+            for start in range(0, len(missing), batch_size):
+                batch = missing[start:start + batch_size]
+                vectors = np.asarray(embed_batch([text_by_key[k] for k in batch]), dtype=np.float32)
+                base = len(self.rows)
+                for offset, key in enumerate(batch):
+                    self.rows[key] = base + offset
+                self._pending.append(vectors)
+            self.vectors = np.vstack([self.vectors, *self._pending])
+            self._pending = []
+        return self.vectors[[self.rows[k] for k in keys]]
+
+    def save(self) -> None:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        keys = sorted(self.rows, key=self.rows.get)
+        with open(self._keys_path, "w") as f:
+            json.dump(keys, f)
+        if self.compression == "float32":
+            np.save(self._vectors_path, self.vectors)
+            return
+        codec = make_codec(self.compression, self.dimension)
+        if not codec.trained:
+            codec.fit(self.vectors)
+        codes = codec.encode(self.vectors)
+        np.savez(self._vectors_path, arrays=len(codes), **{f"codes{i}": a for i, a in enumerate(codes)},
+                 **codec.state())
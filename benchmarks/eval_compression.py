@@ -0,0 +1,133 @@
+"""
+Recall-vs-memory tradeoff of the vector compression options in quantization.py.
+
+Loads the same vectors into a LocalIndex per codec (float32, float16, int8,
+pq), queries it with held-out vectors, and compares the top-k ids with exact
+float32 search. Reports bytes per vector (including the PQ codebook), the
+saving over float32 and over Python lists of floats (how the notebooks hold
+embeddings), recall@k and query latency.
+
+    python -m benchmarks.eval_compression --cache benchmarks/results/embedding_cache
+    python -m benchmarks.eval_compression --count 50000 --pq-subspaces 24,48,96
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.run_benchmark import percentiles  # noqa: E402
+from local_index import LocalIndex  # noqa: E402
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to real embeddings than uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=count)] + 0.6 * rng.standard_normal((count, dimension))
+    return (vectors / np.linalg.norm(vectors, axis=1, keepdims=True)).astype(np.float32)
+
+
+def python_list_bytes(vector: np.ndarray) -> int:
+    """Memory of `vector.tolist()`: the list plus one float object per element."""
+    values = vector.tolist()
+    return sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values)
+
+
+def evaluate_codec(name: str, vectors: np.ndarray, queries: np.ndarray, exact: List[List[str]],
+                   ks: List[int], **options) -> Dict[str, Any]:
+    index = LocalIndex("compression-eval", vectors.shape[1], compression=name, codec_options=options)
+    started = time.perf_counter()
+    # PQ namespaces train on the first PQ_TRAIN_SIZE vectors, as in the app
+    for start in range(0, len(vectors), 1000):
+        index.upsert(vectors=[(str(i), vectors[i], {}) for i in range(start, min(start + 1000, len(vectors)))])
+    encode_seconds = time.perf_counter() - started
+
+    latencies, recalls = [], {k: [] for k in ks}
+    for query, truth in zip(queries, exact):
+        started = time.perf_counter()
+        matches = index.query(vector=query, top_k=max(ks)).matches
+        latencies.append(time.perf_counter() - started)
+        found = [m.id for m in matches]
+        for k in ks:
+            recalls[k].append(len(set(found[:k]) & set(truth[:k])) / k)
+
+    stats = index.describe_index_stats()
+    total_bytes = stats.namespaces[""].vector_bytes
+    label = f"pq{options['subspaces']}" if "subspaces" in options else name
+    return {
+        "codec": label,
+        "bytes_per_vector": total_bytes / len(vectors),
+        "total_bytes": total_bytes,
+        "encode_seconds": encode_seconds,
+        "recall": {f"@{k}": float(np.mean(recalls[k])) for k in ks},
+        "query_latency": percentiles(latencies),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure recall vs memory for vector compression codecs.")
+    parser.add_argument("--vectors", help=".npy file of float32 vectors")
+    parser.add_argument("--cache", help="EmbeddingCache path prefix (uses its float32 .npy)")
+    parser.add_argument("--count", type=int, default=20000, help="Synthetic vectors when no input is given")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--clusters", type=int, default=200)
+    parser.add_argument("--queries", type=int, default=200, help="Held-out query vectors")
+    parser.add_argument("--top-k", default="1,10")
+    parser.add_argument("--codecs", default="float32,float16,int8,pq")
+    parser.add_argument("--pq-subspaces", default="48", help="Comma list; one PQ run per value")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "results", "eval_compression.json"))
+    args = parser.parse_args()
+
+    if args.vectors or args.cache:
+        vectors = np.load(args.vectors or args.cache + ".npy").astype(np.float32)
+    else:
+        vectors = synthetic_vectors(args.count, args.dimension, args.clusters)
+    rng = np.random.default_rng(1)
+    order = rng.permutation(len(vectors))
+    held_out = min(args.queries, len(vectors) // 10 or 1)
+    queries, vectors = vectors[order[:held_out]], vectors[order[held_out:]]
+    ks = sorted(int(k) for k in args.top_k.split(","))
+
+    # Ground truth from exact float32 cosine search
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    exact = [[str(i) for i in np.argsort(-(unit @ q))[:max(ks)]] for q in queries]
+
+    runs = []
+    for name in args.codecs.split(","):
+        if name == "pq":
+            for subspaces in args.pq_subspaces.split(","):
+                runs.append(evaluate_codec(name, vectors, queries, exact, ks, subspaces=int(subspaces)))
+        else:
+            runs.append(evaluate_codec(name, vectors, queries, exact, ks))
+
+    float32_bytes = vectors.shape[1] * 4
+    list_bytes = python_list_bytes(vectors[0])
+    print(f"{len(vectors)} vectors x {vectors.shape[1]} dims, {len(queries)} queries; "
+          f"Python list of floats: {list_bytes} bytes/vector")
+    print(f"{'codec':<10}{'B/vec':>9}{'vs f32':>8}{'vs list':>9}" +
+          "".join(f"{'R' + f'@{k}':>8}" for k in ks) + f"{'p50 ms':>9}{'encode s':>10}")
+    for run in runs:
+        run["ratio_vs_float32"] = float32_bytes / run["bytes_per_vector"]
+        run["ratio_vs_python_list"] = list_bytes / run["bytes_per_vector"]
+        print(f"{run['codec']:<10}{run['bytes_per_vector']:>9.1f}{run['ratio_vs_float32']:>7.1f}x"
+              f"{run['ratio_vs_python_list']:>8.1f}x" +
+              "".join(f"{run['recall'][f'@{k}']:>8.3f}" for k in ks) +
+              f"{run['query_latency']['p50'] * 1000:>9.2f}{run['encode_seconds']:>10.2f}")
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump({"vectors": len(vectors), "dimension": vectors.shape[1], "queries": len(queries),
+                   "python_list_bytes_per_vector": list_bytes, "runs": runs}, f, indent=2)
+    print(f"Results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,278 @@
+"""
+Retrieval quality + latency evaluation over a labelled Seattle University question set.
+
+Each labelled record names the sources a good answer must come from:
+
+    {"question": "How do I apply to a graduate program?",
+     "expected": ["https://www.seattleu.edu/admissions-aid/graduate-admissions/*"]}
+
+Entries ending in "*" match any source URL/document under that prefix; others
+must match exactly (trailing slashes ignored). Sources are page URLs from the
+crawl dump and PDF file names from --documents.
+
+For every grid point (chunker, chunk size, overlap, backend) the corpus is
+re-chunked, embedded through an on-disk embedding cache (so each distinct chunk
+is embedded once per model across the whole sweep), indexed, and queried once
+with the largest top-k; recall@k, hit@k and MRR are then computed for every k.
+
+    python -m benchmarks.eval_retrieval --corpus extracted_content_directory.json \
+        --documents uploads --chunk-sizes 0,256,512,1024 --overlaps 20,100 --top-k 1,3,5
+"""
+import argparse
+import itertools
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.embedding_cache import EmbeddingCache  # noqa: E402
+from benchmarks.run_benchmark import percentiles  # noqa: E402
+from chatbot import clean_text  # noqa: E402
+from local_index import LocalIndex  # noqa: E402
+
+DEFAULT_LABELS = os.path.join(os.path.dirname(__file__), "data", "su_questions.jsonl")
+DEFAULT_CACHE = os.path.join(os.path.dirname(__file__), "results", "embedding_cache")
+
+
+def load_labels(path: str) -> List[Dict[str, Any]]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_sources(corpus: str | None, documents: str | None) -> Dict[str, str]:
+    """Map source id (URL or file name) -> raw text."""
+    sources: Dict[str, str] = {}
+    if corpus:
+        with open(corpus) as f:
+            sources.update({url: text for url, text in json.load(f).items() if text})
+    if documents:
+        from pypdf import PdfReader
+        for name in sorted(os.listdir(documents)):
+            if name.lower().endswith(".pdf"):
+                reader = PdfReader(os.path.join(documents, name))
+                sources[name] = "\n\n".join(page.extract_text() or "" for page in reader.pages)
+    return sources
+
+
+def chunk_source(text: str, chunker: str, chunk_size: int, overlap: int) -> List[str]:
+    """Chunk one source the way the ingestion paths do; chunk_size 0 keeps it whole."""
+    if chunk_size == 0:
+        return [text]
+    if chunker == "paragraph":
+        from utils import chunk_paragraphs
+        return chunk_paragraphs(text, max_chunk_size=chunk_size)
+    from llama_index.core.node_parser import SentenceSplitter
+    return SentenceSplitter(chunk_size=chunk_size, chunk_overlap=min(overlap, chunk_size // 2)).split_text(text)
+
+
+def _normalize(source: str) -> str:
+    return source.split("://", 1)[-1].rstrip("/").lower()
+
+
+def source_matches(source: str, expected: str) -> bool:
+    if expected.endswith("*"):
+        return _normalize(source).startswith(_normalize(expected[:-1]))
+    return _normalize(source) == _normalize(expected)
+
+
+def score_ranking(ranked_sources: List[str], expected: List[str], ks: List[int]) -> Dict[str, float]:
+    """recall@k, hit@k and reciprocal rank over distinct retrieved sources."""
+    distinct = list(dict.fromkeys(ranked_sources))
+    found_at = {}
+    for rank, source in enumerate(distinct, start=1):
+        for exp in expected:
+            if exp not in found_at and source_matches(source, exp):
+                found_at[exp] = rank
+    scores = {"rr": 1.0 / min(found_at.values()) if found_at else 0.0}
+    for k in ks:
+        # k counts retrieved chunks, so map it onto the distinct-source ranks it covers
+        covered = len(dict.fromkeys(ranked_sources[:k]))
+        hits = sum(1 for rank in found_at.values() if rank <= covered)
+        scores[f"recall@{k}"] = hits / len(expected) if expected else 0.0
+        scores[f"hit@{k}"] = 1.0 if hits else 0.0
+    return scores
+
+
+class PineconeBackend:
+    """Scratch namespace in a real Pinecone index, deleted after the grid point."""
+
+    def __init__(self, index_name: str, namespace: str):
+        from pinecone import Pinecone
+        self.index = Pinecone(api_key=os.getenv("PINECONE_API_KEY")).Index(index_name)
+        self.namespace = namespace
+
+    def load(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        for start in range(0, len(ids), 100):
+            self.index.upsert(vectors=[
+                (ids[i], vectors[i].tolist(), metadata[i]) for i in range(start, min(start + 100, len(ids)))
+            ], namespace=self.namespace)
+        # Serverless indexes are eventually consistent; wait until everything is visible
+        for _ in range(60):
+            stats = self.index.describe_index_stats()
+            ns = stats.namespaces.get(self.namespace)
+            if ns and ns.vector_count >= len(ids):
+                break
+            time.sleep(1)
+
+    def query(self, vector: np.ndarray, top_k: int):
+        return self.index.query(vector=vector.tolist(), top_k=top_k, namespace=self.namespace,
+                                include_metadata=True).matches
+
+    def close(self) -> None:
+        self.index.delete(delete_all=True, namespace=self.namespace)
+
+
+class LocalBackend:
+    def __init__(self, compression: str = "float32"):
+        self.index = LocalIndex("eval", compression=compression)
+
+    def load(self, ids: List[str], vectors: np.ndarray, metadata: List[Dict[str, Any]]) -> None:
+        self.index.upsert(vectors=list(zip(ids, vectors, metadata)))
+
+    def query(self, vector: np.ndarray, top_k: int):
+        return self.index.query(vector=vector, top_k=top_k, include_metadata=True).matches
+
+    def close(self) -> None:
+        pass
+
+
+def make_backend(name: str, args: argparse.Namespace, point_id: str):
+    if name == "local":
+        return LocalBackend(args.compression)
+    if name == "pinecone":
+        return PineconeBackend(args.pinecone_index, f"eval-{point_id}")
+    raise ValueError(f"Unknown backend: {name}")
+
+
+def evaluate_point(
+    labels: List[Dict[str, Any]],
+    sources: Dict[str, str],
+    chunker: str,
+    chunk_size: int,
+    overlap: int,
+    backend_name: str,
+    ks: List[int],
+    cache: EmbeddingCache,
+    embed_batch,
+    args: argparse.Namespace
+) -> Dict[str, Any]:
+    chunks: List[Tuple[str, str]] = []
+    for source, text in sources.items():
+        for piece in chunk_source(text, chunker, chunk_size, overlap):
+            cleaned = clean_text(piece)
+            if cleaned:
+                chunks.append((source, cleaned))
+
+    embed_started = time.perf_counter()
+    vectors = cache.embed([c[1] for c in chunks], embed_batch)
+    embed_seconds = time.perf_counter() - embed_started
+
+    point_id = f"{chunker}-{chunk_size}-{overlap}"
+    backend = make_backend(backend_name, args, point_id)
+    try:
+        backend.load([f"{i}" for i in range(len(chunks))], vectors, [{"source": s} for s, _ in chunks])
+        query_vectors = cache.embed([clean_text(r["question"]) for r in labels], embed_batch)
+
+        per_query, latencies = [], []
+        for record, qvec in zip(labels, query_vectors):
+            started = time.perf_counter()
+            matches = backend.query(qvec, max(ks))
+            latencies.append(time.perf_counter() - started)
+            ranked = [m.metadata["source"] for m in matches]
+            per_query.append({"question": record["question"], "retrieved": ranked[:max(ks)],
+                              **score_ranking(ranked, record["expected"], ks)})
+    finally:
+        backend.close()
+
+    summary = {key: float(np.mean([q[key] for q in per_query]))
+               for key in per_query[0] if key.startswith(("recall@", "hit@"))}
+    summary["mrr"] = float(np.mean([q["rr"] for q in per_query]))
+    return {
+        "chunker": chunker,
+        "chunk_size": chunk_size,
+        "overlap": overlap,
+        "backend": backend_name,
+        "chunks": len(chunks),
+        "embed_seconds": embed_seconds,
+        "metrics": summary,
+        "query_latency": percentiles(latencies),
+        "queries": per_query,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Evaluate retrieval quality and latency over a settings grid.")
+    parser.add_argument("--labels", default=DEFAULT_LABELS, help="JSONL of {question, expected}")
+    parser.add_argument("--corpus", help="Crawl dump (url -> text JSON), e.g. extracted_content_directory.json")
+    parser.add_argument("--documents", help="Directory of PDFs to include as sources")
+    parser.add_argument("--chunkers", default="sentence", help="Comma list of: sentence, paragraph")
+    parser.add_argument("--chunk-sizes", default="0,512,1024",
+                        help="Tokens (sentence) or characters (paragraph); 0 = whole source")
+    parser.add_argument("--overlaps", default="20")
+    parser.add_argument("--top-k", default="1,3,5,10")
+    parser.add_argument("--backends", default="local", help="Comma list of: local, pinecone")
+    parser.add_argument("--pinecone-index", default=os.getenv("PINECONE_INDEX", "su-rag-pipeline"))
+    parser.add_argument("--model", default="all-MiniLM-L6-v2")
+    parser.add_argument("--fake-embedder", action="store_true", help="Hashing embedder instead of --model")
+    parser.add_argument("--cache", default=DEFAULT_CACHE, help="Embedding cache path prefix")
+    parser.add_argument("--cache-compression", default="float32", help="float32, float16, int8 or pq")
+    parser.add_argument("--compression", default="float32",
+                        help="Vector storage of the local backend: float32, float16, int8 or pq")
+    parser.add_argument("--out", default=os.path.join(os.path.dirname(__file__), "results", "eval_retrieval.json"))
+    args = parser.parse_args()
+
+    labels = load_labels(args.labels)
+    sources = load_sources(args.corpus, args.documents)
+    if not sources:
+        parser.error("No sources: pass --corpus and/or --documents")
+
+    if args.fake_embedder:
+        from benchmarks.standins import HashingEmbedding
+        embed_model, model_name = HashingEmbedding(), "hashing"
+    else:
+        from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+        embed_model, model_name = HuggingFaceEmbedding(model_name=args.model), args.model
+    cache = EmbeddingCache(args.cache, model_name, compression=args.cache_compression)
+
+    ks = sorted(int(k) for k in args.top_k.split(","))
+    grid = []
+    for chunker, size, overlap, backend in itertools.product(
+        args.chunkers.split(","), [int(s) for s in args.chunk_sizes.split(",")],
+        [int(o) for o in args.overlaps.split(",")], args.backends.split(",")
+    ):
+        if size == 0 or chunker == "paragraph":
+            overlap = 0  # overlap has no effect here; avoid duplicate grid points
+        if (chunker, size, overlap, backend) not in grid:
+            grid.append((chunker, size, overlap, backend))
+
+    results = []
+    print(f"{len(labels)} questions, {len(sources)} sources, {len(grid)} grid points")
+    header = f"{'chunker':<10}{'size':>6}{'ovl':>5} {'backend':<9}{'chunks':>8}{'MRR':>7}" + \
+        "".join(f"{'R@' + str(k):>7}" for k in ks) + f"{'p50 ms':>9}{'p95 ms':>9}"
+    print(header)
+    for chunker, size, overlap, backend in grid:
+        result = evaluate_point(labels, sources, chunker, size, overlap, backend, ks,
+                                cache, embed_model.get_text_embedding_batch, args)
+        results.append(result)
+        m, lat = result["metrics"], result["query_latency"]
+        print(f"{chunker:<10}{size:>6}{overlap:>5} {backend:<9}{result['chunks']:>8}{m['mrr']:>7.3f}" +
+              "".join(f"{m[f'recall@{k}']:>7.3f}" for k in ks) +
+              f"{lat['p50'] * 1000:>9.2f}{lat['p95'] * 1000:>9.2f}")
+        cache.save()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+    with open(args.out, "w") as f:
+        json.dump({"labels": args.labels, "model": model_name, "top_k": ks, "grid": results,
+                   "embedding_cache": {"hits": cache.hits, "misses": cache.misses}}, f, indent=2)
+    print(f"Embedding cache: {cache.hits} hits, {cache.misses} misses; results written to {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,300 @@
+"""
+Offline end-to-end benchmark of the Flask request path.
+
+Runs app.py in-process against local stand-ins (in-memory Firestore, the local
+vector index and the fake Gemini server), each with configurable injected
+latency, and replays a recorded query set through the real HTTP handlers at a
+given concurrency. Reports throughput, end-to-end and per-stage p50/p95/p99,
+and memory growth, and stores the result as JSON for regression comparison.
+
+    python -m benchmarks.run_benchmark --concurrency 8 --repeat 5 \
+        --gemini-latency 0.4 --vector-latency 0.03 --firestore-latency 0.01 \
+        --baseline benchmarks/results/baseline.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if REPO_ROOT not in sys.path:
+    sys.path.insert(0, REPO_ROOT)
+
+from benchmarks.standins import install_fake_embedder, install_firestore_standin  # noqa: E402
+from fake_gemini import start_fake_gemini  # noqa: E402
+
+DEFAULT_QUERIES = os.path.join(os.path.dirname(__file__), "queries.jsonl")
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {"count": 0}
+    ordered = sorted(values)
+
+    def pick(q: float) -> float:
+        return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+    return {
+        "count": len(ordered),
+        "mean": sum(ordered) / len(ordered),
+        "p50": pick(0.50),
+        "p95": pick(0.95),
+        "p99": pick(0.99),
+        "max": ordered[-1],
+    }
+
+
+def rss_bytes() -> int:
+    """Current resident set size (Linux), falling back to peak RSS elsewhere."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def load_sessions(path: str) -> List[List[str]]:
+    """Group the recorded queries into ordered per-session message lists."""
+    sessions: Dict[str, List[str]] = defaultdict(list)
+    with open(path) as f:
+        for line in f:
+            if line.strip():
+                record = json.loads(line)
+                sessions[record.get("session", record["message"])].append(record["message"])
+    return list(sessions.values())
+
+
+def seed_corpus(app_module: Any, corpus_path: str | None, sessions: List[List[str]], size: int) -> int:
+    """Fill the local website index, from a crawl dump if given, else synthetic pages."""
+    from chatbot import clean_text, get_embed_model
+
+    if corpus_path:
+        with open(corpus_path) as f:
+            pages = {url: text for url, text in json.load(f).items() if text}
+    else:
+        topics = [m for session in sessions for m in session]
+        pages = {
+            f"https://www.seattleu.edu/synthetic/{i}/": f"{topics[i % len(topics)]} "
+            f"Seattle University page {i} with details on programs, offices and deadlines."
+            for i in range(size)
+        }
+    records = []
+    for url, text in pages.items():
+        vector = get_embed_model().get_text_embedding(clean_text(text))
+        records.append({"id": url, "values": vector, "metadata": {"url": url, "text": text[:15000]}})
+    app_module.website_index.get().pinecone_index.upsert(vectors=records, namespace="poc_rag")
+    return len(records)
+
+
+def load_corpus(app_module: Any, args: argparse.Namespace, sessions: List[List[str]]) -> tuple:
+    """
+    Restore the website index from --snapshot when it exists; otherwise embed
+    the corpus (and save it to --snapshot for the next run).
+    """
+    from snapshot import MANIFEST, export_index, restore_snapshot
+
+    index = app_module.website_index.get().pinecone_index
+    if args.snapshot and os.path.exists(os.path.join(args.snapshot, MANIFEST)):
+        restored = restore_snapshot(args.snapshot, index, workers=1, batch_size=10000)
+        return restored["vectors"], "snapshot"
+    size = seed_corpus(app_module, args.corpus, sessions, args.synthetic_pages)
+    if args.snapshot:
+        export_index(index, args.snapshot)
+    return size, "embedded"
+
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    gemini_server, gemini_url = start_fake_gemini(latency=args.gemini_latency, jitter=args.gemini_latency / 4)
+    install_firestore_standin(latency=args.firestore_latency)
+    if args.fake_embedder:
+        install_fake_embedder(cost=args.embed_cost)
+    os.environ.update({
+        "VECTOR_BACKEND": "local",
+        "LOCAL_VECTOR_LATENCY": str(args.vector_latency),
+        "GEMINI_BASE_URL": gemini_url,
+        "GEMINI_API_KEY": os.getenv("GEMINI_API_KEY") or "benchmark",
+        "JWT_SECRET": os.getenv("JWT_SECRET") or "benchmark-secret",
+        # Measure serving, not warm-up: build every component before replaying
+        "WARMUP": "eager",
+        # Each worker replays as one user as fast as it can; per-user rate
+        # limits would turn the run into a 429 test (the fair queue still applies)
+        "RATE_LIMIT_CHAT_USER": os.getenv("RATE_LIMIT_CHAT_USER") or "1000000:1000000",
+    })
+
+    import_started = time.perf_counter()
+    import app as app_module
+    import components
+    import metrics
+    import_seconds = time.perf_counter() - import_started
+
+    sessions = load_sessions(args.queries)
+    corpus_started = time.perf_counter()
+    corpus_size, corpus_source = load_corpus(app_module, args, sessions)
+    corpus_seconds = time.perf_counter() - corpus_started
+    work = [session for _ in range(args.repeat) for session in sessions]
+
+    metrics.reset()
+    metrics.record_samples(True)
+    if args.tracemalloc:
+        tracemalloc.start()
+    rss_start = rss_bytes()
+
+    latencies: List[float] = []
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    local = threading.local()
+
+    def client_for_worker():
+        if not hasattr(local, "client"):
+            client = app_module.app.test_client()
+            email = f"bench-{threading.get_ident()}@seattleu.edu"
+            client.post("/auth/signup", json={"email": email, "password": "bench", "name": "Bench"})
+            token = client.post("/auth/login", json={"email": email, "password": "bench"}).get_json()["token"]
+            local.client, local.headers = client, {"Authorization": f"Bearer {token}"}
+        return local.client, local.headers
+
+    def replay(session: List[str]) -> None:
+        client, headers = client_for_worker()
+        chat_id = client.post("/chats", headers=headers).get_json()["chat_id"]
+        for message in session:
+            started = time.perf_counter()
+            resp = client.post(f"/chats/{chat_id}/message", headers=headers, json={"message": message})
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if resp.status_code != 200:
+                    errors[str(resp.status_code)] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        list(pool.map(replay, work))
+    wall = time.perf_counter() - started
+
+    rss_end = rss_bytes()
+    python_heap = None
+    if args.tracemalloc:
+        current, peak = tracemalloc.get_traced_memory()
+        python_heap = {"current_bytes": current, "peak_bytes": peak}
+        tracemalloc.stop()
+
+    stages = {
+        dict(labels).get("stage", ""): percentiles(values)
+        for labels, values in metrics.samples("stage_latency_seconds").items()
+    }
+    endpoints = {
+        dict(labels).get("endpoint", "") + ":" + dict(labels).get("status", ""): percentiles(values)
+        for labels, values in metrics.samples("http_request_seconds").items()
+    }
+    gemini_server.shutdown()
+
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "commit": commit,
+        "config": {k: v for k, v in vars(args).items() if k not in ("baseline", "out")},
+        "corpus_size": corpus_size,
+        "corpus": {"source": corpus_source, "seconds": corpus_seconds},
+        "import_seconds": import_seconds,
+        "startup": components.startup_report(),
+        "requests": len(latencies),
+        "errors": dict(errors),
+        "wall_seconds": wall,
+        "throughput_rps": len(latencies) / wall if wall else None,
+        "latency": percentiles(latencies),
+        "stages": stages,
+        "endpoints": endpoints,
+        "gemini_requests": gemini_server.requests,
+        "cache_hit_rates": metrics.cache_hit_rates(),
+        "memory": {
+            "rss_start_bytes": rss_start,
+            "rss_end_bytes": rss_end,
+            "rss_growth_bytes": rss_end - rss_start,
+            "python_heap": python_heap,
+        },
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[str]:
+    """Return human-readable regressions beyond `tolerance` (fraction) vs the baseline."""
+    regressions = []
+
+    def check(label: str, new: float | None, old: float | None, higher_is_worse: bool = True) -> None:
+        if not new or not old:
+            return
+        change = (new - old) / old
+        worse = change > tolerance if higher_is_worse else -change > tolerance
+        print(f"  {label:<40} {old:>10.4f} -> {new:>10.4f} ({change:+.1%}){'  REGRESSION' if worse else ''}")
+        if worse:
+            regressions.append(label)
+
+    print(f"Comparison against baseline {baseline.get('commit')} ({baseline.get('timestamp')}):")
+    check("throughput_rps", result["throughput_rps"], baseline.get("throughput_rps"), higher_is_worse=False)
+    for q in ("p50", "p95", "p99"):
+        check(f"latency.{q}", result["latency"].get(q), baseline.get("latency", {}).get(q))
+    for stage, stats in sorted(result["stages"].items()):
+        check(f"stage.{stage}.p95", stats.get("p95"), baseline.get("stages", {}).get(stage, {}).get("p95"))
+    check("memory.rss_growth_bytes", result["memory"]["rss_growth_bytes"],
+          baseline.get("memory", {}).get("rss_growth_bytes"))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmark of the RAG request path.")
+    parser.add_argument("--queries", default=DEFAULT_QUERIES, help="JSONL of {session, message} records")
+    parser.add_argument("--repeat", type=int, default=3, help="Times the whole query set is replayed")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--gemini-latency", type=float, default=0.3, help="Seconds per fake Gemini call")
+    parser.add_argument("--vector-latency", type=float, default=0.02, help="Seconds per local index call")
+    parser.add_argument("--firestore-latency", type=float, default=0.01, help="Seconds per Firestore operation")
+    parser.add_argument("--corpus", help="Crawl dump (url -> text JSON) to index instead of synthetic pages")
+    parser.add_argument("--synthetic-pages", type=int, default=500)
+    parser.add_argument("--snapshot", help="Website index snapshot directory: restored if present, "
+                                           "else written after embedding the corpus")
+    parser.add_argument("--fake-embedder", action="store_true", help="Use the hashing embedder instead of MiniLM")
+    parser.add_argument("--embed-cost", type=float, default=0.0, help="Seconds per text for --fake-embedder")
+    parser.add_argument("--tracemalloc", action="store_true", help="Also report Python heap growth (slower)")
+    parser.add_argument("--out", help="Result JSON path (default: benchmarks/results/<timestamp>.json)")
+    parser.add_argument("--baseline", help="Earlier result JSON to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed regression before failing")
+    args = parser.parse_args()
+
+    result = run(args)
+    out = args.out or os.path.join(RESULTS_DIR, datetime.now().strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(result, f, indent=2)
+
+    print(f"{result['requests']} requests in {result['wall_seconds']:.2f}s "
+          f"({result['throughput_rps']:.2f} req/s), errors={result['errors']}")
+    print(f"end-to-end p50={result['latency']['p50']:.3f}s p95={result['latency']['p95']:.3f}s "
+          f"p99={result['latency']['p99']:.3f}s")
+    for stage, stats in sorted(result["stages"].items()):
+        print(f"  {stage:<18} n={stats['count']:<5} p50={stats['p50'] * 1000:8.1f}ms "
+              f"p95={stats['p95'] * 1000:8.1f}ms p99={stats['p99'] * 1000:8.1f}ms")
+    print(f"RSS growth: {result['memory']['rss_growth_bytes'] / 1e6:.1f} MB; results written to {out}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(result, json.load(f), args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.tolerance:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
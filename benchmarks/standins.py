@@ -0,0 +1,392 @@
+"""
+Local stand-ins used by the offline benchmark and evaluation tools.
+
+- `install_firestore_standin` registers an in-memory `firebase_admin` (and the
+  `google.cloud.firestore_v1` sentinels utils.py imports) so the app can be
+  imported and driven without Firebase credentials or network access.
+- `HashingEmbedding` is a deterministic bag-of-words embedder with the same
+  methods as the HuggingFace / SentenceTransformer models, for runs that should
+  not spend time on model inference; `install_fake_embedder` swaps it in.
+
+Pinecone and Gemini have their own stand-ins: VECTOR_BACKEND=local
+(local_index.py) and fake_gemini.py.
+"""
+import copy
+import hashlib
+import re
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from types import ModuleType, SimpleNamespace
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from llama_index.core.base.embeddings.base import BaseEmbedding
+
+
+class _Sentinel:
+    def __init__(self, name: str):
+        self.name = name
+
+    def __repr__(self):
+        return self.name
+
+
+SERVER_TIMESTAMP = _Sentinel("SERVER_TIMESTAMP")
+DELETE_FIELD = _Sentinel("DELETE_FIELD")
+
+
+class ArrayUnion:
+    def __init__(self, values: List[Any]):
+        self.values = list(values)
+
+
+class ArrayRemove:
+    def __init__(self, values: List[Any]):
+        self.values = list(values)
+
+
+class Increment:
+    def __init__(self, value: float):
+        self.value = value
+
+
+class Query:
+    ASCENDING = "ASCENDING"
+    DESCENDING = "DESCENDING"
+
+
+def _resolve(current: Any, value: Any) -> Any:
+    if value is SERVER_TIMESTAMP:
+        return datetime.now(timezone.utc)
+    if isinstance(value, ArrayUnion):
+        out = list(current or [])
+        out.extend(v for v in value.values if v not in out)
+        return out
+    if isinstance(value, ArrayRemove):
+        return [v for v in (current or []) if v not in value.values]
+    if isinstance(value, Increment):
+        return (current or 0) + value.value
+    if isinstance(value, dict):
+        return {k: _resolve((current or {}).get(k) if isinstance(current, dict) else None, v)
+                for k, v in value.items()}
+    return copy.deepcopy(value)
+
+
+def _set_path(data: Dict[str, Any], path: str, value: Any) -> None:
+    parts = path.split(".")
+    for part in parts[:-1]:
+        data = data.setdefault(part, {})
+    if value is DELETE_FIELD:
+        data.pop(parts[-1], None)
+    else:
+        data[parts[-1]] = _resolve(data.get(parts[-1]), value)
+
+
+def _get_path(data: Dict[str, Any], path: str) -> Any:
+    for part in path.split("."):
+        if not isinstance(data, dict):
+            return None
+        data = data.get(part)
+    return data
+
+
+def _order_value(row: tuple, field: str) -> Any:
+    # "__name__" orders by document id, as FieldPath.document_id() does
+    return row[0] if field == "__name__" else _get_path(row[1], field)
+
+
+def _after_cursor(row: tuple, order: List[tuple], pivot: List[Any]) -> bool:
+    # Compares on every order field in turn, as Firestore cursors do
+    for (field, direction), value in zip(order, pivot):
+        current = _order_value(row, field)
+        if value is None or current == value:
+            continue
+        return current < value if direction == Query.DESCENDING else current > value
+    return False
+
+
+class DocumentSnapshot:
+    def __init__(self, reference: "DocumentReference", data: Optional[Dict[str, Any]]):
+        self.reference = reference
+        self.id = reference.id
+        self.exists = data is not None
+        self._data = data
+
+    def to_dict(self) -> Optional[Dict[str, Any]]:
+        return copy.deepcopy(self._data) if self._data is not None else None
+
+    def get(self, field: str) -> Any:
+        return _get_path(self._data or {}, field)
+
+
+class DocumentReference:
+    def __init__(self, store: "InMemoryFirestore", collection: str, doc_id: str):
+        self._store = store
+        self._collection = collection
+        self.id = doc_id
+
+    def get(self, *_, **__) -> DocumentSnapshot:
+        self._store._delay()
+        with self._store._lock:
+            data = self._store._docs(self._collection).get(self.id)
+            return DocumentSnapshot(self, copy.deepcopy(data))
+
+    def set(self, data: Dict[str, Any], merge: bool = False) -> None:
+        self._store._delay()
+        with self._store._lock:
+            docs = self._store._docs(self._collection)
+            current = docs.get(self.id, {}) if merge else {}
+            for key, value in data.items():
+                current[key] = _resolve(current.get(key), value)
+            docs[self.id] = current
+
+    def update(self, data: Dict[str, Any]) -> None:
+        self._store._delay()
+        with self._store._lock:
+            docs = self._store._docs(self._collection)
+            if self.id not in docs:
+                raise KeyError(f"No document to update: {self._collection}/{self.id}")
+            for path, value in data.items():
+                _set_path(docs[self.id], path, value)
+
+    def delete(self) -> None:
+        self._store._delay()
+        with self._store._lock:
+            self._store._docs(self._collection).pop(self.id, None)
+
+
+class CollectionQuery:
+    def __init__(self, store: "InMemoryFirestore", collection: str):
+        self._store = store
+        self._collection = collection
+        self._filters: List[tuple] = []
+        self._fields: Optional[List[str]] = None
+        self._order: List[tuple] = []
+        self._start_after: Any = None
+        self._limit: Optional[int] = None
+
+    def _copy(self) -> "CollectionQuery":
+        clone = copy.copy(self)
+        clone._filters = list(self._filters)
+        clone._order = list(self._order)
+        return clone
+
+    def where(self, field: str = None, op: str = None, value: Any = None, filter: Any = None) -> "CollectionQuery":
+        if filter is not None:
+            field, op, value = filter.field_path, filter.op_string, filter.value
+        clone = self._copy()
+        clone._filters.append((field, op, value))
+        return clone
+
+    def select(self, fields: List[str]) -> "CollectionQuery":
+        clone = self._copy()
+        clone._fields = list(fields)
+        return clone
+
+    def order_by(self, field: str, direction: str = Query.ASCENDING) -> "CollectionQuery":
+        clone = self._copy()
+        clone._order.append((field, direction))
+        return clone
+
+    def start_after(self, cursor: Any) -> "CollectionQuery":
+        clone = self._copy()
+        clone._start_after = cursor
+        return clone
+
+    def limit(self, count: int) -> "CollectionQuery":
+        clone = self._copy()
+        clone._limit = count
+        return clone
+
+    def document(self, doc_id: Optional[str] = None) -> DocumentReference:
+        return DocumentReference(self._store, self._collection, doc_id or hashlib.md5(
+            str(time.time_ns()).encode()).hexdigest()[:20])
+
+    def _match(self, data: Dict[str, Any]) -> bool:
+        for field, op, value in self._filters:
+            current = _get_path(data, field)
+            if op == "==" and current != value:
+                return False
+            if op == "in" and current not in value:
+                return False
+            if op in (">", ">=", "<", "<=") and (current is None or not {
+                ">": current > value, ">=": current >= value,
+                "<": current < value, "<=": current <= value}[op]):
+                return False
+        return True
+
+    def stream(self, *_, **__):
+        self._store._delay()
+        with self._store._lock:
+            rows = [(doc_id, copy.deepcopy(data)) for doc_id, data in self._store._docs(self._collection).items()
+                    if self._match(data)]
+        for field, direction in reversed(self._order):
+            rows.sort(key=lambda r: (_order_value(r, field) is None, _order_value(r, field)),
+                      reverse=direction == Query.DESCENDING)
+        if self._start_after is not None and self._order:
+            cursor = self._start_after
+            pivot = []
+            for field, _ in self._order:
+                if isinstance(cursor, DocumentSnapshot):
+                    value = cursor.id if field == "__name__" else cursor.get(field)
+                else:
+                    value = cursor.get(field) if isinstance(cursor, dict) else cursor
+                # A "__name__" cursor value may be a document reference
+                pivot.append(value.id if isinstance(value, DocumentReference) else value)
+            rows = [r for r in rows if _after_cursor(r, self._order, pivot)]
+        if self._limit is not None:
+            rows = rows[:self._limit]
+        for doc_id, data in rows:
+            if self._fields is not None:
+                data = {f: _get_path(data, f) for f in self._fields if f != "__name__"}
+            yield DocumentSnapshot(DocumentReference(self._store, self._collection, doc_id), data)
+
+    def get(self):
+        return list(self.stream())
+
+
+class Transaction:
+    def update(self, ref: DocumentReference, data: Dict[str, Any]) -> None:
+        ref.update(data)
+
+    def set(self, ref: DocumentReference, data: Dict[str, Any], merge: bool = False) -> None:
+        ref.set(data, merge=merge)
+
+    def get(self, ref: DocumentReference) -> DocumentSnapshot:
+        return ref.get()
+
+
+class WriteBatch(Transaction):
+    def delete(self, ref: DocumentReference) -> None:
+        ref.delete()
+
+    def commit(self) -> None:
+        pass
+
+
+class InMemoryFirestore:
+    """Firestore client look-alike covering the calls made by utils.py and app.py."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.data: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._lock = threading.RLock()
+
+    def _delay(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def _docs(self, collection: str) -> Dict[str, Dict[str, Any]]:
+        return self.data.setdefault(collection, {})
+
+    def collection(self, name: str) -> CollectionQuery:
+        return CollectionQuery(self, name)
+
+    def transaction(self) -> Transaction:
+        return Transaction()
+
+    def batch(self) -> WriteBatch:
+        return WriteBatch()
+
+
+def transactional(func):
+    def wrapper(transaction, *args, **kwargs):
+        return func(transaction, *args, **kwargs)
+    return wrapper
+
+
+def install_fake_embedder(cost: float = 0.0) -> "HashingEmbedding":
+    """
+    Make the SentenceTransformer and HuggingFaceEmbedding constructors return a
+    HashingEmbedding, so no model is downloaded or loaded. Must run before
+    utils/chatbot are imported.
+    """
+    import sentence_transformers
+    import llama_index.embeddings.huggingface as huggingface
+
+    embedder = HashingEmbedding(cost=cost)
+    sentence_transformers.SentenceTransformer = lambda *_, **__: embedder
+    huggingface.HuggingFaceEmbedding = lambda *_, **__: embedder
+    return embedder
+
+
+def install_firestore_standin(latency: float = 0.0) -> InMemoryFirestore:
+    """
+    Register in-memory replacements for `firebase_admin` and
+    `google.cloud.firestore_v1` in sys.modules. Must run before utils/app are
+    imported. Returns the shared client that `firestore.client()` will hand out.
+    """
+    store = InMemoryFirestore(latency=latency)
+
+    firestore_mod = ModuleType("firebase_admin.firestore")
+    firestore_mod.client = lambda *_, **__: store
+    firestore_mod.ArrayUnion = ArrayUnion
+    firestore_mod.ArrayRemove = ArrayRemove
+    firestore_mod.Increment = Increment
+    firestore_mod.Query = Query
+    firestore_mod.transactional = transactional
+    firestore_mod.SERVER_TIMESTAMP = SERVER_TIMESTAMP
+    firestore_mod.DELETE_FIELD = DELETE_FIELD
+
+    credentials_mod = ModuleType("firebase_admin.credentials")
+    credentials_mod.Certificate = lambda *_, **__: SimpleNamespace()
+
+    admin_mod = ModuleType("firebase_admin")
+    admin_mod.firestore = firestore_mod
+    admin_mod.credentials = credentials_mod
+    admin_mod.initialize_app = lambda *_, **__: SimpleNamespace(name="[DEFAULT]")
+    admin_mod.get_app = lambda *_, **__: SimpleNamespace(name="[DEFAULT]")
+
+    firestore_v1 = ModuleType("google.cloud.firestore_v1")
+    firestore_v1.SERVER_TIMESTAMP = SERVER_TIMESTAMP
+    firestore_v1.Increment = Increment
+    firestore_v1.ArrayUnion = ArrayUnion
+
+    sys.modules.update({
+        "firebase_admin": admin_mod,
+        "firebase_admin.firestore": firestore_mod,
+        "firebase_admin.credentials": credentials_mod,
+        "google.cloud.firestore_v1": firestore_v1,
+    })
+    return store
+
+
+class HashingEmbedding(BaseEmbedding):
+    """
+    Deterministic bag-of-words embedder (feature hashing + L2 norm). A llama_index
+    embedding, so it can be assigned to `Settings.embed_model`, that also offers
+    `encode` like SentenceTransformer. `cost` adds simulated seconds per text.
+    """
+
+    dimension: int = 384
+    cost: float = 0.0
+    model_name: str = "hashing"
+
+    def _vector(self, text: str) -> np.ndarray:
+        vec = np.zeros(self.dimension, dtype=np.float32)
+        for token in re.findall(r"\w+", text.lower()):
+            h = int.from_bytes(hashlib.blake2b(token.encode(), digest_size=8).digest(), "little")
+            vec[h % self.dimension] += 1.0 if (h >> 32) & 1 else -1.0
+        norm = np.linalg.norm(vec)
+        return vec / norm if norm else vec
+
+    def _get_text_embedding(self, text: str) -> List[float]:
+        if self.cost:
+            time.sleep(self.cost)
+        return self._vector(text).tolist()
+
+    def _get_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    async def _aget_query_embedding(self, query: str) -> List[float]:
+        return self._get_text_embedding(query)
+
+    def encode(self, texts, **_) -> np.ndarray:
+        single = isinstance(texts, str)
+        batch = [texts] if single else list(texts)
+        if self.cost:
+            time.sleep(self.cost * len(batch))
+        out = np.stack([self._vector(t) for t in batch]) if batch else np.zeros((0, self.dimension), np.float32)
+        return out[0] if single else out
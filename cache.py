@@ -0,0 +1,249 @@
+import copy
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Hashable, Optional
+
+import numpy as np
+
+import metrics
+
+_MISSING = object()
+
+
+class _CacheStats:
+    """Hit/miss counting shared by the caches; expects `hits`, `misses`, `name`."""
+
+    def _record(self, hit: bool) -> None:
+        if hit:
+            self.hits += 1
+        else:
+            self.misses += 1
+        if self.name:
+            metrics.inc("cache_requests_total", cache=self.name, result="hit" if hit else "miss")
+
+    @property
+    def hit_rate(self) -> float | None:
+        total = self.hits + self.misses
+        return self.hits / total if total else None
+
+
+class TTLCache(_CacheStats):
+    """
+    Thread-safe LRU cache with an optional per-entry time-to-live.
+
+    Args:
+        maxsize: Maximum number of entries kept; least recently used are evicted first
+        ttl: Default lifetime in seconds, or None for entries that never expire
+        name: If set, hits and misses are reported as `cache_requests_total{cache=name}`
+    """
+
+    def __init__(self, maxsize: int = 1024, ttl: Optional[float] = None, name: Optional[str] = None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.name = name
+        self._data: "OrderedDict[Hashable, tuple[float | None, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is not _MISSING:
+                expires_at, value = entry
+                if expires_at is None or expires_at > time.monotonic():
+                    self._data.move_to_end(key)
+                    self._record(True)
+                    return value
+                del self._data[key]
+            self._record(False)
+            return default
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        ttl = self.ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.pop(key, _MISSING)
+        return default if entry is _MISSING else entry[1]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            return entry is not _MISSING and (entry[0] is None or entry[0] > time.monotonic())
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+class EmbeddingLRU(_CacheStats):
+    """
+    Thread-safe LRU of embedding vectors bounded in bytes.
+
+    Vectors live in one preallocated (capacity, dim) NumPy array sized from
+    `max_bytes` on the first insert; evicting an entry frees its row for
+    reuse. `get` returns a copy, so callers can't corrupt the cache.
+
+    Args:
+        max_bytes: Memory budget for the stored vectors
+        dtype: Storage dtype of the array
+        name: If set, hits and misses are reported as `cache_requests_total{cache=name}`
+    """
+
+    def __init__(self, max_bytes: int = 16 * 1024 * 1024, dtype: Any = np.float32, name: Optional[str] = None):
+        self.max_bytes = max_bytes
+        self.dtype = np.dtype(dtype)
+        self.name = name
+        self.capacity = 0
+        self._rows: "OrderedDict[Hashable, int]" = OrderedDict()
+        self._free: list = []
+        self._vectors: Optional[np.ndarray] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable) -> Optional[np.ndarray]:
+        with self._lock:
+            row = self._rows.get(key)
+            if row is None:
+                self._record(False)
+                return None
+            self._rows.move_to_end(key)
+            self._record(True)
+            return self._vectors[row].copy()
+
+    def set(self, key: Hashable, vector: Any) -> None:
+        vector = np.asarray(vector, dtype=self.dtype)
+        with self._lock:
+            if self._vectors is None:
+                self.capacity = self.max_bytes // max(vector.nbytes, 1)
+                self._vectors = np.empty((self.capacity, vector.shape[0]), dtype=self.dtype)
+                self._free = list(range(self.capacity - 1, -1, -1))
+            if self.capacity == 0 or vector.shape != self._vectors.shape[1:]:
+                return
+            row = self._rows.get(key)
+            if row is None:
+                if not self._free:
+                    _, evicted = self._rows.popitem(last=False)
+                    self._free.append(evicted)
+                row = self._free.pop()
+                self._rows[key] = row
+            self._rows.move_to_end(key)
+            self._vectors[row] = vector
+
+    def clear(self) -> None:
+        with self._lock:
+            self._rows.clear()
+            self._free = list(range(self.capacity - 1, -1, -1))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes reserved for vectors (the whole array, once allocated)."""
+        return self._vectors.nbytes if self._vectors is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+
+class VersionCounter:
+    """
+    Thread-safe version numbers per key, for invalidating derived cache entries
+    by making the version part of their cache key. `bump(None)` moves every
+    key forward at once (for writers that can't name what they changed).
+    """
+
+    def __init__(self):
+        self._versions: dict = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> tuple:
+        with self._lock:
+            return self._epoch, self._versions.get(key, 0)
+
+    def bump(self, key: Optional[Hashable] = None) -> None:
+        with self._lock:
+            if key is None:
+                self._epoch += 1
+            else:
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+
+class SingleFlight:
+    """
+    Collapse concurrent calls with the same key into one execution.
+
+    The first caller (leader) runs the function; callers arriving while it is
+    in flight wait for the same result and receive their own deep copy.
+    Nothing is kept once the call finishes, and an exception reaches every
+    waiter, except those listed in `retry_on`: a follower given one of those
+    (e.g. the leader being refused admission) calls again, leading a new
+    flight if none is running. Calls are counted as
+    `singleflight_requests_total{flight, role}`.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._calls: dict = {}
+        self._lock = threading.Lock()
+        self.leaders = 0
+        self.followers = 0
+
+    def do(self, key: Hashable, fn, timeout: Optional[float] = None, retry_on: tuple = ()) -> tuple:
+        """Return (result, shared), where `shared` is True for followers."""
+        while True:
+            with self._lock:
+                future = self._calls.get(key)
+                leader = future is None
+                if leader:
+                    future = self._calls[key] = Future()
+                    self.leaders += 1
+                else:
+                    self.followers += 1
+            metrics.inc("singleflight_requests_total", flight=self.name, role="leader" if leader else "follower")
+            if leader:
+                break
+            try:
+                return copy.deepcopy(future.result(timeout=timeout)), True
+            except retry_on:
+                # The leader's failure was its own; try again on our behalf
+                continue
+
+        # Forgotten before waking followers, so a retrying one starts a new flight
+        try:
+            result = fn()
+        except BaseException as e:
+            self._forget(key)
+            future.set_exception(e)
+            raise
+        self._forget(key)
+        future.set_result(result)
+        # The stored result stays pristine while followers copy it
+        return copy.deepcopy(result), False
+
+    def _forget(self, key: Hashable) -> None:
+        with self._lock:
+            self._calls.pop(key, None)
+
+    @property
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
+
+    @property
+    def collapse_rate(self) -> float | None:
+        """Share of calls that were served by another caller's execution."""
+        total = self.leaders + self.followers
+        return self.followers / total if total else None
@@ -1,17 +1,29 @@
+from __future__ import annotations
+
 import os
+import hashlib
+import itertools
+import json
 import logging
 import time
-from typing import List, Optional, Dict, Any
+from typing import TYPE_CHECKING, Callable, Hashable, List, Optional, Dict, Any
 import re
+import numpy as np
 from dotenv import load_dotenv
 from pinecone import Pinecone, ServerlessSpec
-from llama_index.embeddings.huggingface import HuggingFaceEmbedding
-from llama_index.core import VectorStoreIndex, Settings
-from llama_index.vector_stores.pinecone import PineconeVectorStore
-from google import genai
-from boilerpy3 import extractors
-extractor = extractors.DefaultExtractor()
-from google.genai import types
+
+import components
+import metrics
+from cache import EmbeddingLRU, TTLCache, VersionCounter
+from memory import BoundedChatSession, MEMORY_MAX_TURNS
+from generation import GenerationClient
+from local_index import LocalPineconeClient, LocalVectorStoreIndex
+
+# llama_index, the HuggingFace model and google-genai take seconds to import, so
+# they are imported where first used; see components.py for warm-up
+if TYPE_CHECKING:
+    from google import genai
+    from llama_index.core import VectorStoreIndex
 
 # Load environment variables
 load_dotenv(dotenv_path=".env.local")
@@ -25,6 +37,20 @@ PINECONE_API_KEY = os.getenv("PINECONE_API_KEY")
 PINECONE_ENVIRONMENT = os.getenv("PINECONE_ENV")
 INDEX_NAME = os.getenv("PINECONE_INDEX", "su-rag-pipeline")
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
+# Optional override, e.g. the local fake server from fake_gemini.py
+GEMINI_BASE_URL = os.getenv("GEMINI_BASE_URL")
+# "pinecone" or "local" (in-process NumPy index, see local_index.py)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "pinecone")
+
+# Query condensation: "heuristic" (local, no network) or "gemini" (one short call)
+QUERY_CONDENSER = os.getenv("QUERY_CONDENSER", "heuristic")
+# A retrieval counts as a "hit" when its best match scores at least this much
+RETRIEVAL_HIT_SCORE = float(os.getenv("RETRIEVAL_HIT_SCORE", "0.5"))
+# Memory budget of the process-wide query embedding cache (~10k MiniLM vectors)
+QUERY_EMBEDDING_CACHE_BYTES = int(os.getenv("QUERY_EMBEDDING_CACHE_BYTES", 16 * 1024 * 1024))
+# Lifetime of cached retrieval results; writes through this process invalidate
+# them immediately, writes from other processes within this window
+RETRIEVAL_CACHE_TTL = float(os.getenv("RETRIEVAL_CACHE_TTL", 120))
 
 # System instruction for Gemini chat
 SYSTEM_INSTRUCTION = """
@@ -61,6 +87,9 @@ def init_embedding_settings(
     """
     Configure global llama_index Settings for embeddings and chunking.
     """
+    from llama_index.core import Settings
+    from llama_index.embeddings.huggingface import HuggingFaceEmbedding
+
     Settings.embed_model = HuggingFaceEmbedding(model_name=model_name)
     Settings.chunk_size = chunk_size
     Settings.chunk_overlap = chunk_overlap
@@ -68,10 +97,35 @@ def init_embedding_settings(
                 model_name, chunk_size, chunk_overlap)
 
 
-def init_pinecone_client(api_key: str) -> Pinecone:
+def _init_embed_model():
+    from llama_index.core import Settings
+
+    init_embedding_settings()
+    return Settings.embed_model
+
+
+def _init_extractor():
+    from boilerpy3 import extractors
+    return extractors.DefaultExtractor()
+
+
+embed_model = components.register("embed_model", _init_embed_model)
+# Only URL ingestion needs it
+extractor = components.register("extractor", _init_extractor, required=False)
+
+
+def get_embed_model():
+    """Return the shared embedding model, configuring Settings on first use."""
+    return embed_model.get()
+
+
+def init_pinecone_client(api_key: str, backend: str = VECTOR_BACKEND) -> Pinecone:
     """
-    Initialize and return a Pinecone client.
+    Initialize and return a Pinecone client, or the local stand-in when
+    `backend` is "local".
     """
+    if backend == "local":
+        return LocalPineconeClient(latency=float(os.getenv("LOCAL_VECTOR_LATENCY", 0)))
     client = Pinecone(api_key=api_key)
     logger.info("Found Pinecone indexes: %s", client.list_indexes())
     return client
@@ -112,6 +166,7 @@ def create_or_get_index(client: Pinecone, index_name: str, dimension: int = 384)
     return index_name
 
 
+@metrics.timed("load_index")
 def load_index(client: Pinecone, index_name: str) -> VectorStoreIndex:
     """
     Wrap an existing Pinecone index in a LlamaIndex VectorStoreIndex.
@@ -120,30 +175,58 @@ def load_index(client: Pinecone, index_name: str) -> VectorStoreIndex:
     index_name = create_or_get_index(client, index_name)
     
     pinecone_index = client.Index(index_name)
+    if isinstance(client, LocalPineconeClient):
+        return LocalVectorStoreIndex(pinecone_index)
+    from llama_index.core import VectorStoreIndex
+    from llama_index.vector_stores.pinecone import PineconeVectorStore
+
     vs = PineconeVectorStore(pinecone_index=pinecone_index)
     index = VectorStoreIndex.from_vector_store(vector_store=vs)
     setattr(index, 'pinecone_index', pinecone_index)
+    setattr(index, 'index_name', index_name)
     logger.info("Loaded index '%s'", index_name)
     return index
 
 
-def init_gemini_client(api_key: str) -> genai.Client:
+def init_gemini_client(
+    api_key: str,
+    base_url: Optional[str] = GEMINI_BASE_URL,
+    timeout_seconds: float = 30
+) -> genai.Client:
     """
     Initialize and return a Gemini client.
     """
-    return genai.Client(api_key=api_key)
+    from google import genai
+    from google.genai import types
+
+    http_options = types.HttpOptions(base_url=base_url, timeout=int(timeout_seconds * 1000))
+    return genai.Client(api_key=api_key, http_options=http_options)
+
+
+def init_generation_client(client: genai.Client, **options) -> GenerationClient:
+    """
+    Wrap a Gemini client with concurrency limits, a circuit breaker, deadlines
+    and hedging. Options override the GENERATION_* environment defaults.
+    """
+    return GenerationClient(client, **options)
 
 
 def init_chat_session(
-    client: genai.Client,
+    client: GenerationClient,
     model: str = "gemini-2.0-flash",
-    system_instruction: str = SYSTEM_INSTRUCTION
-) -> Any:
+    system_instruction: str = SYSTEM_INSTRUCTION,
+    max_turns: int = MEMORY_MAX_TURNS
+) -> BoundedChatSession:
     """
     Create a new Gemini chat session with a system instruction.
+
+    The session keeps the last `max_turns` turns verbatim and folds older
+    ones into a rolling summary, so per-turn input tokens stay bounded.
     """
+    from google.genai import types
+
     config = types.GenerateContentConfig(system_instruction=system_instruction)
-    return client.chats.create(model=model, config=config)
+    return BoundedChatSession(client, model, config, max_turns=max_turns)
 
 def clean_text(text):
 
@@ -153,59 +236,312 @@ def clean_text(text):
     return cleaned_text
 
 
+# Words that usually point back at something said earlier in the conversation.
+# Demonstratives ("that", "those") and "there" are left out: they mostly show
+# up in standalone questions ("Is there a deadline for ...?").
+FOLLOW_UP_PATTERN = re.compile(
+    r"\b(it|its|it's|itself|they|them|their|theirs|"
+    r"he|him|his|she|her|hers|the same|above|former|latter|else)\b",
+    re.IGNORECASE,
+)
+FOLLOW_UP_PREFIXES = (
+    "what about", "how about", "and ", "also", "what else", "tell me more",
+    "more about", "more on", "why", "how so", "same for", "ok ", "okay ",
+)
+STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "do", "does", "did", "can",
+    "could", "would", "should", "will", "i", "me", "my", "you", "your", "we", "our",
+    "what", "when", "where", "which", "who", "how", "why", "of", "in", "on", "at",
+    "to", "for", "with", "about", "and", "or", "any", "there", "please", "tell",
+}
+
+CONDENSE_PROMPT = """Rewrite the final user message as a single standalone search query about
+Seattle University, resolving pronouns and references using the conversation.
+Return only the query.
+
+Conversation:
+{history}
+
+Final user message: {message}
+
+Standalone query:"""
+
+# (chat_id, turn) -> (raw message, condensed query)
+condensed_queries = TTLCache(maxsize=4096, ttl=3600, name="condensed_query")
+
+
+def is_self_contained(message: str) -> bool:
+    """
+    Cheap check for whether a message can be retrieved on as-is, i.e. it has no
+    follow-up phrasing or back-references. Short keyword queries ("MBA
+    tuition") are standalone unless they match one of those.
+    """
+    text = message.strip().lower()
+    if text.startswith(FOLLOW_UP_PREFIXES):
+        return False
+    return not FOLLOW_UP_PATTERN.search(text)
+
+
+def _recent_turns(history: List[Dict[str, Any]], max_turns: int) -> List[tuple]:
+    """Flatten Firestore chat entries into the last `max_turns` (role, text) pairs."""
+    turns = []
+    for entry in history:
+        for role, text in entry.items():
+            if role in ("user", "assistant") and text:
+                turns.append((role, text))
+    return turns[-max_turns:]
+
+
+def _salient_terms(text: str, limit: int = 12) -> List[str]:
+    terms = []
+    for word in clean_text(text).split():
+        if word not in STOPWORDS and len(word) > 2 and word not in terms:
+            terms.append(word)
+    return terms[:limit]
+
+
+def _condense_heuristic(message: str, turns: List[tuple]) -> str:
+    """Anchor the follow-up on the key terms of the previous user question."""
+    previous = [text for role, text in turns if role == "user"]
+    if not previous:
+        return message
+    terms = [t for t in _salient_terms(previous[-1]) if t not in clean_text(message).split()]
+    return f"{' '.join(terms)} {message}".strip()
+
+
+def _condense_with_gemini(client: GenerationClient, message: str, turns: List[tuple]) -> str:
+    from google.genai import types
+
+    history = "\n".join(f"{role}: {text[:500]}" for role, text in turns)
+    resp = client.models.generate_content(
+        model="gemini-2.0-flash",
+        contents=CONDENSE_PROMPT.format(history=history, message=message),
+        config=types.GenerateContentConfig(max_output_tokens=64, temperature=0),
+        deadline=5,
+    )
+    return (resp.text or "").strip() or message
+
+
+@metrics.timed("condense_query")
+def condense_query(
+    message: str,
+    history: List[Dict[str, Any]],
+    chat_id: Optional[str] = None,
+    client: Optional[GenerationClient] = None,
+    max_turns: int = 4
+) -> str:
+    """
+    Turn a follow-up message into a standalone retrieval query using the recent
+    chat history (same entry format as `utils.get_chat_history`).
+
+    Self-contained messages are returned unchanged. Results are cached per
+    (chat_id, turn) so retries and multi-index lookups don't redo the work.
+    """
+    if is_self_contained(message) or not history:
+        metrics.inc("query_condense_total", outcome="skipped")
+        return message
+
+    turn = sum(1 for entry in history if "user" in entry)
+    key = (chat_id, turn) if chat_id else None
+    if key is not None:
+        cached = condensed_queries.get(key)
+        if cached is not None and cached[0] == message:
+            metrics.inc("query_condense_total", outcome="cached")
+            return cached[1]
+
+    turns = _recent_turns(history, max_turns)
+    strategy = "gemini" if QUERY_CONDENSER == "gemini" and client is not None else "heuristic"
+    try:
+        if strategy == "gemini":
+            condensed = _condense_with_gemini(client, message, turns)
+        else:
+            condensed = _condense_heuristic(message, turns)
+    except Exception as e:
+        logger.warning(f"Query condensation failed, using heuristic: {e}")
+        strategy = "heuristic"
+        condensed = _condense_heuristic(message, turns)
+
+    metrics.inc("query_condense_total", outcome=strategy)
+    if key is not None:
+        condensed_queries.set(key, (message, condensed))
+    logger.info("Condensed query %r -> %r", message, condensed)
+    return condensed
+
+
+# normalized query text -> embedding, shared by every retrieval in the process
+query_embeddings = EmbeddingLRU(max_bytes=QUERY_EMBEDDING_CACHE_BYTES, name="query_embedding")
+
+
+# (embedding fingerprint, index, namespace, top_k, filter, version) -> (matches metadata, best score)
+retrieval_results = TTLCache(maxsize=4096, ttl=RETRIEVAL_CACHE_TTL, name="retrieval")
+# (index name, namespace) -> version, bumped on every write to that namespace
+index_versions = VersionCounter()
+
+
+def bump_index_version(index_name: Optional[str], namespace: Optional[str] = None) -> None:
+    """
+    Invalidate cached retrievals for an index namespace after writing to it.
+    An unknown index name invalidates every cached retrieval.
+    """
+    index_versions.bump((index_name, namespace or "") if index_name else None)
+
+
+# Called with the source ids (page URLs, uploaded doc_ids) written by each
+# ingestion, after their vectors are upserted; see faq.py
+ingestion_listeners: List[Callable[[List[str]], None]] = []
+
+
+def notify_sources_ingested(sources: List[str]) -> None:
+    """Tell `ingestion_listeners` that these sources were (re-)ingested."""
+    if not sources:
+        return
+    for listener in list(ingestion_listeners):
+        try:
+            listener(list(sources))
+        except Exception as e:
+            logger.warning(f"Ingestion listener failed: {e}")
+
+
+# Tags for indexes without a name, see `_index_identity`
+_unnamed_index_tags = itertools.count(1)
+
+
+def _index_identity(index: Any) -> Hashable:
+    """
+    Cache identity of an index: its name, or for indexes built without one
+    (tests, ad-hoc scripts) a number tagged onto the vector store object, so
+    two unnamed indexes never share cached results. `id()` alone isn't enough
+    as a freed store's id is handed to the next one.
+    """
+    name = getattr(index, 'index_name', None)
+    if name:
+        return name
+    backend = getattr(index, 'pinecone_index', index)
+    tag = getattr(backend, '_retrieval_cache_tag', None)
+    if tag is None:
+        tag = next(_unnamed_index_tags)
+        try:
+            setattr(backend, '_retrieval_cache_tag', tag)
+        except AttributeError:
+            return ("object", id(backend))
+    return ("unnamed", tag)
+
+
+def _retrieval_key(embedding: List[float], index_name: Hashable, namespace: Optional[str],
+                   top_k: int, filter: Optional[Dict[str, Any]]) -> tuple:
+    fingerprint = hashlib.blake2b(np.asarray(embedding, dtype=np.float32).tobytes(), digest_size=16).hexdigest()
+    filter_key = json.dumps(filter, sort_keys=True, default=str) if filter else ""
+    return (fingerprint, index_name, namespace or "", top_k, filter_key,
+            index_versions.get((index_name, namespace or "")))
+
+
+def normalize_query(query: str) -> str:
+    """
+    Case- and whitespace-fold a query. all-MiniLM-L6-v2 lowercases and splits
+    on whitespace itself, so the normalized text embeds identically.
+    """
+    return " ".join(query.lower().split())
+
+
+def embed_query(query: str) -> List[float]:
+    """Embed a retrieval query, through the process-wide embedding LRU."""
+    key = normalize_query(query)
+    vector = query_embeddings.get(key)
+    if vector is None:
+        vector = get_embed_model().get_text_embedding(key)
+        query_embeddings.set(key, vector)
+        return list(vector)
+    return vector.tolist()
+
+
+def embed_queries(queries: List[str]) -> List[List[float]]:
+    """
+    Embed many retrieval queries at once: LRU hits are reused and the misses
+    go to the model in a single batch call.
+    """
+    keys = [normalize_query(q) for q in queries]
+    vectors: Dict[str, List[float]] = {}
+    for key in keys:
+        cached = query_embeddings.get(key)
+        if cached is not None:
+            vectors[key] = cached.tolist()
+    missing = [key for key in dict.fromkeys(keys) if key not in vectors]
+    if missing:
+        for key, vector in zip(missing, get_embed_model().get_text_embedding_batch(missing)):
+            query_embeddings.set(key, vector)
+            vectors[key] = list(vector)
+    return [vectors[key] for key in keys]
+
+
 def add_urls_to_vecotor_store(
     index: VectorStoreIndex,
     url: str,
 ):
     """
     Add URLs to the vector store index.
+
+    Single-URL wrapper around `url_ingestion.ingest_urls`, which fetches,
+    chunks and embeds many pages concurrently.
     """
-    # Assuming `urls` is a list of URLs
+    from url_ingestion import ingest_urls
+
     try:
-        content = extractor.get_content_from_url(url)
-        pc = Pinecone(api_key=PINECONE_API_KEY)
-        index_name = 'su-rag-pipeline'
-        dimension = 384 
-        vectors = {
-            'id': url,
-            'values': Settings.embed_model.get_text_embedding(clean_text(content)),
-            'metadata': {
-                'url': url,
-                'text': content
-            }
-        }
-        # embedded_text = Settings.embed_model.get_text_embedding(upload_dict['text'])
-
-        index.upsert(
-            vectors=vectors,
-            namespace="poc_rag"
-    )
-        return True
+        result = ingest_urls(index, [url], namespace="poc_rag", concurrency=1, rate=0)[url]
     except Exception as e:
         logger.error(f"Error adding URL to vector store: {e}")
         return False
+    if result["status"] != "ok":
+        logger.error(f"Error adding URL to vector store: {result['status']} {result['error'] or ''}")
+        return False
+    return True
 
+@metrics.timed("retrieve")
 def retrieve_relevant_context(
     index: VectorStoreIndex,
     query: str,
     namespace: Optional[str] = None,
-    top_k: int = 3
+    top_k: int = 3,
+    query_kind: str = "raw",
+    filter: Optional[Dict[str, Any]] = None,
+    embedding: Optional[List[float]] = None
 ) -> List[Dict[str, Any]]:
     """
     Embed the user query and fetch top_k relevant docs from Pinecone.
-    """
-    embedding = Settings.embed_model.get_text_embedding(query)
-    pinecone_idx = getattr(index, 'pinecone_index')
-    res = pinecone_idx.query(
-        namespace=namespace,
-        vector=embedding,
-        top_k=top_k,
-        include_metadata=True,
-        include_values=False
-    )
-    return [m.metadata for m in res.matches]
-
 
+    Results are cached for RETRIEVAL_CACHE_TTL seconds per (embedding, index,
+    namespace, top_k, filter) until the namespace is written to. `query_kind`
+    ("raw" or "condensed") only labels the retrieval hit-rate metrics. Pass
+    `embedding` when the query was already embedded (see `embed_queries`).
+    """
+    if embedding is None:
+        with metrics.timer("embed_query"):
+            embedding = embed_query(query)
+    key = _retrieval_key(embedding, _index_identity(index), namespace, top_k, filter)
+    cached = retrieval_results.get(key)
+    if cached is not None:
+        contexts, best_score = cached
+    else:
+        pinecone_idx = getattr(index, 'pinecone_index')
+        with metrics.timer("vector_query"):
+            res = pinecone_idx.query(
+                namespace=namespace,
+                vector=embedding,
+                top_k=top_k,
+                filter=filter,
+                include_metadata=True,
+                include_values=False
+            )
+        contexts = [m.metadata for m in res.matches]
+        best_score = max((m.score or 0.0 for m in res.matches), default=0.0)
+        retrieval_results.set(key, (contexts, best_score))
+    metrics.inc("retrieval_queries_total", query_kind=query_kind)
+    if best_score >= RETRIEVAL_HIT_SCORE:
+        metrics.inc("retrieval_hits_total", query_kind=query_kind)
+    metrics.observe("retrieval_best_score", best_score, query_kind=query_kind)
+    return list(contexts)
+
+
+@metrics.timed("build_prompt")
 def build_prompt(query: str, context: List[Dict[str, Any]]) -> str:
     """
     Merge user query with retrieved context into a single prompt.
@@ -225,18 +561,51 @@ def answer_query(
     """
     context = retrieve_relevant_context(index, query, namespace)
     prompt = build_prompt(query, context)
-    resp = chat_session.send_message(prompt)
+    with metrics.timer("generate"):
+        resp = chat_session.send_message(prompt, user_message=query)
     return resp.text
 
 
 def main():
     """
-    CLI loop for the RAG-enabled chatbot using a persistent Gemini chat session.
+    CLI loop for the RAG-enabled chatbot using a persistent Gemini chat session,
+    or a batch run over a questions file with --batch (see batch_query.py).
     """
-    init_embedding_settings()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="RAG chatbot: interactive, or batch with --batch.")
+    parser.add_argument("--batch", metavar="QUESTIONS",
+                        help="Answer every question in this file (one per line, or JSONL with 'question')")
+    parser.add_argument("--out", help="Batch results JSONL; existing results are skipped (resume)")
+    parser.add_argument("--namespace", default="poc_rag")
+    parser.add_argument("--top-k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=64, help="Questions embedded per batch")
+    parser.add_argument("--retrieval-workers", type=int, default=8)
+    parser.add_argument("--generation-concurrency", type=int, default=4)
+    parser.add_argument("--dry-run", action="store_true", help="Stop after retrieval; no generation calls")
+    args = parser.parse_args()
+
+    if args.batch:
+        from batch_query import run_batch
+
+        index = load_index(init_pinecone_client(PINECONE_API_KEY), INDEX_NAME)
+        gemini_client = None
+        if not args.dry_run:
+            gemini_client = init_generation_client(init_gemini_client(GEMINI_API_KEY),
+                                                   max_concurrency=args.generation_concurrency)
+        summary = run_batch(
+            index, gemini_client, args.batch, args.out or f"{args.batch}.answers.jsonl",
+            namespace=args.namespace, top_k=args.top_k, batch_size=args.batch_size,
+            retrieval_workers=args.retrieval_workers,
+            generation_concurrency=args.generation_concurrency, dry_run=args.dry_run,
+        )
+        print(json.dumps(summary, indent=2))
+        return
+
+    get_embed_model()
     pinecone_client = init_pinecone_client(PINECONE_API_KEY)
     index = load_index(pinecone_client, INDEX_NAME)
-    gemini_client = init_gemini_client(GEMINI_API_KEY)
+    gemini_client = init_generation_client(init_gemini_client(GEMINI_API_KEY))
     # start first session
     chat = init_chat_session(gemini_client)
 
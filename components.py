@@ -0,0 +1,130 @@
+import os
+import logging
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# "background" (default): warm everything on a thread after import; "eager":
+# block until warm; "off": build each component on first use only
+WARMUP = os.getenv("WARMUP", "background")
+
+PROCESS_STARTED = time.perf_counter()
+
+
+class LazyComponent:
+    """
+    A dependency (client, model, index handle) built on first `get()`.
+
+    Construction happens once, under a lock, and its duration and outcome are
+    recorded for the startup report. A failed build is retried on the next get().
+    """
+
+    def __init__(self, name: str, factory: Callable[[], Any], required: bool = True):
+        self.name = name
+        self.factory = factory
+        self.required = required
+        self.state = "pending"
+        self.seconds: Optional[float] = None
+        self.error: Optional[str] = None
+        self._value: Any = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.state == "ready"
+
+    def get(self) -> Any:
+        if self.state == "ready":
+            return self._value
+        with self._lock:
+            if self.state == "ready":
+                return self._value
+            self.state = "initializing"
+            started = time.perf_counter()
+            try:
+                self._value = self.factory()
+            except Exception as e:
+                self.state, self.error = "failed", str(e)
+                self.seconds = time.perf_counter() - started
+                logger.error(f"Failed to initialize {self.name}: {e}")
+                raise
+            self.seconds = time.perf_counter() - started
+            self.state, self.error = "ready", None
+            metrics.observe("component_init_seconds", self.seconds, component=self.name)
+            logger.info(f"Initialized {self.name} in {self.seconds:.2f}s")
+            return self._value
+
+    def status(self) -> Dict[str, Any]:
+        return {"state": self.state, "seconds": self.seconds, "error": self.error, "required": self.required}
+
+
+_components: Dict[str, LazyComponent] = {}
+_phases: Dict[str, float] = {}
+_warmup_thread: Optional[threading.Thread] = None
+
+
+def register(name: str, factory: Callable[[], Any], required: bool = True) -> LazyComponent:
+    """Register (or return the already registered) component called `name`."""
+    if name not in _components:
+        _components[name] = LazyComponent(name, factory, required=required)
+    return _components[name]
+
+
+def get(name: str) -> Any:
+    return _components[name].get()
+
+
+def record_phase(name: str, seconds: float) -> None:
+    """Add a named startup phase (e.g. module import time) to the report."""
+    _phases[name] = seconds
+
+
+def _warm(names: List[str], max_workers: int) -> None:
+    started = time.perf_counter()
+
+    def build(name: str) -> None:
+        try:
+            _components[name].get()
+        except Exception:
+            pass  # already logged; readiness reports it
+
+    # Components that depend on each other simply block inside get()
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="warmup") as pool:
+        list(pool.map(build, names))
+    record_phase("warmup", time.perf_counter() - started)
+    logger.info("Startup report: %s", startup_report())
+
+
+def warm_up(names: Optional[Iterable[str]] = None, background: bool = True, max_workers: int = 4) -> None:
+    """Initialize components concurrently, on a daemon thread if `background`."""
+    global _warmup_thread
+    if multiprocessing.parent_process() is not None:
+        # Pool workers (e.g. document extraction) re-import the main module
+        return
+    selected = list(names) if names is not None else list(_components)
+    if background:
+        _warmup_thread = threading.Thread(target=_warm, args=(selected, max_workers), daemon=True, name="warmup")
+        _warmup_thread.start()
+    else:
+        _warm(selected, max_workers)
+
+
+def is_ready() -> bool:
+    """True once every required component has been built."""
+    return all(c.ready for c in _components.values() if c.required)
+
+
+def startup_report() -> Dict[str, Any]:
+    """Time spent per startup phase and per component, plus current states."""
+    return {
+        "uptime_seconds": time.perf_counter() - PROCESS_STARTED,
+        "phases": dict(_phases),
+        "components": {name: c.status() for name, c in _components.items()},
+        "ready": is_ready(),
+    }
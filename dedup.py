@@ -0,0 +1,122 @@
+"""
+Near-duplicate detection for pages and chunks before they are embedded.
+
+Text is normalized with `chatbot.clean_text`, cut into overlapping word
+shingles and summarized by a MinHash signature, whose positions agree
+between two texts with probability equal to the Jaccard similarity of their
+shingle sets. Signatures are bucketed with LSH banding, so each new text is
+only compared with the few earlier ones that share a band; a candidate whose
+estimated similarity reaches the threshold makes the new text a duplicate of
+that earlier (canonical) text.
+"""
+import os
+import zlib
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+import metrics
+from chatbot import clean_text
+
+DEDUP_THRESHOLD = float(os.getenv("DEDUP_THRESHOLD", 0.85))
+NUM_PERM = 128
+SHINGLE_WORDS = 5
+
+_PRIME = (1 << 61) - 1
+# Shingles hashed per NumPy call, bounding the (shingles, NUM_PERM) temporary
+_SHINGLE_BLOCK = 2048
+
+
+def shingles(text: str, size: int = SHINGLE_WORDS) -> np.ndarray:
+    """32-bit hashes of the word `size`-grams of already-cleaned text."""
+    words = text.split()
+    if len(words) <= size:
+        grams = [" ".join(words)]
+    else:
+        grams = [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+    return np.unique(np.fromiter((zlib.crc32(g.encode("utf-8")) for g in grams), dtype=np.uint64, count=len(grams)))
+
+
+class MinHasher:
+    """MinHash over universal hashes (a * x + b) mod 2^61-1."""
+
+    def __init__(self, num_perm: int = NUM_PERM, seed: int = 1):
+        rng = np.random.default_rng(seed)
+        # a < 2^31 and x < 2^32 keep a * x + b below 2^64
+        self.a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self.b = rng.integers(0, 1 << 32, size=num_perm, dtype=np.uint64)
+        self.num_perm = num_perm
+
+    def signature(self, hashes: np.ndarray) -> np.ndarray:
+        sig = np.full(self.num_perm, np.iinfo(np.uint32).max, dtype=np.uint64)
+        for start in range(0, len(hashes), _SHINGLE_BLOCK):
+            block = hashes[start:start + _SHINGLE_BLOCK, None]
+            sig = np.minimum(sig, ((block * self.a + self.b) % _PRIME & 0xFFFFFFFF).min(axis=0))
+        return sig.astype(np.uint32)
+
+
+def lsh_params(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """
+    (bands, rows) with bands * rows == num_perm whose S-curve midpoint
+    (1/bands)^(1/rows) sits a little under `threshold`, favouring recall;
+    candidates are checked against the threshold afterwards anyway.
+    """
+    target = threshold * 0.9
+    options = [(num_perm // rows, rows) for rows in range(1, num_perm + 1) if num_perm % rows == 0]
+    return min(options, key=lambda br: abs((1 / br[0]) ** (1 / br[1]) - target))
+
+
+class NearDuplicateIndex:
+    """
+    First-seen-wins near-duplicate index. `add(key, text)` returns the key of
+    an earlier text it duplicates, or None after registering it as canonical.
+    """
+
+    def __init__(self, threshold: float = DEDUP_THRESHOLD, num_perm: int = NUM_PERM,
+                 shingle_words: int = SHINGLE_WORDS, name: str = "chunk"):
+        self.threshold = threshold
+        self.shingle_words = shingle_words
+        self.name = name
+        self.hasher = MinHasher(num_perm)
+        self.bands, self.rows = lsh_params(threshold, num_perm)
+        self._buckets: List[Dict[bytes, List[str]]] = [{} for _ in range(self.bands)]
+        self._signatures: Dict[str, np.ndarray] = {}
+        self.duplicates = 0
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+    def _bands(self, signature: np.ndarray) -> Iterator[Tuple[int, bytes]]:
+        for band in range(self.bands):
+            yield band, signature[band * self.rows:(band + 1) * self.rows].tobytes()
+
+    def add(self, key: str, text: str) -> Optional[str]:
+        cleaned = clean_text(text)
+        if not cleaned:
+            return None
+        signature = self.hasher.signature(shingles(cleaned, self.shingle_words))
+        best, best_score = None, self.threshold
+        seen = set()
+        for band, bucket in self._bands(signature):
+            for candidate in self._buckets[band].get(bucket, ()):
+                if candidate in seen:
+                    continue
+                seen.add(candidate)
+                score = float(np.mean(self._signatures[candidate] == signature))
+                if score >= best_score:
+                    best, best_score = candidate, score
+        if best is not None:
+            self.duplicates += 1
+            metrics.inc("dedup_duplicates_total", level=self.name)
+            return best
+        self._signatures[key] = signature
+        for band, bucket in self._bands(signature):
+            self._buckets[band].setdefault(bucket, []).append(key)
+        return None
+
+
+def unique_chunks(chunks: Iterable[str], index: NearDuplicateIndex) -> Iterator[str]:
+    """Pass through chunks that are not near-duplicates of an earlier chunk."""
+    for n, chunk in enumerate(chunks):
+        if index.add(str(n), chunk) is None:
+            yield chunk
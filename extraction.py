@@ -0,0 +1,329 @@
+"""
+Document text extraction for uploads, keyed by file extension / MIME type.
+
+Every extractor takes a binary stream and yields `Section` records (a page of
+a PDF, a heading-delimited part of a DOCX or Markdown file, a block of rows of
+a CSV, ...), so the chunking and embedding pipeline in utils.py treats all
+formats the same. Large PDFs are split into page ranges extracted in a
+process pool, as are the pages of a bulk URL ingestion; other uploads are
+extracted inline.
+"""
+import os
+import io
+import csv
+import logging
+import re
+import zipfile
+import multiprocessing
+import threading
+from concurrent.futures import Future, ProcessPoolExecutor
+from itertools import islice
+from typing import BinaryIO, Callable, Dict, Iterator, List, NamedTuple, Optional
+from xml.etree import ElementTree
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Files at least this big are extracted in the process pool instead of inline
+PARALLEL_EXTRACT_BYTES = int(os.getenv("PARALLEL_EXTRACT_BYTES", 2 * 1024 * 1024))
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", max(1, min(4, (os.cpu_count() or 2) - 1))))
+# Pages (or sections) handed to one worker task; documents with no more
+# parts than this gain nothing from the pool and are extracted inline
+PARTS_PER_TASK = int(os.getenv("EXTRACT_PARTS_PER_TASK", 16))
+# Rough budget for the part of the document covered by tasks in flight (their
+# extracted text waits in memory until it is consumed in order)
+EXTRACT_WINDOW_BYTES = int(os.getenv("EXTRACT_WINDOW_BYTES", 16 * 1024 * 1024))
+# Files spilled here for the workers to read; default is the system temp dir
+EXTRACT_TMP_DIR = os.getenv("EXTRACT_TMP_DIR") or None
+# Plain text and CSV are cut into sections of roughly this many characters
+SECTION_CHARS = 8000
+CSV_ROWS_PER_SECTION = 50
+
+
+class Section(NamedTuple):
+    """One page/section of extracted text; `page` is 1-based for paged formats."""
+    text: str
+    page: Optional[int] = None
+    heading: Optional[str] = None
+
+
+class Extractor(NamedTuple):
+    name: str
+    # (stream, start, stop) -> sections; start/stop index the format's parts
+    extract: Callable[..., Iterator[Section]]
+    # Number of independently extractable parts (PDF pages), for splitting
+    # across workers; None means the file is extracted by a single task
+    count_parts: Optional[Callable[[BinaryIO], int]] = None
+
+
+# extension -> extractor, MIME type -> extension, extractor name -> extractor
+EXTRACTORS: Dict[str, Extractor] = {}
+MIME_TYPES: Dict[str, str] = {}
+_BY_NAME: Dict[str, Extractor] = {}
+
+
+def register_extractor(name: str, extensions: List[str], mime_types: List[str] = (),
+                       count_parts: Optional[Callable[[BinaryIO], int]] = None):
+    """Decorator registering an extractor for the given extensions and MIME types."""
+    def decorator(func):
+        extractor = Extractor(name, func, count_parts)
+        _BY_NAME[name] = extractor
+        for ext in extensions:
+            EXTRACTORS[ext] = extractor
+        for mime in mime_types:
+            MIME_TYPES[mime] = extensions[0]
+        return func
+    return decorator
+
+
+def supported_extensions() -> set:
+    return set(EXTRACTORS)
+
+
+def extractor_for(filename: str, mimetype: Optional[str] = None) -> Extractor:
+    """Pick an extractor by extension, falling back to the MIME type."""
+    ext = filename.rsplit('.', 1)[1].lower() if '.' in filename else ""
+    if ext not in EXTRACTORS and mimetype:
+        ext = MIME_TYPES.get(mimetype.split(";")[0].strip().lower(), ext)
+    if ext not in EXTRACTORS:
+        raise ValueError(f"Unsupported document type: {filename} ({mimetype})")
+    return EXTRACTORS[ext]
+
+
+def _text_stream(stream: BinaryIO) -> io.TextIOWrapper:
+    return io.TextIOWrapper(stream, encoding="utf-8", errors="replace", newline="")
+
+
+def _pdf_page_count(stream: BinaryIO) -> int:
+    from pypdf import PdfReader
+    return len(PdfReader(stream).pages)
+
+
+@register_extractor("pdf", ["pdf"], ["application/pdf"], count_parts=_pdf_page_count)
+def extract_pdf(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[Section]:
+    from pypdf import PdfReader
+
+    reader = PdfReader(stream)
+    stop = len(reader.pages) if stop is None else min(stop, len(reader.pages))
+    for number in range(start, stop):
+        page_text = reader.pages[number].extract_text()
+        if page_text:
+            yield Section(page_text, page=number + 1)
+
+
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+
+
+def _docx_sections(stream: BinaryIO) -> Iterator[Section]:
+    # Parsed straight from the zip so python-docx is not needed
+    with zipfile.ZipFile(stream) as archive, archive.open("word/document.xml") as xml:
+        heading, paragraphs = None, []
+        for _, element in ElementTree.iterparse(xml):
+            if element.tag != _W + "p":
+                continue
+            text = "".join(t.text or "" for t in element.iter(_W + "t")).strip()
+            style = element.find(f"{_W}pPr/{_W}pStyle")
+            is_heading = style is not None and style.get(_W + "val", "").lower().startswith(("heading", "title"))
+            element.clear()
+            if not text:
+                continue
+            if is_heading:
+                if paragraphs:
+                    yield Section("\n\n".join(paragraphs), heading=heading)
+                heading, paragraphs = text, [text]
+            else:
+                paragraphs.append(text)
+        if paragraphs:
+            yield Section("\n\n".join(paragraphs), heading=heading)
+
+
+@register_extractor(
+    "docx", ["docx"], ["application/vnd.openxmlformats-officedocument.wordprocessingml.document"]
+)
+def extract_docx(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[Section]:
+    return islice(_docx_sections(stream), start, stop)
+
+
+@register_extractor("html", ["html", "htm"], ["text/html", "application/xhtml+xml"])
+def extract_html(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[Section]:
+    # Same boilerplate removal as URL ingestion in chatbot.py
+    from chatbot import extractor
+
+    html = _text_stream(stream).read()
+    doc = extractor.get().get_doc(html)
+    content = doc.content
+    if not content:
+        # Short exports can be all "boilerplate" to the heuristics; keep the text
+        from boilerpy3.extractors import KeepEverythingExtractor
+        content = KeepEverythingExtractor().get_content(html)
+    if content and start == 0 and stop != 0:
+        yield Section(content, heading=doc.title or None)
+
+
+_MD_HEADING = re.compile(r"^#{1,6}\s+(.*?)\s*#*\s*$")
+
+
+@register_extractor("markdown", ["md", "markdown"], ["text/markdown", "text/x-markdown"])
+def extract_markdown(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[Section]:
+    def sections() -> Iterator[Section]:
+        heading, lines, fenced = None, [], False
+        for line in _text_stream(stream):
+            if line.lstrip().startswith(("```", "~~~")):
+                fenced = not fenced
+            match = None if fenced else _MD_HEADING.match(line)
+            if match:
+                if "".join(lines).strip():
+                    yield Section("".join(lines).strip(), heading=heading)
+                heading, lines = match.group(1), []
+            lines.append(line)
+        if "".join(lines).strip():
+            yield Section("".join(lines).strip(), heading=heading)
+
+    return islice(sections(), start, stop)
+
+
+@register_extractor("text", ["txt", "text"], ["text/plain"])
+def extract_text(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[Section]:
+    def sections() -> Iterator[Section]:
+        lines, size = [], 0
+        for line in _text_stream(stream):
+            lines.append(line)
+            size += len(line)
+            # Cut only at blank lines so paragraphs stay intact for the chunker
+            if size >= SECTION_CHARS and not line.strip():
+                yield Section("".join(lines).strip())
+                lines, size = [], 0
+        if "".join(lines).strip():
+            yield Section("".join(lines).strip())
+
+    return islice(sections(), start, stop)
+
+
+@register_extractor("csv", ["csv"], ["text/csv"])
+def extract_csv(stream: BinaryIO, start: int = 0, stop: Optional[int] = None) -> Iterator[Section]:
+    def sections() -> Iterator[Section]:
+        reader = csv.DictReader(_text_stream(stream))
+        rows, first = [], 1
+        for number, row in enumerate(reader, start=1):
+            # One "column: value" line per row, so each row is its own paragraph
+            rows.append("; ".join(f"{k}: {v}" for k, v in row.items() if k and v))
+            if len(rows) == CSV_ROWS_PER_SECTION:
+                yield Section("\n\n".join(rows), heading=f"rows {first}-{number}")
+                rows, first = [], number + 1
+        if rows:
+            yield Section("\n\n".join(rows), heading=f"rows {first}-{first + len(rows) - 1}")
+
+    return islice(sections(), start, stop)
+
+
+def _extract_part(name: str, data: bytes, start: int, stop: Optional[int]) -> List[Section]:
+    """Process-pool task: extract parts [start, stop) of an in-memory document."""
+    return list(_BY_NAME[name].extract(io.BytesIO(data), start, stop))
+
+
+def _extract_file_part(name: str, path: str, start: int, stop: Optional[int]) -> List[Section]:
+    """Process-pool task: extract parts [start, stop) of a document on disk."""
+    with open(path, "rb") as f:
+        return list(_BY_NAME[name].extract(f, start, stop))
+
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ProcessPoolExecutor:
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn: the web server is multi-threaded, which fork does not mix well with
+            _pool = ProcessPoolExecutor(max_workers=EXTRACT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def submit_extraction(extractor: Extractor, data: bytes, in_pool: Optional[bool] = None) -> Future:
+    """
+    Extract a whole in-memory document; the future yields a list of sections.
+    By default documents under PARALLEL_EXTRACT_BYTES are extracted right away
+    in this thread, where the pool's IPC would cost more than it saves for a
+    one-off upload. Pass `in_pool=True` from pipelines that extract many
+    documents back to back (bulk URL ingestion), so parsing runs in parallel
+    and off the calling thread whatever the size.
+    """
+    if in_pool is None:
+        in_pool = len(data) >= PARALLEL_EXTRACT_BYTES
+    if in_pool and EXTRACT_WORKERS > 0:
+        return get_pool().submit(_extract_part, extractor.name, data, 0, None)
+    future: Future = Future()
+    try:
+        future.set_result(list(extractor.extract(io.BytesIO(data))))
+    except Exception as e:
+        future.set_exception(e)
+    return future
+
+
+def _count_parts(extractor: Extractor, stream: BinaryIO) -> Optional[int]:
+    if extractor.count_parts is None:
+        return None
+    try:
+        return extractor.count_parts(stream)
+    finally:
+        stream.seek(0)
+
+
+def _extract_in_pool(extractor: Extractor, stream: BinaryIO, parts: int, size: int) -> Iterator[Section]:
+    """
+    Extract page ranges of a large document in the process pool. The upload is
+    copied once to a temp file that the workers open themselves, so no task
+    carries the document's bytes, and the tasks in flight are bounded by the
+    share of the document they cover.
+    """
+    import shutil
+    import tempfile
+
+    ranges = [(start, min(start + PARTS_PER_TASK, parts)) for start in range(0, parts, PARTS_PER_TASK)]
+    bytes_per_task = max(1, size * PARTS_PER_TASK // parts)
+    window = max(1, min(EXTRACT_WORKERS, EXTRACT_WINDOW_BYTES // bytes_per_task))
+    with tempfile.NamedTemporaryFile(prefix="extract-", dir=EXTRACT_TMP_DIR, delete=False) as spill:
+        shutil.copyfileobj(stream, spill, 1024 * 1024)
+    pool = get_pool()
+    pending = []
+    try:
+        # Results are yielded in document order as they complete
+        for start, stop in ranges:
+            pending.append(pool.submit(_extract_file_part, extractor.name, spill.name, start, stop))
+            if len(pending) >= window:
+                yield from pending.pop(0).result()
+        while pending:
+            yield from pending.pop(0).result()
+    finally:
+        for future in pending:
+            future.cancel()
+        for future in pending:
+            if not future.cancelled():
+                future.exception()
+        os.unlink(spill.name)
+
+
+def extract_sections(
+    stream: BinaryIO,
+    filename: str,
+    mimetype: Optional[str] = None,
+    size: Optional[int] = None
+) -> Iterator[Section]:
+    """
+    Yield the sections of an uploaded document, in order.
+
+    Files of at least PARALLEL_EXTRACT_BYTES whose format splits into more
+    than PARTS_PER_TASK parts (PDF pages) are extracted in the process pool;
+    everything else inline, streaming straight from `stream`.
+    """
+    extractor = extractor_for(filename, mimetype)
+    parts = None
+    if size is not None and size >= PARALLEL_EXTRACT_BYTES and EXTRACT_WORKERS > 0:
+        parts = _count_parts(extractor, stream)
+    parallel = parts is not None and parts > PARTS_PER_TASK
+    metrics.inc("documents_extracted_total", format=extractor.name, mode="pool" if parallel else "inline")
+    if parallel:
+        return _extract_in_pool(extractor, stream, parts, size)
+    return extractor.extract(stream)
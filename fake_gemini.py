@@ -0,0 +1,109 @@
+"""
+Local stand-in for the Gemini REST API (generateContent only).
+
+Point the app at it with GEMINI_BASE_URL=http://127.0.0.1:<port>, or start it
+in-process from tests and benchmarks:
+
+    server, base_url = start_fake_gemini(latency=0.2, failure_rate=0.1)
+    client = init_gemini_client("fake-key", base_url=base_url)
+    ...
+    server.failure_rate = 1.0   # simulate an outage
+    server.shutdown()
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Tuple
+
+_GENERATE = re.compile(r"/models/([^/:]+):generateContent$")
+
+
+class FakeGeminiServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, latency: float = 0.0, jitter: float = 0.0, failure_rate: float = 0.0):
+        super().__init__(address, _Handler)
+        self.latency = latency
+        self.jitter = jitter
+        self.failure_rate = failure_rate
+        self.requests = 0
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: FakeGeminiServer
+
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status: int, body: dict) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        match = _GENERATE.search(self.path.split("?", 1)[0])
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not match:
+            self._reply(404, {"error": {"code": 404, "message": "Not found", "status": "NOT_FOUND"}})
+            return
+
+        server = self.server
+        server.requests += 1
+        time.sleep(max(0.0, server.latency + random.uniform(-server.jitter, server.jitter)))
+        if random.random() < server.failure_rate:
+            self._reply(503, {"error": {"code": 503, "message": "Injected failure", "status": "UNAVAILABLE"}})
+            return
+
+        texts = [p.get("text", "") for c in body.get("contents", []) for p in c.get("parts", [])]
+        prompt_tokens = sum(len(t) for t in texts) // 4 + 1
+        last = texts[-1] if texts else ""
+        reply = f"(fake {match.group(1)}) You asked: {last[:200]}"
+        self._reply(200, {
+            "candidates": [{
+                "content": {"role": "model", "parts": [{"text": reply}]},
+                "finishReason": "STOP",
+                "index": 0,
+            }],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens,
+                "candidatesTokenCount": len(reply) // 4 + 1,
+                "totalTokenCount": prompt_tokens + len(reply) // 4 + 1,
+            },
+            "modelVersion": match.group(1),
+        })
+
+
+def start_fake_gemini(
+    host: str = "127.0.0.1",
+    port: int = 0,
+    latency: float = 0.0,
+    jitter: float = 0.0,
+    failure_rate: float = 0.0
+) -> Tuple[FakeGeminiServer, str]:
+    """Start the fake server on a daemon thread and return it with its base URL."""
+    server = FakeGeminiServer((host, port), latency=latency, jitter=jitter, failure_rate=failure_rate)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run a local fake Gemini API.")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every call")
+    parser.add_argument("--jitter", type=float, default=0.0)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Fraction of calls answered with 503")
+    args = parser.parse_args()
+    server = FakeGeminiServer(("127.0.0.1", args.port), args.latency, args.jitter, args.failure_rate)
+    print(f"Fake Gemini listening on http://127.0.0.1:{args.port}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
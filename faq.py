@@ -0,0 +1,353 @@
+"""
+Warm cache of precomputed answers to frequently asked questions.
+
+The FAQ set is the most asked queries from the analytics summaries (which
+are counted from `chat_logs`), plus questions curated by admins. A daemon
+thread answers each one without any conversation (retrieval + Gemini, via
+the `answer_fn` given by app.py) and stores the answer in Firestore with the
+sources its context came from. `lookup` embeds an incoming query and returns
+the stored answer of the closest FAQ question when the cosine similarity
+reaches FAQ_MATCH_THRESHOLD and both have the same content terms, so close
+paraphrases with a different subject ("undergraduate tuition" / "graduate
+tuition") don't share an answer.
+
+Freshness is tracked per source document: when a page URL or uploaded
+document is re-ingested (see `chatbot.notify_sources_ingested`), only the
+answers built from it, and those that found no sources at all, go stale;
+they stop being served and are recomputed in the background. Answers older
+than FAQ_MAX_AGE_SECONDS are recomputed too, which covers ingestion that
+happened in another process.
+"""
+import os
+import hashlib
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+import analytics
+import metrics
+from chatbot import STOPWORDS, clean_text, embed_queries, embed_query, normalize_query
+from utils import get_db
+
+logger = logging.getLogger(__name__)
+
+FAQ_COL = "faq_answers"
+# Mined questions kept in the cache (curated ones come on top)
+FAQ_SIZE = int(os.getenv("FAQ_SIZE", 50))
+# A query must have been asked this often to be mined
+FAQ_MIN_COUNT = int(os.getenv("FAQ_MIN_COUNT", 3))
+# Cosine similarity between a query and a FAQ question needed to serve its answer
+FAQ_MATCH_THRESHOLD = float(os.getenv("FAQ_MATCH_THRESHOLD", 0.92))
+FAQ_MAX_AGE_SECONDS = float(os.getenv("FAQ_MAX_AGE_SECONDS", 24 * 3600))
+# How often the FAQ set is re-mined from the analytics summaries
+FAQ_REFRESH_SECONDS = float(os.getenv("FAQ_REFRESH_SECONDS", 3600))
+
+# question -> (answer, retrieved contexts); raises if no answer could be made
+AnswerFn = Callable[[str], Tuple[str, List[Dict[str, Any]]]]
+
+
+def faq_key(question: str) -> str:
+    return hashlib.blake2b(normalize_query(question).encode("utf-8"), digest_size=12).hexdigest()
+
+
+def context_sources(contexts: Iterable[Dict[str, Any]]) -> List[str]:
+    """Source ids of retrieved chunks: the page URL or the uploaded doc_id."""
+    return sorted({c.get("url") or c.get("doc_id") for c in contexts if c.get("url") or c.get("doc_id")})
+
+
+def content_terms(text: str) -> frozenset:
+    """Lowercased non-stopwords of a question, with plural "s" dropped."""
+    terms = set()
+    for word in clean_text(text).split():
+        if word in STOPWORDS or len(word) <= 2:
+            continue
+        terms.add(word[:-1] if len(word) > 3 and word.endswith("s") and not word.endswith("ss") else word)
+    return frozenset(terms)
+
+
+def _unit(vectors: Any) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
+
+
+class FAQCache:
+    """
+    Precomputed FAQ answers with an in-memory embedding matrix for lookups.
+    Loading, mining and answering all happen on one daemon thread, started
+    by the first lookup; until it has loaded, every lookup is a miss.
+    """
+
+    def __init__(self, answer_fn: AnswerFn, size: int = FAQ_SIZE, min_count: int = FAQ_MIN_COUNT,
+                 threshold: float = FAQ_MATCH_THRESHOLD, max_age: float = FAQ_MAX_AGE_SECONDS,
+                 refresh_seconds: float = FAQ_REFRESH_SECONDS):
+        self.answer_fn = answer_fn
+        self.size = size
+        self.min_count = min_count
+        self.threshold = threshold
+        self.max_age = max_age
+        self.refresh_seconds = refresh_seconds
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._vectors: Dict[str, np.ndarray] = {}
+        # (keys, unit question embeddings), swapped whole so lookups need no lock
+        self._matrix: Tuple[List[str], np.ndarray] = ([], np.zeros((0, 0), dtype=np.float32))
+        self._pending: Dict[str, None] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._rebuild_requested = True
+        self._thread: Optional[threading.Thread] = None
+        self.loaded = False
+
+    def _ensure_thread(self) -> None:
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, daemon=True, name="faq-refresh")
+                    self._thread.start()
+
+    def _run(self) -> None:
+        try:
+            self.load()
+        except Exception as e:
+            logger.warning(f"Could not load FAQ answers: {e}")
+        while True:
+            try:
+                if self._rebuild_requested:
+                    self._rebuild_requested = False
+                    self.rebuild()
+                else:
+                    self.refresh_pending()
+            except Exception as e:
+                logger.warning(f"FAQ refresh failed: {e}")
+            if not self._wake.wait(self.refresh_seconds):
+                self._rebuild_requested = True
+            self._wake.clear()
+
+    def _reindex(self) -> None:
+        keys = [key for key in self._entries if key in self._vectors]
+        matrix = np.stack([self._vectors[key] for key in keys]) if keys else np.zeros((0, 0), dtype=np.float32)
+        self._matrix = (keys, matrix)
+
+    def _embed(self, keys: List[str]) -> None:
+        questions = [self._entries[key]["question"] for key in keys]
+        for key, vector in zip(keys, embed_queries(questions)):
+            self._vectors[key] = _unit(vector)
+
+    def load(self) -> int:
+        """Read stored answers from Firestore and embed their questions."""
+        entries = {doc.id: doc.to_dict() for doc in get_db().collection(FAQ_COL).stream()}
+        with self._lock:
+            self._entries.update(entries)
+            for key, entry in entries.items():
+                if entry.get("stale") or not entry.get("answer"):
+                    self._pending[key] = None
+        self._embed(list(entries))
+        with self._lock:
+            self._reindex()
+        self.loaded = True
+        logger.info(f"Loaded {len(entries)} FAQ answers")
+        return len(entries)
+
+    def lookup(self, query: str) -> Optional[Dict[str, Any]]:
+        """
+        The cached FAQ entry (question, answer, sources, score) matching
+        `query`, or None when there is no close, fresh answer.
+        """
+        self._ensure_thread()
+        keys, matrix = self._matrix
+        if not keys:
+            return None
+        scores = matrix @ _unit(embed_query(query))
+        best = int(np.argmax(scores))
+        if scores[best] < self.threshold:
+            metrics.inc("faq_lookups_total", outcome="miss")
+            return None
+        entry = self._entries.get(keys[best])
+        if entry is not None and content_terms(query) != content_terms(entry["question"]):
+            metrics.inc("faq_lookups_total", outcome="mismatch")
+            return None
+        if entry is None or entry.get("stale") or not entry.get("answer"):
+            metrics.inc("faq_lookups_total", outcome="stale")
+            return None
+        if time.time() - entry.get("computed_at", 0) > self.max_age:
+            metrics.inc("faq_lookups_total", outcome="stale")
+            self._mark_stale([keys[best]])
+            return None
+        metrics.inc("faq_lookups_total", outcome="hit")
+        return {**entry, "score": float(scores[best])}
+
+    def _mark_stale(self, keys: List[str]) -> None:
+        if not keys:
+            return
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is not None:
+                    entry["stale"] = True
+                    entry["invalidated_at"] = now
+                    self._pending[key] = None
+        # Persisted so a restart before the refresh doesn't serve them again
+        try:
+            db = get_db()
+            batch = db.batch()
+            for key in keys:
+                batch.set(db.collection(FAQ_COL).document(key), {"stale": True}, merge=True)
+            batch.commit()
+        except Exception as e:
+            logger.warning(f"Could not mark FAQ answers stale: {e}")
+        self._wake.set()
+
+    def sources_ingested(self, sources: List[str]) -> None:
+        """Ingestion listener: stale the answers built from these sources."""
+        changed = set(sources)
+        with self._lock:
+            keys = [key for key, entry in self._entries.items()
+                    if not entry.get("sources") or changed.intersection(entry["sources"])]
+        if keys:
+            metrics.inc("faq_invalidations_total", len(keys))
+            logger.info(f"{len(keys)} FAQ answers stale after ingesting {len(changed)} sources")
+        self._mark_stale(keys)
+
+    def add_curated(self, questions: List[str]) -> List[str]:
+        """Pin admin-chosen questions in the cache; answered in the background."""
+        added = []
+        with self._lock:
+            for question in questions:
+                question = question.strip()
+                if not question:
+                    continue
+                key = faq_key(question)
+                entry = self._entries.setdefault(key, {"question": question, "count": 0, "sources": []})
+                entry["curated"] = True
+                self._pending[key] = None
+                added.append(key)
+        self._ensure_thread()
+        self._wake.set()
+        return added
+
+    def remove(self, question: str) -> bool:
+        key = faq_key(question)
+        with self._lock:
+            removed = self._entries.pop(key, None) is not None
+            self._pending.pop(key, None)
+            self._reindex()
+        if removed:
+            get_db().collection(FAQ_COL).document(key).delete()
+        return removed
+
+    def request_rebuild(self) -> None:
+        """Re-mine the FAQ set on the background thread."""
+        self._rebuild_requested = True
+        self._ensure_thread()
+        self._wake.set()
+
+    def mine(self) -> List[Dict[str, Any]]:
+        """
+        The most asked queries with at least `min_count` asks, skipping
+        near-duplicates of a more asked one ("tuition cost" / "tuition costs").
+        """
+        candidates = [q for q in analytics.top_queries(self.size * 2) if q["count"] >= self.min_count]
+        if not candidates:
+            return []
+        vectors = _unit(embed_queries([q["query"] for q in candidates]))
+        terms = [content_terms(q["query"]) for q in candidates]
+        chosen: List[int] = []
+        for i in range(len(candidates)):
+            if any(float(vectors[j] @ vectors[i]) >= self.threshold and terms[j] == terms[i] for j in chosen):
+                continue
+            chosen.append(i)
+            if len(chosen) >= self.size:
+                break
+        return [candidates[i] for i in chosen]
+
+    def rebuild(self) -> Dict[str, int]:
+        """Replace the mined part of the FAQ set, then answer what is new or stale."""
+        mined = {faq_key(q["query"]): q for q in self.mine()}
+        now = time.time()
+        with self._lock:
+            dropped = [key for key, entry in self._entries.items()
+                       if key not in mined and not entry.get("curated")]
+            for key in dropped:
+                self._entries.pop(key)
+                self._pending.pop(key, None)
+            for key, query in mined.items():
+                entry = self._entries.setdefault(key, {"question": query["query"], "sources": []})
+                entry["count"] = query["count"]
+                if not entry.get("answer") or now - entry.get("computed_at", 0) > self.max_age:
+                    self._pending[key] = None
+            self._reindex()
+        db = get_db()
+        for key in dropped:
+            db.collection(FAQ_COL).document(key).delete()
+        refreshed = self.refresh_pending()
+        logger.info(f"FAQ rebuilt: {len(mined)} mined, {len(dropped)} dropped, {refreshed} answered")
+        return {"mined": len(mined), "dropped": len(dropped), "answered": refreshed}
+
+    def refresh_pending(self) -> int:
+        """Answer every pending question; returns how many were stored."""
+        with self._lock:
+            keys = list(self._pending)
+        missing = [key for key in keys if key not in self._vectors and key in self._entries]
+        if missing:
+            self._embed(missing)
+        refreshed = 0
+        for key in keys:
+            refreshed += self._refresh(key)
+        with self._lock:
+            self._reindex()
+        return refreshed
+
+    def _refresh(self, key: str) -> int:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self._pending.pop(key, None)
+                return 0
+            question = entry["question"]
+        started = time.time()
+        try:
+            with metrics.timer("faq_answer"):
+                answer, contexts = self.answer_fn(question)
+        except Exception as e:
+            # Stays pending (and unserved) until the next refresh
+            logger.warning(f"Could not answer FAQ {question!r}: {e}")
+            return 0
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return 0
+            entry.update(answer=answer, sources=context_sources(contexts), computed_at=started)
+            # A source re-ingested while this answer was made leaves it stale
+            if entry.get("invalidated_at", 0) < started:
+                entry["stale"] = False
+                self._pending.pop(key, None)
+            stored = {k: v for k, v in entry.items() if k != "invalidated_at"}
+        get_db().collection(FAQ_COL).document(key).set(stored)
+        return 1
+
+    def status(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = list(self._entries.values())
+            pending = len(self._pending)
+        hits = metrics.get_counter("faq_lookups_total", outcome="hit")
+        lookups = hits + sum(metrics.get_counter("faq_lookups_total", outcome=o)
+                             for o in ("miss", "mismatch", "stale"))
+        return {
+            "loaded": self.loaded,
+            "entries": len(entries),
+            "curated": sum(1 for e in entries if e.get("curated")),
+            "answered": sum(1 for e in entries if e.get("answer") and not e.get("stale")),
+            "pending": pending,
+            "hit_rate": hits / lookups if lookups else None,
+        }
+
+    def entries(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(
+                ({k: v for k, v in entry.items() if k != "invalidated_at"} for entry in self._entries.values()),
+                key=lambda e: (not e.get("curated"), -e.get("count", 0)),
+            )
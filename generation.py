@@ -0,0 +1,227 @@
+import os
+import logging
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, Future, wait, FIRST_COMPLETED
+from typing import Any, Optional
+
+import metrics
+
+logger = logging.getLogger(__name__)
+
+GENERATION_MAX_CONCURRENCY = int(os.getenv("GENERATION_MAX_CONCURRENCY", 8))
+GENERATION_DEADLINE_SECONDS = float(os.getenv("GENERATION_DEADLINE_SECONDS", 20))
+GENERATION_MAX_ATTEMPTS = int(os.getenv("GENERATION_MAX_ATTEMPTS", 2))
+GENERATION_HEDGE = os.getenv("GENERATION_HEDGE", "false").lower() == "true"
+BREAKER_FAILURE_THRESHOLD = int(os.getenv("BREAKER_FAILURE_THRESHOLD", 5))
+BREAKER_RESET_SECONDS = float(os.getenv("BREAKER_RESET_SECONDS", 30))
+
+
+class GenerationError(Exception):
+    """Base class for failures raised by GenerationClient."""
+
+
+class CircuitOpenError(GenerationError):
+    """The upstream is considered unhealthy; the call was not attempted."""
+
+
+class GenerationTimeout(GenerationError):
+    """The per-call deadline expired."""
+
+
+class GenerationOverloaded(GenerationError):
+    """No concurrency slot became free before the deadline."""
+
+
+def _is_transient(error: Exception) -> bool:
+    """5xx, 429 and transport errors are worth retrying; other 4xx are not."""
+    code = getattr(error, "code", None)
+    return not isinstance(code, int) or code >= 500 or code == 429
+
+
+class CircuitBreaker:
+    """
+    Closed -> open after `failure_threshold` consecutive failures; open ->
+    half-open after `reset_timeout` seconds, letting a single probe through.
+    """
+
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD,
+                 reset_timeout: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def _transition(self, state: str) -> None:
+        if state != self.state:
+            logger.warning(f"Gemini circuit breaker {self.state} -> {state}")
+            metrics.inc("generation_breaker_transitions_total", state=state)
+            self.state = state
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self._transition("half_open")
+            if self.state == "half_open" and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.failures = 0
+            self._probe_in_flight = False
+            self._transition("closed")
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe whose attempt never reached Gemini."""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failures += 1
+            self._probe_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+                self._transition("open")
+
+
+class GenerationClient:
+    """
+    Wrapper around a `genai.Client` for all Gemini generation calls.
+
+    Adds a process-wide concurrency limit, a circuit breaker shared by every
+    request, per-call deadlines, bounded retries and optional hedging (a second
+    attempt launched once the first is slower than the recent p95 latency).
+    It exposes `models.generate_content`, so it can stand in for the SDK client.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        max_concurrency: int = GENERATION_MAX_CONCURRENCY,
+        deadline: float = GENERATION_DEADLINE_SECONDS,
+        max_attempts: int = GENERATION_MAX_ATTEMPTS,
+        hedge: bool = GENERATION_HEDGE,
+        breaker: Optional[CircuitBreaker] = None
+    ):
+        self.client = client
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.hedge = hedge
+        self.breaker = breaker or CircuitBreaker()
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        # Twice the slots so hedges and abandoned calls never queue behind each other
+        self._pool = ThreadPoolExecutor(max_workers=max_concurrency * 2, thread_name_prefix="gemini")
+        self._latencies: deque = deque(maxlen=200)
+
+    @property
+    def models(self) -> "GenerationClient":
+        return self
+
+    def p95_latency(self) -> Optional[float]:
+        """p95 of recent successful calls, or None until enough samples exist."""
+        if len(self._latencies) < 20:
+            return None
+        ordered = sorted(self._latencies)
+        return ordered[int(len(ordered) * 0.95) - 1]
+
+    def _launch(self, kwargs: dict, timeout: float) -> Optional[Future]:
+        """Start one upstream call once a slot is free; the slot is held until it returns."""
+        if not self._slots.acquire(timeout=max(timeout, 0)):
+            return None
+
+        def call():
+            try:
+                return self.client.models.generate_content(**kwargs)
+            finally:
+                self._slots.release()
+
+        return self._pool.submit(call)
+
+    def _attempt(self, kwargs: dict, deadline_at: float) -> Any:
+        """One logical attempt, with an optional hedge; raises on failure or timeout."""
+        started = time.monotonic()
+        primary = self._launch(kwargs, deadline_at - started)
+        if primary is None:
+            raise GenerationOverloaded("No generation slot available before the deadline")
+        pending = {primary}
+
+        hedge_after = self.p95_latency() if self.hedge else None
+        if hedge_after is not None and hedge_after < deadline_at - started:
+            done, _ = wait(pending, timeout=hedge_after)
+            if not done:
+                # Never block for a hedge slot; skip hedging when saturated
+                hedge = self._launch(kwargs, 0)
+                if hedge is not None:
+                    metrics.inc("generation_hedges_total", result="launched")
+                    pending.add(hedge)
+
+        error = None
+        while pending:
+            done, pending = wait(pending, timeout=deadline_at - time.monotonic(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise GenerationTimeout(f"Gemini call exceeded its {self.deadline:.1f}s deadline")
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        metrics.inc("generation_hedges_total", result="won")
+                    self._latencies.append(time.monotonic() - started)
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    def generate_content(self, deadline: Optional[float] = None, **kwargs) -> Any:
+        """
+        Same arguments as `client.models.generate_content`, plus an optional
+        per-call `deadline` in seconds. Raises a GenerationError subclass or
+        the last upstream error.
+        """
+        started = time.monotonic()
+        deadline_at = started + (deadline or self.deadline)
+        last_error: Exception = GenerationError("No attempt made")
+
+        for attempt in range(self.max_attempts):
+            if not self.breaker.allow():
+                metrics.inc("generation_requests_total", outcome="circuit_open")
+                raise CircuitOpenError("Gemini circuit breaker is open")
+            try:
+                response = self._attempt(kwargs, deadline_at)
+            except GenerationOverloaded:
+                # Saturated locally, so nothing was learned about upstream health
+                self.breaker.release_probe()
+                metrics.inc("generation_requests_total", outcome="overloaded")
+                raise
+            except Exception as e:
+                last_error = e
+                transient = isinstance(e, GenerationTimeout) or _is_transient(e)
+                if transient:
+                    self.breaker.record_failure()
+                else:
+                    # The upstream answered; a bad request says nothing about its health
+                    self.breaker.record_success()
+                remaining = deadline_at - time.monotonic()
+                backoff = 0.2 * (2 ** attempt) + random.random() * 0.1
+                last_attempt = attempt == self.max_attempts - 1
+                if last_attempt or not transient or isinstance(e, GenerationTimeout) or remaining <= backoff:
+                    break
+                logger.warning(f"Gemini call failed ({e}); retrying in {backoff:.2f}s "
+                               f"({attempt + 1}/{self.max_attempts})")
+                time.sleep(backoff)
+                continue
+            self.breaker.record_success()
+            metrics.inc("generation_requests_total", outcome="ok")
+            metrics.observe("generation_latency_seconds", time.monotonic() - started)
+            return response
+
+        outcome = "timeout" if isinstance(last_error, GenerationTimeout) else "error"
+        metrics.inc("generation_requests_total", outcome=outcome)
+        raise last_error
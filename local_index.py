@@ -0,0 +1,271 @@
+"""
+In-process vector index with the subset of the Pinecone client API the app uses.
+
+Enabled with VECTOR_BACKEND=local (see `chatbot.init_pinecone_client`). Used for
+offline benchmarks, evaluation and local development; vectors live in NumPy
+arrays and search is brute-force cosine similarity. Set LOCAL_SNAPSHOT_DIR to
+start each index from a snapshot (snapshot.py) instead of empty.
+
+LOCAL_VECTOR_COMPRESSION (float32, float16, int8 or pq; see quantization.py)
+stores vectors compressed and scores queries directly on the codes. PQ
+namespaces keep float32 vectors until PQ_TRAIN_SIZE of them have arrived,
+then train their codebook and re-encode.
+"""
+import os
+import threading
+import time
+from types import SimpleNamespace
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from quantization import VectorCodec, make_codec
+
+LOCAL_VECTOR_COMPRESSION = os.getenv("LOCAL_VECTOR_COMPRESSION", "float32")
+# Directory of snapshots (see snapshot.py) named after the indexes they fill
+LOCAL_SNAPSHOT_DIR = os.getenv("LOCAL_SNAPSHOT_DIR")
+
+
+def _as_records(vectors: Any) -> List[tuple]:
+    """Accept Pinecone upsert input: tuples, dicts, or a single dict."""
+    if isinstance(vectors, dict):
+        vectors = [vectors]
+    records = []
+    for v in vectors:
+        if isinstance(v, dict):
+            records.append((v["id"], v["values"], v.get("metadata") or {}))
+        else:
+            records.append((v[0], v[1], v[2] if len(v) > 2 else {}))
+    return records
+
+
+def _matches_filter(metadata: Dict[str, Any], flt: Optional[Dict[str, Any]]) -> bool:
+    """Equality and $eq/$in filters, which is all the app issues."""
+    if not flt:
+        return True
+    for field, cond in flt.items():
+        value = metadata.get(field)
+        if isinstance(cond, dict):
+            if "$eq" in cond and value != cond["$eq"]:
+                return False
+            if "$in" in cond and value not in cond["$in"]:
+                return False
+        elif value != cond:
+            return False
+    return True
+
+
+class _Namespace:
+    def __init__(self, dimension: int, compression: str, codec_options: Optional[Dict[str, Any]] = None):
+        self.ids: List[str] = []
+        self.positions: Dict[str, int] = {}
+        self.metadata: List[Dict[str, Any]] = []
+        self.codec = make_codec(compression, dimension, **(codec_options or {}))
+        # Codecs that need training (PQ) store float32 until they have enough data
+        self.active: VectorCodec = self.codec if self.codec.trained else make_codec("float32", dimension)
+        self.codes = self.active.empty()
+
+    def upsert(self, records: List[tuple]) -> None:
+        if not records:
+            return
+        # Last write wins for ids repeated within one batch
+        records = list({r[0]: r for r in records}.values())
+        encoded = self.active.encode(np.stack([np.asarray(r[1], dtype=np.float32) for r in records]))
+        new_rows = []
+        for row, (vid, _, meta) in enumerate(records):
+            if vid in self.positions:
+                pos = self.positions[vid]
+                for array, values in zip(self.codes, encoded):
+                    array[pos] = values[row]
+                self.metadata[pos] = dict(meta)
+            else:
+                self.positions[vid] = len(self.ids)
+                self.ids.append(vid)
+                self.metadata.append(dict(meta))
+                new_rows.append(row)
+        if new_rows:
+            self.codes = tuple(np.concatenate([a, e[new_rows]]) for a, e in zip(self.codes, encoded))
+        if self.active is not self.codec and len(self.ids) >= getattr(self.codec, "train_size", 0):
+            vectors = self.active.decode(self.codes)
+            self.codes = self.codec.fit(vectors).encode(vectors)
+            self.active = self.codec
+
+    def values(self, pos: int) -> List[float]:
+        return self.active.decode(tuple(a[pos:pos + 1] for a in self.codes))[0].tolist()
+
+    def nbytes(self) -> int:
+        return self.active.nbytes(self.codes)
+
+    def delete(self, ids: Iterable[str]) -> None:
+        drop = {self.positions[i] for i in ids if i in self.positions}
+        if not drop:
+            return
+        keep = [p for p in range(len(self.ids)) if p not in drop]
+        self.ids = [self.ids[p] for p in keep]
+        self.metadata = [self.metadata[p] for p in keep]
+        self.codes = tuple(a[keep] for a in self.codes)
+        self.positions = {vid: p for p, vid in enumerate(self.ids)}
+
+
+class LocalIndex:
+    """Pinecone `Index` look-alike backed by NumPy arrays."""
+
+    def __init__(self, name: str, dimension: int = 384, latency: float = 0.0,
+                 compression: str = LOCAL_VECTOR_COMPRESSION, codec_options: Optional[Dict[str, Any]] = None):
+        self.name = name
+        self.dimension = dimension
+        self.latency = latency
+        self.compression = compression
+        self.codec_options = codec_options
+        self.namespaces: Dict[str, _Namespace] = {}
+        self._lock = threading.RLock()
+
+    def _ns(self, namespace: Optional[str]) -> _Namespace:
+        key = namespace or ""
+        if key not in self.namespaces:
+            self.namespaces[key] = _Namespace(self.dimension, self.compression, self.codec_options)
+        return self.namespaces[key]
+
+    def _delay(self) -> None:
+        if self.latency:
+            time.sleep(self.latency)
+
+    def upsert(self, vectors: Any, namespace: Optional[str] = None, **_) -> Dict[str, int]:
+        self._delay()
+        records = _as_records(vectors)
+        with self._lock:
+            self._ns(namespace).upsert(records)
+        return {"upserted_count": len(records)}
+
+    def query(
+        self,
+        vector: List[float],
+        top_k: int = 10,
+        namespace: Optional[str] = None,
+        filter: Optional[Dict[str, Any]] = None,
+        include_metadata: bool = False,
+        include_values: bool = False,
+        **_
+    ) -> SimpleNamespace:
+        self._delay()
+        with self._lock:
+            ns = self._ns(namespace)
+            codec, codes, ids, metadata = ns.active, ns.codes, list(ns.ids), list(ns.metadata)
+        if not ids:
+            return SimpleNamespace(matches=[], namespace=namespace or "")
+
+        scores = codec.scores(codes, np.asarray(vector, dtype=np.float32))
+        if filter:
+            allowed = np.array([_matches_filter(m, filter) for m in metadata])
+            scores = np.where(allowed, scores, -np.inf)
+        k = min(top_k, len(ids))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        matches = [
+            SimpleNamespace(
+                id=ids[i],
+                score=float(scores[i]),
+                metadata=metadata[i] if include_metadata else None,
+                values=codec.decode(tuple(a[i:i + 1] for a in codes))[0].tolist() if include_values else None,
+            )
+            for i in top if np.isfinite(scores[i])
+        ]
+        return SimpleNamespace(matches=matches, namespace=namespace or "")
+
+    def fetch(self, ids: List[str], namespace: Optional[str] = None, **_) -> SimpleNamespace:
+        self._delay()
+        with self._lock:
+            ns = self._ns(namespace)
+            found = {
+                vid: SimpleNamespace(id=vid, values=ns.values(ns.positions[vid]),
+                                     metadata=ns.metadata[ns.positions[vid]])
+                for vid in ids if vid in ns.positions
+            }
+        return SimpleNamespace(vectors=found, namespace=namespace or "")
+
+    def update(self, id: str, values: Optional[List[float]] = None, set_metadata: Optional[Dict[str, Any]] = None,
+               namespace: Optional[str] = None, **_) -> Dict:
+        """Overwrite a vector's values and/or merge fields into its metadata."""
+        self._delay()
+        with self._lock:
+            ns = self._ns(namespace)
+            if id not in ns.positions:
+                return {}
+            pos = ns.positions[id]
+            metadata = {**ns.metadata[pos], **(set_metadata or {})}
+            ns.upsert([(id, values if values is not None else ns.values(pos), metadata)])
+        return {}
+
+    def delete(self, ids: Optional[List[str]] = None, namespace: Optional[str] = None,
+               delete_all: bool = False, **_) -> Dict:
+        self._delay()
+        with self._lock:
+            if delete_all:
+                self.namespaces.pop(namespace or "", None)
+            else:
+                self._ns(namespace).delete(ids or [])
+        return {}
+
+    def list(self, namespace: Optional[str] = None, limit: int = 100, prefix: Optional[str] = None, **_):
+        """Yield pages of ids, optionally only those starting with `prefix`, like the serverless Pinecone `Index.list`."""
+        with self._lock:
+            ids = [vid for vid in self._ns(namespace).ids if prefix is None or vid.startswith(prefix)]
+        for start in range(0, len(ids), limit):
+            yield ids[start:start + limit]
+
+    def describe_index_stats(self, **_) -> SimpleNamespace:
+        with self._lock:
+            namespaces = {
+                k: SimpleNamespace(vector_count=len(v.ids), vector_bytes=v.nbytes())
+                for k, v in self.namespaces.items()
+            }
+        return SimpleNamespace(
+            dimension=self.dimension,
+            namespaces=namespaces,
+            total_vector_count=sum(n.vector_count for n in namespaces.values()),
+        )
+
+
+class LocalPineconeClient:
+    """Pinecone client look-alike that hands out process-wide LocalIndex objects."""
+
+    def __init__(self, latency: float = 0.0, compression: str = LOCAL_VECTOR_COMPRESSION,
+                 snapshot_dir: Optional[str] = LOCAL_SNAPSHOT_DIR):
+        self.latency = latency
+        self.compression = compression
+        self.snapshot_dir = snapshot_dir
+        self.indexes: Dict[str, LocalIndex] = {}
+        self._lock = threading.Lock()
+
+    def list_indexes(self) -> List[SimpleNamespace]:
+        return [SimpleNamespace(name=name, dimension=idx.dimension) for name, idx in self.indexes.items()]
+
+    def create_index(self, name: str, dimension: int = 384, **_) -> None:
+        with self._lock:
+            if name in self.indexes:
+                return
+            index = LocalIndex(name, dimension, latency=self.latency, compression=self.compression)
+            snapshot = os.path.join(self.snapshot_dir, name) if self.snapshot_dir else None
+            if snapshot and os.path.exists(os.path.join(snapshot, "manifest.json")):
+                from snapshot import restore_snapshot
+                # Latency injection is for serving benchmarks, not bootstrapping
+                index.latency = 0.0
+                # Upserts serialize on the index lock and copy the arrays; fewer, bigger batches win
+                restore_snapshot(snapshot, index, workers=1, batch_size=10000)
+                index.latency = self.latency
+            self.indexes[name] = index
+
+    def describe_index(self, name: str) -> SimpleNamespace:
+        return SimpleNamespace(name=name, status={"ready": name in self.indexes})
+
+    def Index(self, name: str, **_) -> LocalIndex:
+        self.create_index(name)
+        return self.indexes[name]
+
+
+class LocalVectorStoreIndex:
+    """Holder with the same `pinecone_index` attribute `chatbot.load_index` sets."""
+
+    def __init__(self, pinecone_index: LocalIndex):
+        self.pinecone_index = pinecone_index
+        self.index_name = pinecone_index.name
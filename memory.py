@@ -0,0 +1,237 @@
+from __future__ import annotations
+
+import os
+import logging
+import re
+import threading
+from collections import deque
+from typing import TYPE_CHECKING, Any, Deque, Dict, List, Optional
+
+import metrics
+
+if TYPE_CHECKING:
+    from google.genai import types
+
+logger = logging.getLogger(__name__)
+
+# Turns kept verbatim; anything older is folded into the rolling summary
+MEMORY_MAX_TURNS = int(os.getenv("MEMORY_MAX_TURNS", 4))
+# Upper bound on the rolling summary, in characters (~4 characters per token)
+MEMORY_SUMMARY_CHARS = int(os.getenv("MEMORY_SUMMARY_CHARS", 2000))
+# "extractive" (local, free) or "gemini" (re-summarize once the cap is hit)
+MEMORY_SUMMARIZER = os.getenv("MEMORY_SUMMARIZER", "extractive")
+# Deadline for one Gemini re-summarization, in seconds
+MEMORY_SUMMARY_DEADLINE_SECONDS = float(os.getenv("MEMORY_SUMMARY_DEADLINE_SECONDS", 10))
+# Per-turn input token counts kept on a session (older turns only add to the total)
+MEMORY_USAGE_TURNS = int(os.getenv("MEMORY_USAGE_TURNS", 32))
+
+SUMMARY_PREFIX = "Summary of the earlier conversation:\n"
+SUMMARIZE_PROMPT = """Summarize this conversation between a user and the Seattle University
+assistant in at most {limit} characters. Keep the topics, programs, dates and facts
+the user may refer back to.
+
+{summary}"""
+
+# Matches the layout produced by chatbot.build_prompt
+_PROMPT_QUERY = re.compile(r"^User Query: (.*?)\n\nRelevant Context:\n", re.DOTALL)
+
+
+def strip_retrieved_context(prompt: str) -> str:
+    """Return only the user's question from a `build_prompt` style prompt."""
+    match = _PROMPT_QUERY.match(prompt)
+    return match.group(1) if match else prompt
+
+
+def _first_sentences(text: str, limit: int) -> str:
+    text = re.sub(r"\s+", " ", text).strip()
+    if len(text) <= limit:
+        return text
+    cut = text[:limit]
+    end = cut.rfind(". ")
+    return (cut[:end + 1] if end > limit // 3 else cut.rstrip()) + " …"
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count used when the API does not report usage."""
+    return max(1, len(text) // 4)
+
+
+class BoundedChatSession:
+    """
+    Gemini chat session with a bounded memory.
+
+    Exposes `send_message(prompt)` like the SDK chat object, but rebuilds the
+    request each turn from: a rolling summary of old turns, the last
+    `max_turns` turns verbatim without their retrieved context, and the
+    current prompt (the only one that carries retrieved context). Input size
+    therefore stays flat no matter how long the chat gets.
+
+    Memory changes are serialized per session, so concurrent messages to one
+    chat can't interleave their updates. A Gemini re-summarization runs
+    outside the lock (one at a time per session) and is swapped in afterwards,
+    so the chat is never blocked on it. `client` is a GenerationClient, which
+    gives that call its deadline and the shared circuit breaker.
+    """
+
+    def __init__(
+        self,
+        client: Any,
+        model: str,
+        config: types.GenerateContentConfig,
+        max_turns: int = MEMORY_MAX_TURNS,
+        summary_chars: int = MEMORY_SUMMARY_CHARS
+    ):
+        self.client = client
+        self.model = model
+        self.config = config
+        self.max_turns = max_turns
+        self.summary_chars = summary_chars
+        self.summary = ""
+        self.turns: List[Dict[str, str]] = []
+        self.turn_count = 0
+        # Input tokens of the most recent turns, and of all turns so far
+        self.input_tokens: Deque[int] = deque(maxlen=MEMORY_USAGE_TURNS)
+        self.total_input_tokens = 0
+        self._lock = threading.Lock()
+        # Set while a Gemini re-summarization is in flight
+        self._compacting = False
+
+    def seed(self, history: List[Dict[str, Any]]) -> None:
+        """Rebuild memory from Firestore chat entries (see `utils.get_chat_history`)."""
+        pending_user = None
+        to_compact = None
+        with self._lock:
+            for entry in history:
+                if "user" in entry:
+                    pending_user = entry["user"]
+                elif "assistant" in entry and pending_user is not None:
+                    to_compact = self._remember(pending_user, entry["assistant"]) or to_compact
+                    pending_user = None
+        self._compact(to_compact)
+
+    @property
+    def is_empty(self) -> bool:
+        """True until the first turn, i.e. answers do not depend on this session yet."""
+        return not self.turns and not self.summary
+
+    def _build_contents(self, prompt: str, with_history: bool = True) -> List[types.Content]:
+        from google.genai import types
+
+        contents = []
+        if with_history and self.summary:
+            contents.append(types.Content(role="user", parts=[types.Part(text=SUMMARY_PREFIX + self.summary)]))
+            contents.append(types.Content(role="model", parts=[types.Part(text="Understood.")]))
+        for turn in self.turns if with_history else []:
+            contents.append(types.Content(role="user", parts=[types.Part(text=turn["user"])]))
+            contents.append(types.Content(role="model", parts=[types.Part(text=turn["assistant"])]))
+        contents.append(types.Content(role="user", parts=[types.Part(text=prompt)]))
+        return contents
+
+    def _fold(self, turn: Dict[str, str]) -> Optional[str]:
+        """
+        Add `turn` to the summary (session lock held). Returns the summary text
+        to re-summarize with `_compact` once it is over the cap, else None.
+        """
+        line = f"- User asked: {_first_sentences(turn['user'], 200)} " \
+               f"Assistant: {_first_sentences(turn['assistant'], 300)}"
+        self.summary = f"{self.summary}\n{line}".strip()
+        if len(self.summary) <= self.summary_chars:
+            return None
+        if MEMORY_SUMMARIZER == "gemini":
+            if self._compacting:
+                # The running compaction picks this line up when it swaps in
+                return None
+            self._compacting = True
+            return self.summary
+        self._truncate_summary()
+        return None
+
+    def _truncate_summary(self) -> None:
+        # Drop the oldest summary lines until it fits again
+        lines = self.summary.split("\n")
+        while len(lines) > 1 and len("\n".join(lines)) > self.summary_chars:
+            lines.pop(0)
+        self.summary = "\n".join(lines)[-self.summary_chars:]
+
+    def _compact(self, text: Optional[str]) -> None:
+        """
+        Re-summarize `text` (a snapshot of the summary) with Gemini without
+        holding the session lock, then swap the result in, keeping any lines
+        folded in meanwhile. Falls back to truncation if the call fails.
+        """
+        while text is not None:
+            compacted = None
+            try:
+                resp = self.client.models.generate_content(
+                    model=self.model,
+                    contents=SUMMARIZE_PROMPT.format(limit=self.summary_chars // 2, summary=text),
+                    deadline=MEMORY_SUMMARY_DEADLINE_SECONDS,
+                )
+                compacted = (resp.text or "").strip()[:self.summary_chars] or None
+            except Exception as e:
+                logger.warning(f"Summary compaction failed, truncating instead: {e}")
+            with self._lock:
+                if compacted is not None and self.summary.startswith(text):
+                    self.summary = f"{compacted}\n{self.summary[len(text):].strip()}".strip()
+                if compacted is not None and len(self.summary) > self.summary_chars:
+                    # Turns folded during the call pushed it over again
+                    text = self.summary
+                else:
+                    if len(self.summary) > self.summary_chars:
+                        self._truncate_summary()
+                    self._compacting = False
+                    text = None
+
+    def remember(self, user_message: str, reply: str) -> None:
+        """Record a turn answered outside `send_message` (e.g. a shared, stateless answer)."""
+        with self._lock:
+            to_compact = self._remember(user_message, reply)
+        self._compact(to_compact)
+
+    def _remember(self, user_message: str, reply: str) -> Optional[str]:
+        # Called with the session lock held; returns the summary to `_compact`, if any
+        self.turns.append({"user": user_message, "assistant": reply})
+        self.turn_count += 1
+        to_compact = None
+        while len(self.turns) > self.max_turns:
+            to_compact = self._fold(self.turns.pop(0)) or to_compact
+        return to_compact
+
+    def send_message(self, prompt: str, user_message: Optional[str] = None, stateless: bool = False) -> Any:
+        """
+        Send `prompt` (which may include retrieved context) and remember the turn.
+
+        Args:
+            prompt: Full prompt for this turn, e.g. the output of `build_prompt`
+            user_message: The raw user text stored in memory; derived from the
+                prompt when omitted
+            stateless: Answer from the prompt alone, without the conversation
+                so far, and do not remember the turn
+        """
+        with self._lock:
+            contents = self._build_contents(prompt, with_history=not stateless)
+        response = self.client.models.generate_content(
+            model=self.model, contents=contents, config=self.config
+        )
+        self.record_usage(response, contents)
+        if not stateless:
+            with self._lock:
+                to_compact = self._remember(user_message or strip_retrieved_context(prompt), response.text or "")
+            self._compact(to_compact)
+        return response
+
+    def record_usage(self, response: Any, contents: List[types.Content]) -> int:
+        """Track the input token count of one turn, preferring the API's own number."""
+        usage = getattr(response, "usage_metadata", None)
+        tokens = getattr(usage, "prompt_token_count", None)
+        if not tokens:
+            tokens = sum(estimate_tokens(p.text or "") for c in contents for p in c.parts)
+        with self._lock:
+            self.input_tokens.append(tokens)
+            self.total_input_tokens += tokens
+        turn_label = str(self.turn_count + 1) if self.turn_count < 10 else "10+"
+        metrics.observe("chat_input_tokens", tokens, turn=turn_label)
+        output_tokens = getattr(usage, "candidates_token_count", None)
+        if output_tokens:
+            metrics.observe("chat_output_tokens", output_tokens)
+        return tokens
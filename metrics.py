@@ -0,0 +1,236 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+import uuid
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, List, Optional, Tuple
+
+# Process-wide, in-memory metrics. Every series is identified by its name plus
+# a sorted tuple of label pairs, e.g. ("retrieval_hits_total", (("query_kind", "raw"),)).
+_lock = threading.Lock()
+_counters: Dict[Tuple[str, tuple], float] = defaultdict(float)
+_summaries: Dict[Tuple[str, tuple], List[float]] = {}
+_histograms: Dict[Tuple[str, tuple], List[int]] = {}
+# Raw observations, only kept while `record_samples(True)` is on (benchmarks)
+_samples: Optional[Dict[Tuple[str, tuple], deque]] = None
+_samples_maxlen = 100000
+
+# Histogram buckets are chosen by name suffix; other observations are plain summaries
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384, 32768)
+_BUCKETS_BY_SUFFIX = {"_seconds": LATENCY_BUCKETS, "_tokens": TOKEN_BUCKETS}
+
+# Trace id of the request being handled on this thread/context, if any
+trace_id: contextvars.ContextVar[str] = contextvars.ContextVar("trace_id", default="-")
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple[str, tuple]:
+    return name, tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _buckets_for(name: str) -> Optional[tuple]:
+    for suffix, buckets in _BUCKETS_BY_SUFFIX.items():
+        if name.endswith(suffix):
+            return buckets
+    return None
+
+
+def inc(name: str, value: float = 1.0, **labels) -> None:
+    """Increment a counter series."""
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] += value
+
+
+def observe(name: str, value: float, **labels) -> None:
+    """
+    Record one observation. Every series keeps count/sum/max; names ending in
+    `_seconds` or `_tokens` also get histogram buckets.
+    """
+    key = _key(name, labels)
+    buckets = _buckets_for(name)
+    with _lock:
+        summary = _summaries.get(key)
+        if summary is None:
+            _summaries[key] = [1, value, value]
+        else:
+            summary[0] += 1
+            summary[1] += value
+            if value > summary[2]:
+                summary[2] = value
+        if buckets is not None:
+            counts = _histograms.get(key)
+            if counts is None:
+                counts = _histograms[key] = [0] * (len(buckets) + 1)
+            counts[bisect.bisect_left(buckets, value)] += 1
+        if _samples is not None:
+            series = _samples.get(key)
+            if series is None:
+                series = _samples[key] = deque(maxlen=_samples_maxlen)
+            series.append(value)
+
+
+def record_samples(enabled: bool = True, maxlen: int = 100000) -> None:
+    """Keep (or stop keeping) raw observations so exact percentiles can be computed."""
+    global _samples, _samples_maxlen
+    with _lock:
+        _samples_maxlen = maxlen
+        _samples = {} if enabled else None
+
+
+def samples(name: str) -> Dict[tuple, List[float]]:
+    """Raw observations of every series called `name`, keyed by its label tuple."""
+    with _lock:
+        if _samples is None:
+            return {}
+        return {labels: list(values) for (n, labels), values in _samples.items() if n == name}
+
+
+@contextmanager
+def timer(stage: str, **labels):
+    """Time a block as one `stage_latency_seconds{stage=...}` observation."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe("stage_latency_seconds", time.perf_counter() - started, stage=stage, **labels)
+
+
+def timed(stage: str):
+    """Decorator form of `timer`."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def get_counter(name: str, **labels) -> float:
+    """Return the current value of a counter series (0 if never incremented)."""
+    with _lock:
+        return _counters.get(_key(name, labels), 0.0)
+
+
+def ratio(numerator: str, denominator: str, **labels) -> float | None:
+    """Return numerator/denominator for two counters sharing the same labels."""
+    den = get_counter(denominator, **labels)
+    if not den:
+        return None
+    return get_counter(numerator, **labels) / den
+
+
+def quantile(name: str, q: float, **labels) -> float | None:
+    """Estimate a quantile from histogram buckets (upper bound of the matching bucket)."""
+    key = _key(name, labels)
+    buckets = _buckets_for(name)
+    with _lock:
+        counts = list(_histograms.get(key, ()))
+    if not counts or buckets is None:
+        return None
+    target, seen = q * sum(counts), 0
+    for bound, count in zip(buckets + (float("inf"),), counts):
+        seen += count
+        if seen >= target:
+            return bound
+    return None
+
+
+def cache_hit_rates() -> Dict[str, float]:
+    """Hit rate per cache from the `cache_requests_total` counters."""
+    totals: Dict[str, List[float]] = defaultdict(lambda: [0.0, 0.0])
+    with _lock:
+        for (name, labels), value in _counters.items():
+            if name != "cache_requests_total":
+                continue
+            label_map = dict(labels)
+            totals[label_map.get("cache", "")][label_map.get("result") == "hit"] += value
+    return {cache: hit / (hit + miss) for cache, (miss, hit) in totals.items() if hit + miss}
+
+
+def _series_name(name: str, labels: tuple) -> str:
+    if not labels:
+        return name
+    return name + "{" + ",".join(f'{k}="{v}"' for k, v in labels) + "}"
+
+
+def snapshot() -> Dict[str, Any]:
+    """Return a JSON-serializable copy of every counter and summary."""
+    with _lock:
+        counters = {_series_name(n, l): v for (n, l), v in _counters.items()}
+        summaries = {
+            _series_name(n, l): {"count": c, "sum": s, "max": m, "avg": s / c}
+            for (n, l), (c, s, m) in _summaries.items()
+        }
+    return {"counters": counters, "summaries": summaries, "cache_hit_rates": cache_hit_rates()}
+
+
+def render_prometheus() -> str:
+    """Render every series in the Prometheus text exposition format."""
+    with _lock:
+        counters = sorted(_counters.items())
+        summaries = sorted(_summaries.items())
+        histograms = dict(_histograms)
+
+    lines, maxima, typed = [], [], set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            lines.append(f"# TYPE {name} counter")
+            typed.add(name)
+        lines.append(f"{_series_name(name, labels)} {value}")
+
+    for (name, labels), (count, total, maximum) in summaries:
+        counts = histograms.get((name, labels))
+        if name not in typed:
+            lines.append(f"# TYPE {name} {'histogram' if counts else 'summary'}")
+            typed.add(name)
+        if counts:
+            cumulative = 0
+            for bound, bucket_count in zip(_buckets_for(name) + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{_series_name(name + '_bucket', labels + (('le', le),))} {cumulative}")
+        lines.append(f"{_series_name(name + '_sum', labels)} {total}")
+        lines.append(f"{_series_name(name + '_count', labels)} {count}")
+        if name + "_max" not in typed:
+            maxima.append(f"# TYPE {name}_max gauge")
+            typed.add(name + "_max")
+        maxima.append(f"{_series_name(name + '_max', labels)} {maximum}")
+    return "\n".join(lines + maxima) + "\n"
+
+
+def reset() -> None:
+    """Drop every recorded series (used by benchmarks and tests)."""
+    with _lock:
+        _counters.clear()
+        _summaries.clear()
+        _histograms.clear()
+        if _samples is not None:
+            _samples.clear()
+
+
+def new_trace_id(incoming: Optional[str] = None) -> str:
+    """Set (and return) the trace id for the current request context."""
+    value = (incoming or uuid.uuid4().hex[:16])[:64]
+    trace_id.set(value)
+    return value
+
+
+class TraceIdFilter(logging.Filter):
+    """Adds `record.trace_id` so log formats can include `%(trace_id)s`."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = trace_id.get()
+        return True
+
+
+def install_trace_logging(fmt: str = "%(levelname)s:%(name)s:[%(trace_id)s] %(message)s") -> None:
+    """Prefix every log line from the root handlers with the current trace id."""
+    for handler in logging.getLogger().handlers:
+        handler.addFilter(TraceIdFilter())
+        handler.setFormatter(logging.Formatter(fmt))
@@ -0,0 +1,240 @@
+"""
+Compact storage for embedding vectors: float16, int8 with per-vector scales,
+and product quantization (PQ) searched with asymmetric distance computation.
+
+Each codec turns an (n, dim) float32 matrix into a tuple of arrays whose first
+axis is n (so rows can be appended, overwritten and dropped uniformly) and
+scores a float32 query against those arrays with cosine similarity, in
+NumPy, without decoding the whole matrix at once. Lossy codecs store unit
+vectors plus the original norm, so `decode` gives back approximate originals.
+
+See benchmarks/eval_compression.py for the measured recall-vs-memory tradeoff.
+"""
+import os
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+# Rows scored per NumPy call, bounding the temporary float32 copy of the codes
+SCORE_BLOCK_ROWS = 32768
+# PQ defaults: 48 sub-spaces of 8 dims for 384-dim MiniLM vectors, 256 centroids each
+PQ_SUBSPACES = int(os.getenv("PQ_SUBSPACES", 48))
+PQ_TRAIN_SIZE = int(os.getenv("PQ_TRAIN_SIZE", 2048))
+
+Codes = Tuple[np.ndarray, ...]
+
+
+def _unit(vectors: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    norms = np.linalg.norm(vectors, axis=1).astype(np.float32)
+    return vectors / np.where(norms == 0, 1.0, norms)[:, None], norms
+
+
+def _unit_query(query: np.ndarray) -> np.ndarray:
+    q = np.asarray(query, dtype=np.float32)
+    return q / (np.linalg.norm(q) or 1.0)
+
+
+class VectorCodec:
+    """Uncompressed float32 storage; also the interface the other codecs implement."""
+
+    name = "float32"
+
+    def __init__(self, dimension: int):
+        self.dimension = dimension
+
+    @property
+    def trained(self) -> bool:
+        return True
+
+    def fit(self, vectors: np.ndarray) -> "VectorCodec":
+        return self
+
+    def empty(self) -> Codes:
+        return self.encode(np.zeros((0, self.dimension), dtype=np.float32))
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        return (np.asarray(vectors, dtype=np.float32),)
+
+    def decode(self, codes: Codes) -> np.ndarray:
+        return codes[0]
+
+    def scores(self, codes: Codes, query: np.ndarray) -> np.ndarray:
+        vectors = codes[0]
+        q = np.asarray(query, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1) * (np.linalg.norm(q) or 1.0)
+        return vectors @ q / np.where(norms == 0, 1.0, norms)
+
+    def nbytes(self, codes: Codes) -> int:
+        """Bytes held by `codes` plus any shared codebook."""
+        return sum(a.nbytes for a in codes) + self.codebook_bytes()
+
+    def codebook_bytes(self) -> int:
+        return 0
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """Arrays needed to rebuild a trained codec (see `make_codec`)."""
+        return {}
+
+
+class Float16Codec(VectorCodec):
+    name = "float16"
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        unit, norms = _unit(np.asarray(vectors, dtype=np.float32))
+        return unit.astype(np.float16), norms
+
+    def decode(self, codes: Codes) -> np.ndarray:
+        unit, norms = codes
+        return unit.astype(np.float32) * norms[:, None]
+
+    def scores(self, codes: Codes, query: np.ndarray) -> np.ndarray:
+        unit, _ = codes
+        q = _unit_query(query)
+        out = np.empty(len(unit), dtype=np.float32)
+        for start in range(0, len(unit), SCORE_BLOCK_ROWS):
+            block = unit[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ q
+        return out
+
+
+class Int8Codec(VectorCodec):
+    """Symmetric scalar quantization of each unit vector with its own scale."""
+
+    name = "int8"
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        unit, norms = _unit(np.asarray(vectors, dtype=np.float32))
+        scales = (np.abs(unit).max(axis=1) / 127.0).astype(np.float32) if len(unit) else np.zeros(0, np.float32)
+        safe = np.where(scales == 0, 1.0, scales)[:, None]
+        codes = np.clip(np.rint(unit / safe), -127, 127).astype(np.int8)
+        return codes, scales, norms
+
+    def decode(self, codes: Codes) -> np.ndarray:
+        q, scales, norms = codes
+        return q.astype(np.float32) * (scales * norms)[:, None]
+
+    def scores(self, codes: Codes, query: np.ndarray) -> np.ndarray:
+        q8, scales, _ = codes
+        q = _unit_query(query)
+        out = np.empty(len(q8), dtype=np.float32)
+        for start in range(0, len(q8), SCORE_BLOCK_ROWS):
+            block = q8[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = block.astype(np.float32) @ q
+        return out * scales
+
+
+def _kmeans(data: np.ndarray, k: int, iterations: int, rng: np.random.Generator) -> np.ndarray:
+    """Plain Lloyd's k-means; empty clusters are re-seeded from random points."""
+    centroids = data[rng.choice(len(data), size=k, replace=len(data) < k)].copy()
+    for _ in range(iterations):
+        assign = _nearest(data, centroids)
+        counts = np.bincount(assign, minlength=k)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assign, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), size=int(empty.sum()))]
+    return centroids
+
+
+def _nearest(data: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    # ||x - c||^2 without the constant ||x||^2 term
+    distances = (centroids ** 2).sum(axis=1)[None, :] - 2.0 * data @ centroids.T
+    return distances.argmin(axis=1)
+
+
+class PQCodec(VectorCodec):
+    """
+    Product quantization: each unit vector is split into `subspaces` chunks and
+    each chunk stored as the index of its nearest of 256 trained centroids, so
+    a 384-dim vector costs `subspaces` bytes. Queries are scored with
+    asymmetric distance computation: the raw query is compared with every
+    centroid once, then each stored vector's score is a sum of table lookups.
+    """
+
+    name = "pq"
+    centroids_per_subspace = 256
+
+    def __init__(self, dimension: int, subspaces: int = PQ_SUBSPACES, train_size: int = PQ_TRAIN_SIZE,
+                 iterations: int = 15, seed: int = 0):
+        super().__init__(dimension)
+        if dimension % subspaces:
+            raise ValueError(f"dimension {dimension} is not divisible by {subspaces} PQ subspaces")
+        self.subspaces = subspaces
+        self.sub_dim = dimension // subspaces
+        self.train_size = train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.codebook: Optional[np.ndarray] = None  # (subspaces, 256, sub_dim)
+
+    @property
+    def trained(self) -> bool:
+        return self.codebook is not None
+
+    def fit(self, vectors: np.ndarray) -> "PQCodec":
+        rng = np.random.default_rng(self.seed)
+        unit, _ = _unit(np.asarray(vectors, dtype=np.float32))
+        if len(unit) > 20 * self.train_size:
+            unit = unit[rng.choice(len(unit), size=20 * self.train_size, replace=False)]
+        sub = unit.reshape(len(unit), self.subspaces, self.sub_dim)
+        self.codebook = np.stack([
+            _kmeans(sub[:, j], self.centroids_per_subspace, self.iterations, rng) for j in range(self.subspaces)
+        ]).astype(np.float32)
+        return self
+
+    def encode(self, vectors: np.ndarray) -> Codes:
+        if self.codebook is None:
+            raise RuntimeError("PQ codec must be fit before encoding")
+        unit, norms = _unit(np.asarray(vectors, dtype=np.float32))
+        sub = unit.reshape(len(unit), self.subspaces, self.sub_dim)
+        codes = np.empty((len(unit), self.subspaces), dtype=np.uint8)
+        for j in range(self.subspaces):
+            codes[:, j] = _nearest(sub[:, j], self.codebook[j]) if len(unit) else 0
+        return codes, norms
+
+    def decode(self, codes: Codes) -> np.ndarray:
+        pq, norms = codes
+        parts = self.codebook[np.arange(self.subspaces)[None, :], pq.astype(np.intp)]
+        return parts.reshape(len(pq), self.dimension) * norms[:, None]
+
+    def scores(self, codes: Codes, query: np.ndarray) -> np.ndarray:
+        pq, _ = codes
+        q = _unit_query(query).reshape(self.subspaces, 1, self.sub_dim)
+        # (subspaces, 256) partial inner products, flattened for one gather per block
+        table = (self.codebook * q).sum(axis=2).ravel()
+        offsets = (np.arange(self.subspaces) * self.centroids_per_subspace).astype(np.intp)
+        out = np.empty(len(pq), dtype=np.float32)
+        for start in range(0, len(pq), SCORE_BLOCK_ROWS):
+            block = pq[start:start + SCORE_BLOCK_ROWS]
+            out[start:start + len(block)] = table[block.astype(np.intp) + offsets].sum(axis=1)
+        return out
+
+    def codebook_bytes(self) -> int:
+        return self.codebook.nbytes if self.codebook is not None else 0
+
+    def state(self) -> Dict[str, np.ndarray]:
+        return {"codebook": self.codebook} if self.codebook is not None else {}
+
+
+CODECS = {
+    "float32": VectorCodec,
+    "float16": Float16Codec,
+    "int8": Int8Codec,
+    "pq": PQCodec,
+}
+
+
+def make_codec(name: Optional[str], dimension: int, state: Optional[Dict[str, np.ndarray]] = None,
+               **options) -> VectorCodec:
+    """Build a codec by name ("none" means float32), restoring a trained `state`."""
+    name = (name or "float32").lower()
+    if name == "none":
+        name = "float32"
+    if name not in CODECS:
+        raise ValueError(f"Unknown vector compression: {name} (choose from {', '.join(CODECS)})")
+    codec = CODECS[name](dimension, **options)
+    if state and "codebook" in state:
+        codec.codebook = np.asarray(state["codebook"], dtype=np.float32)
+        codec.subspaces, _, codec.sub_dim = codec.codebook.shape
+    return codec
@@ -0,0 +1,332 @@
+"""
+Snapshots of a vector index, for standing up an environment without
+re-embedding anything.
+
+A snapshot is a directory holding a `manifest.json` and one compressed .npz
+shard per SHARD_SIZE vectors of a namespace. Each shard stores the ids, the
+vectors (float32, or float16/int8 codes from quantization.py) and the
+metadata as JSON. The manifest lists the namespaces, their shards and every
+shard's SHA-256, and carries a checksum over all of them. Restores verify the
+checksums and upsert in parallel into Pinecone or the local backend.
+
+    python snapshot.py export --index su-rag-doc --out snapshots/su-rag-doc
+    python snapshot.py restore snapshots/su-rag-doc --index su-rag-doc --workers 8
+    python snapshot.py verify snapshots/su-rag-doc
+
+With VECTOR_BACKEND=local, LOCAL_SNAPSHOT_DIR=<dir> restores
+<dir>/<index name> into each local index when it is first created.
+"""
+import os
+import hashlib
+import io
+import json
+import logging
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from quantization import make_codec
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_FORMAT = 1
+MANIFEST = "manifest.json"
+SHARD_SIZE = int(os.getenv("SNAPSHOT_SHARD_SIZE", 10000))
+# Pinecone fetches ids in the query string; keep requests short
+FETCH_BATCH = 100
+# Well under Pinecone's 2 MB / 1000 vector upsert limits with text metadata
+UPSERT_BATCH = 200
+# PQ needs a trained codebook per index, which a shard-at-a-time restore can't use
+SNAPSHOT_CODECS = ("float32", "float16", "int8")
+
+
+def _file_name(ordinal: int, namespace: str, shard: int) -> str:
+    # The ordinal keeps namespaces that sanitize to the same name apart
+    safe = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in namespace) or "__default__"
+    return f"{ordinal:03d}-{safe}-{shard:05d}.npz"
+
+
+def _sha256(data: bytes) -> str:
+    return hashlib.sha256(data).hexdigest()
+
+
+def _json_array(value: Any) -> np.ndarray:
+    return np.frombuffer(json.dumps(value, ensure_ascii=False).encode("utf-8"), dtype=np.uint8)
+
+
+def _namespaces(index: Any) -> Dict[str, int]:
+    stats = index.describe_index_stats()
+    namespaces = stats.namespaces if hasattr(stats, "namespaces") else stats["namespaces"]
+    return {
+        name: (summary.vector_count if hasattr(summary, "vector_count") else summary["vector_count"])
+        for name, summary in namespaces.items()
+    }
+
+
+def _fetch(index: Any, ids: List[str], namespace: str) -> List[Tuple[str, List[float], Dict[str, Any]]]:
+    found = index.fetch(ids=ids, namespace=namespace).vectors
+    return [(vid, list(found[vid].values), dict(found[vid].metadata or {})) for vid in ids if vid in found]
+
+
+def _id_batches(index: Any, namespace: str) -> Iterator[List[str]]:
+    batch: List[str] = []
+    for page in index.list(namespace=namespace):
+        for vid in page:
+            batch.append(vid)
+            if len(batch) == FETCH_BATCH:
+                yield batch
+                batch = []
+    if batch:
+        yield batch
+
+
+def _fetch_rows(index: Any, namespace: str, pool: ThreadPoolExecutor, depth: int) -> Iterator[List[tuple]]:
+    """Fetched records in list order, with at most `depth` fetches in flight."""
+    pending: deque = deque()
+    for ids in _id_batches(index, namespace):
+        pending.append(pool.submit(_fetch, index, ids, namespace))
+        if len(pending) >= depth:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
+def _write_shard(path: str, name: str, rows: List[tuple], codec: Any) -> Dict[str, Any]:
+    ids = [r[0] for r in rows]
+    codes = codec.encode(np.asarray([r[1] for r in rows], dtype=np.float32))
+    buffer = io.BytesIO()
+    np.savez_compressed(
+        buffer,
+        ids=_json_array(ids),
+        metadata=_json_array([r[2] for r in rows]),
+        **{f"code{i}": array for i, array in enumerate(codes)},
+    )
+    data = buffer.getvalue()
+    with open(os.path.join(path, name), "wb") as f:
+        f.write(data)
+    return {"file": name, "vectors": len(rows), "bytes": len(data), "sha256": _sha256(data)}
+
+
+def export_index(
+    index: Any,
+    path: str,
+    namespaces: Optional[List[str]] = None,
+    compression: str = "float32",
+    shard_size: int = SHARD_SIZE,
+    workers: int = 4,
+    index_name: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Dump `index` (a Pinecone or LocalIndex) into the directory `path`.
+
+    Args:
+        namespaces: Namespaces to include; all of them by default
+        compression: float32 (exact), float16 or int8 vectors
+        shard_size: Vectors per shard file
+        workers: Parallel fetch requests
+
+    Returns:
+        The manifest, also written to `path`/manifest.json
+    """
+    if compression not in SNAPSHOT_CODECS:
+        raise ValueError(f"Snapshot compression must be one of {', '.join(SNAPSHOT_CODECS)}")
+    os.makedirs(path, exist_ok=True)
+    started = time.perf_counter()
+    counts = _namespaces(index)
+    stats = index.describe_index_stats()
+    dimension = stats.dimension if hasattr(stats, "dimension") else stats["dimension"]
+    codec = make_codec(compression, dimension)
+
+    manifest = {
+        "format": SNAPSHOT_FORMAT,
+        "index": index_name or getattr(index, "name", None),
+        "dimension": dimension,
+        "compression": compression,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "namespaces": {},
+    }
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot-fetch") as pool:
+        for ordinal, namespace in enumerate(namespaces if namespaces is not None else sorted(counts)):
+            shards, rows = [], []
+            for fetched in _fetch_rows(index, namespace, pool, depth=workers):
+                rows.extend(fetched)
+                while len(rows) >= shard_size:
+                    name = _file_name(ordinal, namespace, len(shards))
+                    shards.append(_write_shard(path, name, rows[:shard_size], codec))
+                    rows = rows[shard_size:]
+            if rows:
+                shards.append(_write_shard(path, _file_name(ordinal, namespace, len(shards)), rows, codec))
+            manifest["namespaces"][namespace] = {"vectors": sum(s["vectors"] for s in shards), "shards": shards}
+            logger.info(f"Exported namespace '{namespace}': {manifest['namespaces'][namespace]['vectors']} vectors")
+
+    manifest["total_vectors"] = sum(ns["vectors"] for ns in manifest["namespaces"].values())
+    manifest["checksum"] = _manifest_checksum(manifest)
+    manifest["export_seconds"] = time.perf_counter() - started
+    with open(os.path.join(path, MANIFEST), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def _manifest_checksum(manifest: Dict[str, Any]) -> str:
+    digests = [
+        f"{ns}:{shard['file']}:{shard['vectors']}:{shard['sha256']}"
+        for ns, entry in sorted(manifest["namespaces"].items()) for shard in entry["shards"]
+    ]
+    return _sha256("\n".join([str(manifest["dimension"]), manifest["compression"]] + digests).encode("utf-8"))
+
+
+def read_manifest(path: str) -> Dict[str, Any]:
+    with open(os.path.join(path, MANIFEST)) as f:
+        manifest = json.load(f)
+    if manifest.get("format") != SNAPSHOT_FORMAT:
+        raise ValueError(f"Unsupported snapshot format {manifest.get('format')} in {path}")
+    if manifest.get("checksum") != _manifest_checksum(manifest):
+        raise ValueError(f"Snapshot manifest checksum mismatch in {path}")
+    return manifest
+
+
+def load_shard(path: str, shard: Dict[str, Any], manifest: Dict[str, Any],
+               verify: bool = True) -> Tuple[List[str], np.ndarray, List[Dict[str, Any]]]:
+    """Read one shard as (ids, float32 vectors, metadata), checking its SHA-256."""
+    with open(os.path.join(path, shard["file"]), "rb") as f:
+        data = f.read()
+    if verify and _sha256(data) != shard["sha256"]:
+        raise ValueError(f"Checksum mismatch for {shard['file']}; the snapshot is corrupt")
+    with np.load(io.BytesIO(data)) as arrays:
+        ids = json.loads(arrays["ids"].tobytes().decode("utf-8"))
+        metadata = json.loads(arrays["metadata"].tobytes().decode("utf-8"))
+        codes = tuple(arrays[f"code{i}"] for i in range(sum(k.startswith("code") for k in arrays.files)))
+    vectors = make_codec(manifest["compression"], manifest["dimension"]).decode(codes)
+    return ids, np.asarray(vectors, dtype=np.float32), metadata
+
+
+def verify_snapshot(path: str) -> Dict[str, Any]:
+    """Check the manifest and every shard; raises ValueError on any mismatch."""
+    manifest = read_manifest(path)
+    for entry in manifest["namespaces"].values():
+        for shard in entry["shards"]:
+            with open(os.path.join(path, shard["file"]), "rb") as f:
+                if _sha256(f.read()) != shard["sha256"]:
+                    raise ValueError(f"Checksum mismatch for {shard['file']}; the snapshot is corrupt")
+    return manifest
+
+
+def restore_snapshot(
+    path: str,
+    index: Any,
+    namespace_map: Optional[Dict[str, str]] = None,
+    workers: int = 8,
+    batch_size: int = UPSERT_BATCH,
+    verify: bool = True
+) -> Dict[str, Any]:
+    """
+    Upsert every vector of the snapshot at `path` into `index`.
+
+    Shards are read (and checksummed) one at a time while up to `workers`
+    upsert batches from the previous shard are still in flight.
+
+    Args:
+        namespace_map: Snapshot namespace -> target namespace, for renames
+        workers: Parallel upsert requests
+        batch_size: Vectors per upsert request
+        verify: Check shard checksums before upserting
+
+    Returns:
+        {"vectors", "namespaces", "seconds", "vectors_per_second"}
+    """
+    manifest = read_manifest(path)
+    stats = index.describe_index_stats()
+    dimension = stats.dimension if hasattr(stats, "dimension") else stats["dimension"]
+    if dimension and dimension != manifest["dimension"]:
+        raise ValueError(f"Snapshot has {manifest['dimension']}-dim vectors, the index {dimension}")
+    namespace_map = namespace_map or {}
+    started = time.perf_counter()
+    restored: Dict[str, int] = {}
+
+    def upsert(records: List[tuple], namespace: str) -> int:
+        index.upsert(vectors=records, namespace=namespace)
+        return len(records)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="snapshot-upsert") as pool:
+        pending = []
+        for source, entry in manifest["namespaces"].items():
+            target = namespace_map.get(source, source)
+            for shard in entry["shards"]:
+                ids, vectors, metadata = load_shard(path, shard, manifest, verify=verify)
+                # Settle the previous shard before queueing this one, so at
+                # most two shards' worth of records are held at once
+                for future, namespace in pending:
+                    restored[namespace] = restored.get(namespace, 0) + future.result()
+                pending = [
+                    (pool.submit(upsert, [
+                        (ids[i], vectors[i].tolist(), metadata[i]) for i in range(start, min(start + batch_size, len(ids)))
+                    ], target), target)
+                    for start in range(0, len(ids), batch_size)
+                ]
+        for future, namespace in pending:
+            restored[namespace] = restored.get(namespace, 0) + future.result()
+
+    seconds = time.perf_counter() - started
+    total = sum(restored.values())
+    logger.info(f"Restored {total} vectors from {path} in {seconds:.1f}s")
+    return {
+        "vectors": total,
+        "namespaces": restored,
+        "seconds": seconds,
+        "vectors_per_second": total / seconds if seconds else None,
+    }
+
+
+def main():
+    import argparse
+    from chatbot import PINECONE_API_KEY, create_or_get_index, init_pinecone_client
+
+    parser = argparse.ArgumentParser(description="Export, verify and restore vector index snapshots.")
+    sub = parser.add_subparsers(dest="command", required=True)
+    export = sub.add_parser("export", help="Dump an index into a snapshot directory")
+    export.add_argument("--index", required=True)
+    export.add_argument("--out", required=True, help="Snapshot directory")
+    export.add_argument("--namespace", action="append", help="Only these namespaces (repeatable)")
+    export.add_argument("--compression", choices=SNAPSHOT_CODECS, default="float32")
+    export.add_argument("--shard-size", type=int, default=SHARD_SIZE)
+    export.add_argument("--workers", type=int, default=4)
+    restore = sub.add_parser("restore", help="Upsert a snapshot into an index (created if missing)")
+    restore.add_argument("path")
+    restore.add_argument("--index", help="Target index (default: the snapshot's source index)")
+    restore.add_argument("--map-namespace", action="append", default=[], metavar="OLD=NEW")
+    restore.add_argument("--workers", type=int, default=8)
+    restore.add_argument("--batch-size", type=int, default=UPSERT_BATCH)
+    verify = sub.add_parser("verify", help="Check a snapshot's checksums")
+    verify.add_argument("path")
+    args = parser.parse_args()
+
+    if args.command == "verify":
+        manifest = verify_snapshot(args.path)
+        print(f"OK: {manifest['total_vectors']} vectors in {len(manifest['namespaces'])} namespaces")
+        return
+
+    client = init_pinecone_client(PINECONE_API_KEY)
+    if args.command == "export":
+        manifest = export_index(client.Index(args.index), args.out, namespaces=args.namespace,
+                                compression=args.compression, shard_size=args.shard_size,
+                                workers=args.workers, index_name=args.index)
+        size = sum(s["bytes"] for ns in manifest["namespaces"].values() for s in ns["shards"])
+        print(f"Exported {manifest['total_vectors']} vectors ({size / 1e6:.1f} MB) "
+              f"in {manifest['export_seconds']:.1f}s to {args.out}")
+        return
+
+    manifest = read_manifest(args.path)
+    index_name = args.index or manifest["index"]
+    create_or_get_index(client, index_name, dimension=manifest["dimension"])
+    namespace_map = dict(pair.split("=", 1) for pair in args.map_namespace)
+    result = restore_snapshot(args.path, client.Index(index_name), namespace_map=namespace_map,
+                              workers=args.workers, batch_size=args.batch_size)
+    print(json.dumps(result, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,8 @@
 // src/pages/Chat.tsx
-import React, { useState, useEffect, useMemo } from 'react';
+import React, { useState, useEffect, useMemo, useRef, useCallback } from 'react';
 import {
   Box,
+  Button,
   CssBaseline,
   Paper,
   IconButton,
@@ -35,6 +36,9 @@ const App: React.FC = () => {
 
   // State
   const [chats, setChats] = useState<ChatMeta[]>([]);
+  // Cursor for the next page of the chat list; null once every page is loaded
+  const [nextCursor, setNextCursor] = useState<string | null>(null);
+  const loadingChats = useRef(false);
   const [currentChat, setCurrentChat] = useState<string | null>(null);
   const [history, setHistory] = useState<Message[]>([]);
   // Always start with the chat‐list open
@@ -49,14 +53,37 @@ const App: React.FC = () => {
     setSidebarOpen(!isMobile);
   }, [isMobile]);
 
-  // Fetch chat metadata
-  useEffect(() => {
-    fetch(`${API_BASE}/chats`, { headers: authHeaders() })
+  // Fetch chat metadata one page at a time
+  const loadChats = useCallback((cursor?: string) => {
+    if (loadingChats.current) return;
+    loadingChats.current = true;
+    fetch(
+      `${API_BASE}/chats${cursor ? `?cursor=${encodeURIComponent(cursor)}` : ''}`,
+      { headers: authHeaders() }
+    )
       .then(res => res.json())
-      .then(data => setChats(data.chats))
-      .catch(console.error);
+      .then(data => {
+        setChats(cs => (cursor ? [...cs, ...data.chats] : data.chats));
+        setNextCursor(data.next_cursor ?? null);
+      })
+      .catch(console.error)
+      .finally(() => {
+        loadingChats.current = false;
+      });
   }, []);
 
+  // Only the first page on mount; the rest is loaded on scroll or on demand
+  useEffect(() => {
+    loadChats();
+  }, [loadChats]);
+
+  const handleChatListScroll = (e: React.UIEvent<HTMLDivElement>) => {
+    const el = e.currentTarget;
+    if (nextCursor && el.scrollHeight - el.scrollTop - el.clientHeight < 100) {
+      loadChats(nextCursor);
+    }
+  };
+
   // Filter favorites
   const displayedChats = useMemo(
     () => (showFavorites ? chats.filter(c => c.favorite) : chats),
@@ -260,7 +287,7 @@ const App: React.FC = () => {
             </Box>
           </Box>
           {/* Chat list */}
-          <Box sx={{ flexGrow: 1, overflowY: 'auto' }}>
+          <Box sx={{ flexGrow: 1, overflowY: 'auto' }} onScroll={handleChatListScroll}>
             <ChatList
               chats={displayedChats}
               currentChat={currentChat}
@@ -268,6 +295,13 @@ const App: React.FC = () => {
               onDelete={handleDeleteChat}
               onToggleFav={handleToggleFav}
             />
+            {nextCursor && (
+              <Box sx={{ display: 'flex', justifyContent: 'center', py: 1 }}>
+                <Button size="small" onClick={() => loadChats(nextCursor)}>
+                  Load more
+                </Button>
+              </Box>
+            )}
           </Box>
         </Box>
 
@@ -130,10 +130,10 @@ const Settings = () => {
         </Typography>
         <Box sx={{ mb: 2 }}>
           <Typography variant="body2" color="text.secondary" sx={{ mb: 2 }}>
-            Upload PDF documents to be processed and indexed. Documents will be associated with your profile details.
+            Upload PDF, Word (DOCX), HTML, Markdown, text or CSV documents to be processed and indexed. Documents will be associated with your profile details.
           </Typography>
           <input
-            accept="application/pdf"
+            accept=".pdf,.docx,.html,.htm,.md,.markdown,.txt,.csv"
             style={{ display: 'none' }}
             id="raised-button-file"
             multiple
@@ -147,7 +147,7 @@ const Settings = () => {
               startIcon={<CloudUploadIcon />}
               sx={{ mb: 2 }}
             >
-              Select PDF Documents
+              Select Documents
             </Button>
           </label>
           {files && (
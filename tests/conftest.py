@@ -0,0 +1,43 @@
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+# Never reach real services from the tests
+os.environ.setdefault("VECTOR_BACKEND", "local")
+
+from benchmarks.standins import install_fake_embedder, install_firestore_standin  # noqa: E402
+
+# Must happen before utils/chatbot/app are imported by any test module
+STORE = install_firestore_standin()
+install_fake_embedder()
+
+
+@pytest.fixture
+def store():
+    """The in-memory Firestore, emptied for each test."""
+    STORE.data.clear()
+    yield STORE
+    STORE.data.clear()
+
+
+@pytest.fixture(scope="session")
+def app_module():
+    os.environ.setdefault("JWT_SECRET", "test-secret-for-the-pytest-suite-only")
+    os.environ.setdefault("GEMINI_API_KEY", "test")
+    import app
+    return app
+
+
+@pytest.fixture
+def client(app_module, store, monkeypatch):
+    monkeypatch.setattr(app_module, "ADMIN_EMAILS", {"admin@su.edu"})
+    app_module.token_cache.clear()
+    return app_module.app.test_client()
+
+
+def signup(client, email, **extra):
+    resp = client.post("/auth/signup", json={"email": email, "password": "pw", "name": "N", **extra})
+    return {"Authorization": f"Bearer {resp.get_json()['token']}"}
@@ -0,0 +1,109 @@
+import threading
+import time
+
+import pytest
+
+import admission
+import url_ingestion
+import utils
+from conftest import signup
+
+
+def test_signup_ignores_requested_role(client):
+    headers = signup(client, "mallory@su.edu", role="admin")
+    assert client.get("/admin/stats", headers=headers).status_code == 403
+    assert client.post("/admin/ingest-urls", headers=headers, json={"urls": ["https://su.edu/"]}).status_code == 403
+
+
+def test_allow_listed_email_is_admin(client):
+    headers = signup(client, "admin@su.edu")
+    assert client.get("/admin/stats", headers=headers).status_code == 200
+
+
+@pytest.mark.parametrize("url", ["http://127.0.0.1/", "http://169.254.169.254/latest/meta-data/",
+                                 "http://10.0.0.5/", "http://localhost:8080/", "http://[::1]/"])
+def test_private_hosts_are_refused(url):
+    with pytest.raises(url_ingestion.UnsafeURL):
+        url_ingestion.check_public_url(url)
+
+
+def test_non_http_urls_are_rejected(client):
+    headers = signup(client, "admin@su.edu")
+    resp = client.post("/admin/ingest-urls", headers=headers, json={"urls": ["file:///etc/passwd"]})
+    assert resp.status_code == 400
+
+
+def test_ingestion_runs_as_a_clamped_background_job(client, app_module):
+    headers = signup(client, "admin@su.edu")
+    resp = client.post("/admin/ingest-urls", headers=headers,
+                       json={"urls": ["http://127.0.0.1:9/"], "concurrency": 0, "rate": 1e9})
+    assert resp.status_code == 202
+    status_url = resp.get_json()["status_url"]
+    for _ in range(100):
+        job = client.get(status_url, headers=headers).get_json()
+        if job["status"] in ("done", "failed"):
+            break
+        time.sleep(0.05)
+    assert job["status"] == "done"
+    assert job["results"][0]["status"] == "fetch_failed"
+    assert "non-public" in job["results"][0]["error"]
+
+
+def test_running_ingest_job_leaves_the_upload_slots_free(client, app_module, monkeypatch):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_ingest(index, urls, **kwargs):
+        started.set()
+        release.wait(5)
+        return {}
+
+    monkeypatch.setattr(app_module, "ingest_urls", slow_ingest)
+    monkeypatch.setattr(app_module.website_index, "get", lambda: None)
+    headers = signup(client, "admin@su.edu")
+    status_url = client.post("/admin/ingest-urls", headers=headers,
+                             json={"urls": ["https://www.seattleu.edu/"]}).get_json()["status_url"]
+    try:
+        assert started.wait(5)
+        assert admission.queues["ingest_jobs"].running == 1
+        assert admission.queues["ingestion"].running == 0
+    finally:
+        release.set()
+    for _ in range(100):
+        if client.get(status_url, headers=headers).get_json()["status"] == "done":
+            break
+        time.sleep(0.05)
+    assert admission.queues["ingest_jobs"].running == 0
+
+
+def test_export_needs_an_allow_listed_admin(client, store):
+    headers = signup(client, "admin@su.edu")
+    assert client.get("/admin/export", headers=headers).status_code == 200
+
+    # An account that gave itself the role before signup stopped accepting it
+    signup(client, "legacy@su.edu")
+    store.collection("users").document("legacy@su.edu").update({"role": "admin"})
+    utils.user_cache.clear()
+    token = client.post("/auth/login", json={"email": "legacy@su.edu", "password": "pw"}).get_json()["token"]
+    legacy = {"Authorization": f"Bearer {token}"}
+    assert client.get("/admin/analytics", headers=legacy).status_code == 200
+    assert client.get("/admin/export", headers=legacy).status_code == 403
+
+
+def test_admin_token_of_demoted_user_is_refused(client, store):
+    headers = signup(client, "admin@su.edu")
+    store.collection("users").document("admin@su.edu").update({"role": "user"})
+    utils.user_cache.clear()
+    assert client.get("/admin/analytics", headers=headers).status_code == 403
+
+
+@pytest.mark.parametrize("method, path", [
+    ("get", "/admin/stats"), ("get", "/admin/faq"), ("post", "/admin/faq/refresh"),
+    ("post", "/admin/ingest-urls"), ("get", "/admin/ingest-urls/some-job"),
+])
+def test_every_admin_endpoint_checks_the_stored_role(client, store, method, path):
+    headers = signup(client, "admin@su.edu")
+    store.collection("users").document("admin@su.edu").update({"role": "user"})
+    utils.user_cache.clear()
+    resp = getattr(client, method)(path, headers=headers, json={"urls": ["https://www.seattleu.edu/"]}
+                                   if method == "post" else None)
+    assert resp.status_code == 403
@@ -0,0 +1,81 @@
+import threading
+import time
+
+import pytest
+
+from admission import FairQueue, RateLimits, Saturated, TokenBucket
+
+
+def test_bucket_allows_a_burst_then_says_when_to_retry():
+    bucket = TokenBucket(rate=1.0, burst=2)
+    assert bucket.try_acquire() == (True, 0.0)
+    assert bucket.try_acquire() == (True, 0.0)
+    allowed, retry_after = bucket.try_acquire()
+    assert not allowed and 0 < retry_after <= 1.0
+
+
+def test_rate_limits_are_per_user_and_sized_by_role(monkeypatch):
+    monkeypatch.setenv("RATE_LIMIT_CHAT_USER", "60:1")
+    monkeypatch.setenv("RATE_LIMIT_CHAT_ADMIN", "60:3")
+    limits = RateLimits()
+    limits.check("chat", "a@su.edu", "user")
+    with pytest.raises(Saturated) as refused:
+        limits.check("chat", "a@su.edu", "user")
+    assert refused.value.reason == "rate limit" and refused.value.retry_after >= 1
+    limits.check("chat", "b@su.edu", None)
+    for _ in range(3):
+        limits.check("chat", "admin@su.edu", "admin")
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 5
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.001)
+
+
+def test_queue_admits_waiting_users_round_robin():
+    queue = FairQueue("test", concurrency=1, max_queue=8, max_per_user=4, max_wait=5)
+    order = []
+    release = threading.Event()
+
+    def hold(user, label):
+        with queue.slot(user):
+            order.append(label)
+            if label == "holder":
+                release.wait(5)
+
+    holder = threading.Thread(target=hold, args=("z", "holder"))
+    holder.start()
+    wait_for(lambda: queue.running == 1)
+    threads = []
+    for user, label in [("a", "a1"), ("a", "a2"), ("a", "a3"), ("b", "b1")]:
+        threads.append(threading.Thread(target=hold, args=(user, label)))
+        threads[-1].start()
+        wait_for(lambda: queue.queued == len(threads))
+    release.set()
+    for t in [holder] + threads:
+        t.join(5)
+    assert order == ["holder", "a1", "b1", "a2", "a3"]
+    assert queue.status()["running"] == 0 and queue.status()["queued"] == 0
+
+
+def test_queue_refuses_beyond_the_per_user_limit_and_on_timeout():
+    queue = FairQueue("test", concurrency=1, max_queue=8, max_per_user=1, max_wait=0.05)
+    timed_out = []
+
+    def wait():
+        try:
+            queue._acquire("a")
+        except Saturated as e:
+            timed_out.append(e.reason)
+
+    with queue.slot("holder"):
+        waiter = threading.Thread(target=wait)
+        waiter.start()
+        wait_for(lambda: queue.queued == 1)
+        with pytest.raises(Saturated) as refused:
+            queue._acquire("a")
+        assert refused.value.reason == "user queue full"
+        waiter.join(5)
+    assert timed_out == ["queue timeout"]
+    assert queue.queued == 0 and queue.running == 0
@@ -0,0 +1,81 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import analytics
+from analytics import AnalyticsRecorder
+from utils import COLLECTION
+
+UNANSWERED = "I'm sorry, I don't have that information."
+
+
+@pytest.fixture
+def recorder(store, monkeypatch):
+    recorder = AnalyticsRecorder(flush_seconds=0)
+    monkeypatch.setattr(analytics, "recorder", recorder)
+    return recorder
+
+
+def test_turns_are_counted_per_day_and_query(recorder):
+    today = datetime.now(timezone.utc)
+    recorder.record_turn("What is tuition?", "About $50k.")
+    recorder.record_turn("what is  TUITION?", UNANSWERED)
+    recorder.record_turn("Where is parking?", "Lot A.", when=today - timedelta(days=1))
+    assert recorder.pending == 3
+
+    summary = analytics.summary(days=7)
+    assert recorder.pending == 0
+    assert summary["totals"] == {"questions": 3, "unanswered": 1, "unanswered_rate": 1 / 3}
+    assert [d["date"] for d in summary["days"]] == [(today - timedelta(days=1)).date().isoformat(),
+                                                   today.date().isoformat()]
+    top = summary["top_queries"][0]
+    assert (top["query"], top["count"], top["unanswered"]) == ("what is tuition?", 2, 1)
+
+
+def test_flushes_add_up(recorder):
+    recorder.record_turn("What is tuition?", "About $50k.")
+    assert recorder.flush() == 2
+    recorder.record_turn("What is tuition?", "About $50k.")
+    recorder.flush()
+    assert analytics.top_queries(flush=False)[0]["count"] == 2
+
+
+def test_failed_flush_keeps_its_counts(recorder, store, monkeypatch):
+    recorder.record_turn("What is tuition?", "About $50k.")
+
+    class FailingBatch:
+        def set(self, *args, **kwargs):
+            pass
+
+        def commit(self):
+            raise RuntimeError("firestore unavailable")
+
+    monkeypatch.setattr(store, "batch", lambda: FailingBatch(), raising=False)
+    assert recorder.flush() == 0
+    assert recorder.pending == 1
+    monkeypatch.undo()
+    monkeypatch.setattr(analytics, "recorder", recorder)
+    assert recorder.flush() == 2
+    assert analytics.top_queries(flush=False)[0]["count"] == 1
+
+
+def test_rebuild_counts_the_stored_chats(recorder, store):
+    created = datetime.now(timezone.utc)
+    for n in range(3):
+        store.collection(COLLECTION).document(f"chat-{n}").set({
+            "created_at": created,
+            "chat": [{"user": "What is tuition?"}, {"assistant": UNANSWERED if n == 0 else "About $50k."}],
+        })
+    result = analytics.rebuild_summaries(page_size=2)
+    assert result == {"chats": 3, "questions": 3, "summary_documents": 2}
+    assert analytics.summary(days=1)["totals"]["unanswered"] == 1
+
+
+def test_export_streams_every_chat(recorder, store):
+    store.collection(COLLECTION).document("chat-1").set({
+        "userId": "u1", "created_at": datetime(2025, 1, 2, tzinfo=timezone.utc),
+        "chat": [{"user": "hi"}, {"assistant": "hello"}],
+    })
+    rows = list(analytics.iter_export_rows())
+    assert rows[0]["id"] == "chat-1" and rows[0]["questions"] == 1
+    assert rows[0]["created_at"].startswith("2025-01-02")
@@ -0,0 +1,74 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import batch_query
+from batch_query import _percentiles, compact_results, run_batch
+
+
+class FlakySession:
+    def __init__(self, failing):
+        self.failing = failing
+
+    def send_message(self, prompt, user_message, stateless):
+        if user_message in self.failing:
+            raise RuntimeError("overloaded")
+        return SimpleNamespace(text=f"answer to {user_message}")
+
+
+@pytest.fixture
+def questions(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_query, "embed_queries", lambda texts: [[1.0, 0.0]] * len(texts))
+    monkeypatch.setattr(batch_query, "retrieve_relevant_context",
+                        lambda index, question, **kwargs: [{"text": f"about {question}"}])
+    path = tmp_path / "questions.jsonl"
+    path.write_text("\n".join(json.dumps({"id": q, "question": q}) for q in ("a", "b", "c")) + "\n")
+    return str(path)
+
+
+def rows(path):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f]
+
+
+def test_resumed_run_replaces_errored_rows(questions, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    monkeypatch.setattr(batch_query, "init_chat_session", lambda client: FlakySession({"b"}))
+    first = run_batch(None, None, questions, out, batch_size=2)
+    assert (first["answered"], first["errors"]) == (2, 1)
+
+    monkeypatch.setattr(batch_query, "init_chat_session", lambda client: FlakySession(set()))
+    second = run_batch(None, None, questions, out, batch_size=2)
+    assert (second["answered"], second["skipped"]) == (1, 2)
+    results = {row["id"]: row for row in rows(out)}
+    assert len(rows(out)) == 3
+    assert results["b"]["answer"] == "answer to b" and "error" not in results["b"]
+
+
+def test_real_run_replaces_dry_run_rows(questions, tmp_path, monkeypatch):
+    out = str(tmp_path / "results.jsonl")
+    run_batch(None, None, questions, out, dry_run=True)
+    monkeypatch.setattr(batch_query, "init_chat_session", lambda client: FlakySession(set()))
+    summary = run_batch(None, None, questions, out)
+    assert summary["answered"] == 3
+    assert sorted(row["id"] for row in rows(out)) == ["a", "b", "c"]
+    assert not any(row.get("dry_run") for row in rows(out))
+
+
+def test_compaction_keeps_the_last_row_per_id(tmp_path):
+    out = tmp_path / "results.jsonl"
+    out.write_text("\n".join([
+        json.dumps({"id": "a", "answer": "old"}),
+        json.dumps({"id": "b", "error": "generation: overloaded"}),
+        json.dumps({"id": "a", "answer": "new"}),
+        '{"id": "c", "answ',
+    ]) + "\n")
+    # "b" errored but isn't asked again, so its row stays
+    assert compact_results(str(out), {"a"}) == {"a"}
+    assert rows(out) == [{"id": "b", "error": "generation: overloaded"}, {"id": "a", "answer": "new"}]
+
+
+def test_percentiles():
+    stats = _percentiles([float(v) for v in range(1, 101)])
+    assert (stats["count"], stats["p50"], stats["p95"], stats["max"]) == (100, 51.0, 96.0, 100.0)
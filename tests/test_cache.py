@@ -0,0 +1,128 @@
+import threading
+import time
+
+import numpy as np
+
+from cache import EmbeddingLRU, SingleFlight, TTLCache, VersionCounter
+
+
+class Refused(Exception):
+    pass
+
+
+def run_flight(flight, fns):
+    """Start the first fn as leader, join the others while it runs; returns results by index."""
+    results = {}
+    leader_started = threading.Event()
+    release_leader = threading.Event()
+
+    def leader_fn():
+        leader_started.set()
+        release_leader.wait(5)
+        return fns[0]()
+
+    def call(i, fn):
+        try:
+            results[i] = flight.do("key", fn, timeout=5, retry_on=(Refused,))
+        except Exception as e:
+            results[i] = e
+
+    threads = [threading.Thread(target=call, args=(0, leader_fn))]
+    threads[0].start()
+    leader_started.wait(5)
+    threads += [threading.Thread(target=call, args=(i, fn)) for i, fn in enumerate(fns[1:], 1)]
+    for t in threads[1:]:
+        t.start()
+    deadline = time.monotonic() + 5
+    while flight.followers < len(fns) - 1 and time.monotonic() < deadline:
+        time.sleep(0.001)
+    release_leader.set()
+    for t in threads:
+        t.join(5)
+    return results
+
+
+def test_followers_share_the_leaders_result():
+    flight = SingleFlight("test")
+    results = run_flight(flight, [lambda: {"answer": 1}] * 3)
+    assert results[0] == ({"answer": 1}, False)
+    assert results[1] == results[2] == ({"answer": 1}, True)
+    assert flight.in_flight == 0
+
+
+def test_followers_get_the_leaders_other_errors():
+    def fail():
+        raise ValueError("boom")
+
+    results = run_flight(SingleFlight("test"), [fail] * 3)
+    assert all(isinstance(r, ValueError) for r in results.values())
+
+
+def test_followers_retry_when_the_leader_is_refused():
+    def refused():
+        raise Refused()
+
+    calls = []
+
+    def answer():
+        calls.append(1)
+        return "ok"
+
+    flight = SingleFlight("test")
+    results = run_flight(flight, [refused, answer, answer])
+    assert isinstance(results[0], Refused)
+    assert [r[0] for r in (results[1], results[2])] == ["ok", "ok"]
+    # One of the followers led the retry and the other shared it, or ran after it
+    assert 1 <= len(calls) <= 2
+    assert flight.in_flight == 0
+
+
+def test_leader_returns_a_copy():
+    flight = SingleFlight("test")
+    stored = {"answer": [1]}
+    result, shared = flight.do("key", lambda: stored)
+    result["answer"].append(2)
+    assert stored == {"answer": [1]} and not shared
+
+
+def test_ttl_cache_evicts_least_recently_used():
+    cache = TTLCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert "b" not in cache and cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.hit_rate == 1.0
+
+
+def test_ttl_cache_expires_entries():
+    cache = TTLCache(ttl=0.01)
+    cache.set("short", 1)
+    cache.set("long", 2, ttl=60)
+    time.sleep(0.02)
+    assert cache.get("short", "gone") == "gone"
+    assert cache.get("long") == 2
+    assert len(cache) == 1
+
+
+def test_embedding_lru_stays_within_its_byte_budget():
+    cache = EmbeddingLRU(max_bytes=3 * 4 * 4)
+    for key in "abcd":
+        cache.set(key, [float(ord(key))] * 4)
+    assert cache.capacity == 3 and len(cache) == 3 and cache.nbytes == 48
+    assert cache.get("a") is None
+    vector = cache.get("d")
+    vector[:] = 0
+    np.testing.assert_array_equal(cache.get("d"), [100.0] * 4)
+    # Vectors of another dimension are not stored
+    cache.set("e", [1.0, 2.0])
+    assert cache.get("e") is None
+
+
+def test_version_counter_bumps_one_key_or_all():
+    versions = VersionCounter()
+    before = versions.get("a"), versions.get("b")
+    versions.bump("a")
+    assert versions.get("a") != before[0] and versions.get("b") == before[1]
+    versions.bump()
+    assert versions.get("b") != before[1]
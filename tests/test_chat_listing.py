@@ -0,0 +1,111 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+import utils
+
+
+@pytest.fixture
+def chats(store):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for n in range(120):
+        store.collection(utils.COLLECTION).document(f"chat{n:03d}").set(
+            {"userId": "u@su.edu", "userName": "U", "created_at": start + timedelta(minutes=n), "chat": []}
+        )
+    utils.chat_listing_cache.clear()
+    yield [f"chat{n:03d}" for n in reversed(range(120))]
+    utils.chat_listing_cache.clear()
+
+
+@pytest.fixture(params=[True, False], ids=["ordered", "fallback"])
+def listing_mode(request, monkeypatch):
+    monkeypatch.setattr(utils, "_ordered_listing_supported", request.param)
+    return request.param
+
+
+def page_ids(page):
+    return [item["id"] for item in page]
+
+
+def test_pages_walk_every_chat_once(chats, listing_mode):
+    seen, cursor = [], None
+    while True:
+        page, cursor = utils.list_chats_page("u@su.edu", limit=50, cursor=cursor)
+        seen += page_ids(page)
+        if cursor is None:
+            break
+    assert seen == chats
+
+
+def test_cursor_survives_cache_loss(chats, listing_mode):
+    page, cursor = utils.list_chats_page("u@su.edu", limit=50)
+    # Another worker, or this one after a restart
+    utils.chat_listing_cache.clear()
+    page, next_cursor = utils.list_chats_page("u@su.edu", limit=50, cursor=cursor)
+    assert page_ids(page) == chats[50:100]
+    assert next_cursor is not None
+
+
+def test_cursor_survives_deleted_chat(chats, listing_mode, store):
+    page, cursor = utils.list_chats_page("u@su.edu", limit=10)
+    utils.delete_chat_log(page[-1]["id"], user_id="u@su.edu")
+    utils.chat_listing_cache.clear()
+    page, _ = utils.list_chats_page("u@su.edu", limit=10, cursor=cursor)
+    assert page_ids(page) == chats[10:20]
+
+
+def test_foreign_cursor_is_rejected(chats):
+    with pytest.raises(utils.InvalidCursor):
+        utils.list_chats_page("u@su.edu", limit=10, cursor="chat070")
+
+
+def test_shared_timestamps_across_pages(store, listing_mode):
+    # Bulk imports stamp many chats with the same created_at
+    stamp = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    for n in range(30):
+        store.collection(utils.COLLECTION).document(f"same{n:02d}").set(
+            {"userId": "t@su.edu", "userName": "T", "created_at": stamp, "chat": []}
+        )
+    utils.chat_listing_cache.clear()
+    seen, cursor = [], None
+    while True:
+        page, cursor = utils.list_chats_page("t@su.edu", limit=7, cursor=cursor)
+        seen += page_ids(page)
+        # Each page is read afresh from the cursor, not from the cache
+        utils.chat_listing_cache.clear()
+        if cursor is None:
+            break
+    assert seen == [f"same{n:02d}" for n in reversed(range(30))]
+
+
+def test_missing_index_falls_back_to_scan(chats, monkeypatch):
+    from google.api_core.exceptions import FailedPrecondition
+    from benchmarks.standins import CollectionQuery
+
+    monkeypatch.setattr(utils, "_ordered_listing_supported", True)
+    scan = CollectionQuery.stream
+
+    def stream(self, *args, **kwargs):
+        if self._order:
+            raise FailedPrecondition("The query requires an index")
+        return scan(self, *args, **kwargs)
+
+    monkeypatch.setattr(CollectionQuery, "stream", stream)
+    page, _ = utils.list_chats_page("u@su.edu", limit=10)
+    assert page_ids(page) == chats[:10]
+    assert utils._ordered_listing_supported is False
+
+
+def test_other_query_errors_do_not_disable_ordering(chats, monkeypatch):
+    from google.api_core.exceptions import DeadlineExceeded
+    from benchmarks.standins import CollectionQuery
+
+    monkeypatch.setattr(utils, "_ordered_listing_supported", True)
+
+    def stream(self, *args, **kwargs):
+        raise DeadlineExceeded("Deadline exceeded")
+
+    monkeypatch.setattr(CollectionQuery, "stream", stream)
+    with pytest.raises(DeadlineExceeded):
+        utils.list_chats_page("u@su.edu", limit=10)
+    assert utils._ordered_listing_supported is True
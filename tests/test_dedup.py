@@ -0,0 +1,31 @@
+from dedup import MinHasher, NearDuplicateIndex, lsh_params, shingles, unique_chunks
+
+# 300 distinct words, so a one-word edit keeps the shingle sets ~97% similar
+PAGE = " ".join(f"term{i}" for i in range(300))
+
+
+def test_signature_agreement_tracks_jaccard_similarity():
+    hasher = MinHasher()
+    a, b = shingles("one two three four five six seven eight nine ten", 2), shingles("one two three four five", 2)
+    jaccard = len(set(a) & set(b)) / len(set(a) | set(b))
+    estimate = float((hasher.signature(a) == hasher.signature(b)).mean())
+    assert abs(estimate - jaccard) < 0.15
+
+
+def test_lsh_params_split_every_permutation():
+    bands, rows = lsh_params(0.85, 128)
+    assert bands * rows == 128
+    assert (1 / bands) ** (1 / rows) < 0.85
+
+
+def test_near_duplicate_points_at_the_first_copy():
+    index = NearDuplicateIndex()
+    assert index.add("https://a", PAGE) is None
+    assert index.add("https://b", PAGE.replace("term150", "changed")) == "https://a"
+    assert index.add("https://c", "Parking permits are sold by the public safety office each quarter.") is None
+    assert len(index) == 2 and index.duplicates == 1
+
+
+def test_unique_chunks_drops_repeats():
+    chunks = [PAGE, "Campus dining halls are open daily from 7am to 9pm.", PAGE.upper()]
+    assert list(unique_chunks(chunks, NearDuplicateIndex())) == chunks[:2]
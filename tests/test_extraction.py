@@ -0,0 +1,88 @@
+import io
+
+import pytest
+from pypdf import PdfWriter
+from pypdf.generic import DecodedStreamObject, DictionaryObject, NameObject
+
+import extraction
+
+
+def make_pdf(pages):
+    writer = PdfWriter()
+    font = DictionaryObject({
+        NameObject("/Type"): NameObject("/Font"),
+        NameObject("/Subtype"): NameObject("/Type1"),
+        NameObject("/BaseFont"): NameObject("/Helvetica"),
+    })
+    for n in range(pages):
+        page = writer.add_blank_page(612, 792)
+        content = DecodedStreamObject()
+        content.set_data(f"BT /F1 12 Tf 72 720 Td (page {n + 1} text) Tj ET".encode())
+        page[NameObject("/Contents")] = writer._add_object(content)
+        page[NameObject("/Resources")] = DictionaryObject({
+            NameObject("/Font"): DictionaryObject({NameObject("/F1"): writer._add_object(font)})
+        })
+    out = io.BytesIO()
+    writer.write(out)
+    out.seek(0)
+    return out
+
+
+@pytest.fixture
+def no_pool(monkeypatch):
+    def refuse():
+        raise AssertionError("the process pool should not be used")
+    monkeypatch.setattr(extraction, "get_pool", refuse)
+
+
+def test_small_web_page_is_extracted_inline(no_pool):
+    html = b"<html><head><title>T</title></head><body><p>" + b"Tuition details. " * 50 + b"</p></body></html>"
+    sections = extraction.submit_extraction(extraction.extractor_for("page.html"), html).result()
+    assert "Tuition details." in sections[0].text
+
+
+def test_large_file_with_few_pages_stays_inline(no_pool, monkeypatch):
+    monkeypatch.setattr(extraction, "PARALLEL_EXTRACT_BYTES", 1)
+    pdf = make_pdf(extraction.PARTS_PER_TASK)
+    sections = list(extraction.extract_sections(pdf, "doc.pdf", size=len(pdf.getvalue())))
+    assert [s.page for s in sections] == list(range(1, extraction.PARTS_PER_TASK + 1))
+
+
+def test_large_pdf_is_split_across_the_pool_in_order(monkeypatch, tmp_path):
+    monkeypatch.setattr(extraction, "PARALLEL_EXTRACT_BYTES", 1)
+    monkeypatch.setattr(extraction, "PARTS_PER_TASK", 4)
+    monkeypatch.setattr(extraction, "EXTRACT_TMP_DIR", str(tmp_path))
+    submitted = []
+    real_pool = extraction.get_pool()
+
+    class RecordingPool:
+        def submit(self, fn, *args):
+            # Tasks carry a file path, never the document bytes
+            assert not any(isinstance(a, bytes) for a in args)
+            submitted.append(args)
+            return real_pool.submit(fn, *args)
+
+    monkeypatch.setattr(extraction, "get_pool", lambda: RecordingPool())
+    pdf = make_pdf(10)
+    sections = list(extraction.extract_sections(pdf, "doc.pdf", size=len(pdf.getvalue())))
+    assert [s.page for s in sections] == list(range(1, 11))
+    assert "page 7 text" in sections[6].text
+    assert [(a[2], a[3]) for a in submitted] == [(0, 4), (4, 8), (8, 10)]
+    # The spilled copy is removed once extraction finishes
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_pipelines_can_send_small_pages_to_the_pool(monkeypatch):
+    submitted = []
+    real_pool = extraction.get_pool()
+
+    class RecordingPool:
+        def submit(self, fn, *args):
+            submitted.append(args[0])
+            return real_pool.submit(fn, *args)
+
+    monkeypatch.setattr(extraction, "get_pool", lambda: RecordingPool())
+    html = b"<html><body><p>" + b"Housing deadlines. " * 50 + b"</p></body></html>"
+    sections = extraction.submit_extraction(extraction.extractor_for("page.html"), html, in_pool=True).result()
+    assert "Housing deadlines." in sections[0].text
+    assert submitted == ["html"]
@@ -0,0 +1,50 @@
+import time
+
+import pytest
+
+import faq
+from faq import FAQCache, content_terms
+
+
+def answer(question):
+    return f"answer to {question}", [{"url": "https://www.seattleu.edu/tuition"}]
+
+
+@pytest.fixture
+def cache(store, monkeypatch):
+    # Low enough that the hashing test embedder scores paraphrases as a
+    # real sentence model would; the lexical guard has to tell them apart
+    cache = FAQCache(answer, threshold=0.5)
+    monkeypatch.setattr(cache, "_ensure_thread", lambda: None)
+    cache.add_curated(["What is undergraduate tuition per year?"])
+    cache.refresh_pending()
+    return cache
+
+
+def test_plural_and_case_do_not_change_content_terms():
+    assert content_terms("Tuition costs?") == content_terms("what is the tuition cost")
+
+
+def test_same_question_is_served(cache):
+    hit = cache.lookup("what is undergraduate tuition per year")
+    assert hit is not None
+    assert hit["answer"] == "answer to What is undergraduate tuition per year?"
+
+
+def test_contrasting_paraphrase_is_not_served(cache):
+    assert cache.lookup("What is graduate tuition per year?") is None
+
+
+def test_old_answers_are_not_served(cache):
+    for entry in cache._entries.values():
+        entry["computed_at"] = time.time() - cache.max_age - 1
+    assert cache.lookup("What is undergraduate tuition per year?") is None
+
+
+def test_mining_keeps_contrasting_questions_apart(cache, monkeypatch):
+    monkeypatch.setattr(faq.analytics, "top_queries", lambda limit: [
+        {"query": "undergraduate tuition per year", "count": 9},
+        {"query": "graduate tuition per year", "count": 7},
+        {"query": "undergraduate tuition per years", "count": 5},
+    ])
+    assert [q["query"] for q in cache.mine()] == ["undergraduate tuition per year", "graduate tuition per year"]
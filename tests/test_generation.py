@@ -0,0 +1,56 @@
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from generation import CircuitBreaker, CircuitOpenError, GenerationClient, GenerationOverloaded
+
+
+class FakeGemini:
+    def __init__(self):
+        self.calls = 0
+        self.models = self
+
+    def generate_content(self, **kwargs):
+        self.calls += 1
+        return SimpleNamespace(text="ok")
+
+
+def half_open_breaker():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=0.01)
+    breaker.record_failure()
+    time.sleep(0.02)
+    return breaker
+
+
+def test_breaker_lets_one_probe_through_when_half_open():
+    breaker = half_open_breaker()
+    assert breaker.allow()
+    assert breaker.state == "half_open"
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == "closed" and breaker.allow()
+
+
+def test_overloaded_probe_does_not_wedge_the_breaker():
+    upstream = FakeGemini()
+    client = GenerationClient(upstream, max_concurrency=1, max_attempts=1, hedge=False,
+                              breaker=half_open_breaker())
+    # Every slot is held (e.g. by abandoned timed-out calls)
+    client._slots.acquire()
+    with pytest.raises(GenerationOverloaded):
+        client.generate_content(deadline=0.05, model="m", contents="hi")
+    assert upstream.calls == 0
+    client._slots.release()
+
+    # The probe was returned, so the next call reaches Gemini and closes the breaker
+    assert client.generate_content(model="m", contents="hi").text == "ok"
+    assert client.breaker.state == "closed"
+
+
+def test_open_breaker_fails_fast():
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    client = GenerationClient(FakeGemini(), breaker=breaker, hedge=False)
+    with pytest.raises(CircuitOpenError):
+        client.generate_content(model="m", contents="hi")
@@ -0,0 +1,125 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import memory
+from generation import CircuitBreaker, GenerationClient
+from memory import BoundedChatSession, strip_retrieved_context
+
+
+class FakeGemini:
+    """Answers every call; records whether two calls ever overlapped."""
+
+    def __init__(self, delay=0.0):
+        self.models = self
+        self.delay = delay
+        self.active = 0
+        self.overlapped = False
+        self._lock = threading.Lock()
+
+    def generate_content(self, model, contents, config=None):
+        with self._lock:
+            self.active += 1
+            self.overlapped |= self.active > 1
+        time.sleep(self.delay)
+        with self._lock:
+            self.active -= 1
+        return SimpleNamespace(text="short summary", usage_metadata=SimpleNamespace(prompt_token_count=10,
+                                                                                    candidates_token_count=2))
+
+
+def session(client=None, **kwargs):
+    return BoundedChatSession(client or FakeGemini(), "model", None, **kwargs)
+
+
+def test_old_turns_are_folded_into_the_summary():
+    chat = session(max_turns=2)
+    for i in range(4):
+        chat.remember(f"question {i}", f"answer {i}")
+    assert [t["user"] for t in chat.turns] == ["question 2", "question 3"]
+    assert "question 0" in chat.summary and "question 1" in chat.summary
+    assert chat.turn_count == 4
+
+
+def test_stateless_messages_are_not_remembered():
+    chat = session()
+    chat.send_message("User Query: hi\n\nRelevant Context:\n...", stateless=True)
+    assert chat.is_empty
+    chat.send_message("User Query: hi\n\nRelevant Context:\n...")
+    assert chat.turns == [{"user": "hi", "assistant": "short summary"}]
+
+
+def test_usage_history_is_bounded(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_USAGE_TURNS", 3)
+    chat = session()
+    for _ in range(10):
+        chat.send_message("question", stateless=True)
+    assert list(chat.input_tokens) == [10, 10, 10]
+    assert chat.total_input_tokens == 100
+
+
+def test_concurrent_turns_fold_one_at_a_time(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_SUMMARIZER", "gemini")
+    client = FakeGemini(delay=0.01)
+    chat = session(GenerationClient(client), max_turns=1, summary_chars=10)
+    threads = [threading.Thread(target=chat.remember, args=(f"question {i}", "answer")) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not client.overlapped
+    assert chat.turn_count == 8 and len(chat.turns) == 1
+    assert chat.summary == "short summ"
+
+
+def test_strip_retrieved_context_keeps_only_the_question():
+    assert strip_retrieved_context("User Query: when?\n\nRelevant Context:\nlots") == "when?"
+    assert strip_retrieved_context("plain") == "plain"
+
+
+class BlockingGemini(FakeGemini):
+    """Holds every call until `release` is set."""
+
+    def __init__(self):
+        super().__init__()
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def generate_content(self, model, contents, config=None):
+        self.started.set()
+        self.release.wait(5)
+        return super().generate_content(model, contents, config)
+
+
+def test_compaction_runs_outside_the_session_lock(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_SUMMARIZER", "gemini")
+    client = BlockingGemini()
+    chat = session(GenerationClient(client), max_turns=1, summary_chars=60)
+    chat.remember("question 0", "answer")
+    chat.remember("question 1", "answer")
+    folding = threading.Thread(target=chat.remember, args=("question 2", "answer"))
+    folding.start()
+    assert client.started.wait(5)
+    # The chat keeps taking turns while Gemini re-summarizes
+    started = time.monotonic()
+    chat.remember("question 3", "answer")
+    assert time.monotonic() - started < 1
+    assert "question 2" in chat.summary
+    client.release.set()
+    folding.join()
+    # The compacted summary replaces the snapshot; the line folded meanwhile stays
+    assert chat.summary == "short summary\n- User asked: question 2 Assistant: answer"
+    assert not chat._compacting
+
+
+def test_compaction_respects_the_circuit_breaker(monkeypatch):
+    monkeypatch.setattr(memory, "MEMORY_SUMMARIZER", "gemini")
+    breaker = CircuitBreaker(failure_threshold=1, reset_timeout=60)
+    breaker.record_failure()
+    client = FakeGemini()
+    chat = session(GenerationClient(client, breaker=breaker), max_turns=1, summary_chars=60)
+    for i in range(4):
+        chat.remember(f"question {i}", "answer")
+    # No upstream call; the summary is truncated instead
+    assert "short summary" not in chat.summary
+    assert len(chat.summary) <= 60 and "question 2" in chat.summary
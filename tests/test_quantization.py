@@ -0,0 +1,52 @@
+import numpy as np
+import pytest
+
+from quantization import CODECS, make_codec
+
+
+@pytest.fixture(scope="module")
+def vectors():
+    rng = np.random.default_rng(7)
+    return rng.normal(size=(600, 32)).astype(np.float32)
+
+
+def codec_for(name, vectors):
+    options = {"subspaces": 8, "iterations": 5} if name == "pq" else {}
+    return make_codec(name, vectors.shape[1], **options).fit(vectors)
+
+
+@pytest.mark.parametrize("name", sorted(CODECS))
+def test_scores_rank_like_exact_cosine(name, vectors):
+    codec = codec_for(name, vectors)
+    codes = codec.encode(vectors)
+    query = vectors[3] + 0.1
+    exact = vectors @ query / (np.linalg.norm(vectors, axis=1) * np.linalg.norm(query))
+    top = set(np.argsort(-exact)[:10])
+    found = set(np.argsort(-codec.scores(codes, query))[:10])
+    assert len(top & found) >= (10 if name in ("float32", "float16") else 5)
+
+
+@pytest.mark.parametrize("name", ["float16", "int8"])
+def test_decode_gives_back_approximate_vectors(name, vectors):
+    codec = codec_for(name, vectors)
+    np.testing.assert_allclose(codec.decode(codec.encode(vectors)), vectors, atol=0.05)
+
+
+def test_codes_shrink_the_vectors(vectors):
+    sizes = {name: codec_for(name, vectors).nbytes(codec_for(name, vectors).encode(vectors)) for name in CODECS}
+    assert sizes["float16"] < sizes["float32"] and sizes["int8"] < sizes["float16"]
+
+
+def test_pq_state_restores_the_same_codes(vectors):
+    codec = codec_for("pq", vectors)
+    restored = make_codec("pq", vectors.shape[1], state=codec.state(), subspaces=8)
+    np.testing.assert_array_equal(restored.encode(vectors)[0], codec.encode(vectors)[0])
+
+
+def test_pq_needs_training_and_a_divisible_dimension(vectors):
+    with pytest.raises(RuntimeError):
+        make_codec("pq", 32, subspaces=8).encode(vectors)
+    with pytest.raises(ValueError):
+        make_codec("pq", 30, subspaces=8)
+    with pytest.raises(ValueError):
+        make_codec("bf16", 32)
@@ -0,0 +1,38 @@
+import pytest
+
+from chatbot import condense_query, is_self_contained
+
+HISTORY = [
+    {"user": "What are the admission requirements for the nursing program?"},
+    {"assistant": "Applicants need a 3.0 GPA and prerequisite science courses."},
+]
+
+
+@pytest.mark.parametrize("message", [
+    "Is there a deadline for admission to the nursing program?",
+    "Are there scholarships for transfer students?",
+    "Which dorms are those closest to the library?",
+    "Does that apply to international applicants in engineering?",
+    "library hours?",
+    "MBA tuition",
+    "parking permits",
+    "Housing",
+])
+def test_standalone_questions_are_not_condensed(message):
+    assert is_self_contained(message)
+    assert condense_query(message, HISTORY) == message
+
+
+@pytest.mark.parametrize("message", [
+    "What about its deadlines?",
+    "When are they due for the fall quarter?",
+    "How much does it cost per year?",
+    "why?",
+    "and housing?",
+    "is it online?",
+])
+def test_follow_ups_are_anchored_on_the_previous_question(message):
+    assert not is_self_contained(message)
+    condensed = condense_query(message, HISTORY)
+    assert condensed.endswith(message)
+    assert "nursing" in condensed and "admission" in condensed
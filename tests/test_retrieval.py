@@ -0,0 +1,41 @@
+from types import SimpleNamespace
+
+import pytest
+
+import chatbot
+from chatbot import bump_index_version, retrieve_relevant_context
+from local_index import LocalIndex
+
+
+def unnamed_index(text):
+    store = LocalIndex("scratch", dimension=2)
+    store.upsert(vectors=[{"id": "doc", "values": [1.0, 0.0], "metadata": {"text": text}}], namespace="ns")
+    return SimpleNamespace(pinecone_index=store)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    chatbot.retrieval_results.clear()
+    yield
+    chatbot.retrieval_results.clear()
+
+
+def retrieve(index):
+    return retrieve_relevant_context(index, "tuition", namespace="ns", top_k=1, embedding=[1.0, 0.0])
+
+
+def test_unnamed_indexes_do_not_share_cached_results():
+    assert retrieve(unnamed_index("first")) == [{"text": "first"}]
+    assert retrieve(unnamed_index("second")) == [{"text": "second"}]
+
+
+def test_results_are_cached_until_the_namespace_is_written():
+    index = SimpleNamespace(pinecone_index=LocalIndex("named", dimension=2), index_name="named")
+    index.pinecone_index.upsert(vectors=[{"id": "doc", "values": [1.0, 0.0], "metadata": {"text": "old"}}],
+                                namespace="ns")
+    assert retrieve(index) == [{"text": "old"}]
+    index.pinecone_index.upsert(vectors=[{"id": "doc", "values": [1.0, 0.0], "metadata": {"text": "new"}}],
+                                namespace="ns")
+    assert retrieve(index) == [{"text": "old"}]
+    bump_index_version("named", "ns")
+    assert retrieve(index) == [{"text": "new"}]
@@ -0,0 +1,38 @@
+import pytest
+
+import admission
+from admission import FairQueue
+from conftest import signup
+from utils import get_chat_history
+
+
+@pytest.fixture
+def full_chat_queue(app_module, monkeypatch):
+    queue = FairQueue("chat", concurrency=1, max_queue=0, max_per_user=1, max_wait=1)
+    monkeypatch.setitem(admission.queues, "chat", queue)
+    monkeypatch.setattr(app_module, "FAQ_ANSWERS", False)
+    with queue.slot("someone-else@su.edu"):
+        yield queue
+
+
+def test_refused_message_leaves_the_history_unchanged(client, full_chat_queue):
+    headers = signup(client, "student@su.edu")
+    chat_id = client.post("/chats", headers=headers).get_json()["chat_id"]
+    for _ in range(2):
+        resp = client.post(f"/chats/{chat_id}/message", headers=headers,
+                           json={"message": "What is the tuition for the MBA program?"})
+        assert resp.status_code == 429
+        assert resp.get_json()["retry_after"] >= 1
+    assert get_chat_history(chat_id) == []
+
+
+def test_answered_message_logs_the_whole_turn(client, app_module, monkeypatch):
+    monkeypatch.setattr(app_module, "FAQ_ANSWERS", False)
+    monkeypatch.setattr(app_module, "generate_reply", lambda *args, **kwargs: "About $1,000 per credit.")
+    headers = signup(client, "student@su.edu")
+    chat_id = client.post("/chats", headers=headers).get_json()["chat_id"]
+    resp = client.post(f"/chats/{chat_id}/message", headers=headers,
+                       json={"message": "What is the tuition for the MBA program?"})
+    assert resp.get_json() == {"response": "About $1,000 per credit."}
+    assert [{k: v for k, v in entry.items() if k != "timestamp"} for entry in get_chat_history(chat_id)] == [
+        {"user": "What is the tuition for the MBA program?"}, {"assistant": "About $1,000 per credit."}]
@@ -0,0 +1,58 @@
+import os
+
+import numpy as np
+import pytest
+
+from local_index import LocalIndex
+from snapshot import export_index, restore_snapshot, verify_snapshot
+
+
+@pytest.fixture
+def source():
+    rng = np.random.default_rng(3)
+    index = LocalIndex("src", dimension=8, compression="float32")
+    for namespace, count in (("pages", 23), ("docs", 5)):
+        index.upsert(vectors=[(f"{namespace}-{i}", rng.normal(size=8).tolist(), {"text": f"{namespace} {i}"})
+                              for i in range(count)], namespace=namespace)
+    return index
+
+
+def test_round_trip_restores_every_vector(source, tmp_path):
+    manifest = export_index(source, str(tmp_path), shard_size=10)
+    assert manifest["total_vectors"] == 28
+    assert len(manifest["namespaces"]["pages"]["shards"]) == 3
+
+    target = LocalIndex("dst", dimension=8, compression="float32")
+    result = restore_snapshot(str(tmp_path), target, namespace_map={"docs": "uploads"}, batch_size=4)
+    assert result["namespaces"] == {"pages": 23, "uploads": 5}
+    original = source.fetch(["pages-7"], namespace="pages").vectors["pages-7"]
+    restored = target.fetch(["pages-7"], namespace="pages").vectors["pages-7"]
+    np.testing.assert_allclose(restored.values, original.values, rtol=1e-6)
+    assert restored.metadata == {"text": "pages 7"}
+    assert "docs-0" in target.fetch(["docs-0"], namespace="uploads").vectors
+
+
+def test_int8_snapshot_is_close_to_the_original(source, tmp_path):
+    export_index(source, str(tmp_path), compression="int8")
+    target = LocalIndex("dst", dimension=8, compression="float32")
+    restore_snapshot(str(tmp_path), target)
+    original = np.array(source.fetch(["docs-1"], namespace="docs").vectors["docs-1"].values)
+    restored = np.array(target.fetch(["docs-1"], namespace="docs").vectors["docs-1"].values)
+    assert np.dot(original, restored) / (np.linalg.norm(original) * np.linalg.norm(restored)) > 0.99
+
+
+def test_corrupt_shards_are_refused(source, tmp_path):
+    manifest = export_index(source, str(tmp_path), shard_size=10)
+    shard = os.path.join(str(tmp_path), manifest["namespaces"]["docs"]["shards"][0]["file"])
+    with open(shard, "r+b") as f:
+        f.seek(20)
+        f.write(b"\x00\x01\x02")
+    with pytest.raises(ValueError, match="corrupt"):
+        verify_snapshot(str(tmp_path))
+    with pytest.raises(ValueError, match="corrupt"):
+        restore_snapshot(str(tmp_path), LocalIndex("dst", dimension=8))
+
+
+def test_pq_snapshots_are_refused(source, tmp_path):
+    with pytest.raises(ValueError):
+        export_index(source, str(tmp_path), compression="pq")
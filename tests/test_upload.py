@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import utils
+from local_index import LocalIndex
+
+
+class FakeModel:
+    def encode(self, batch):
+        return np.random.default_rng(len(batch)).random((len(batch), 384), dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def model(monkeypatch):
+    monkeypatch.setattr(utils, "get_model", lambda: FakeModel())
+
+
+def markdown(sections):
+    body = "\n\n".join(f"# Part {n}\n\n" + " ".join(f"p{n}w{j}" for j in range(200)) for n in range(sections))
+    return FileStorage(io.BytesIO(body.encode()), filename="handbook.md", content_type="text/markdown")
+
+
+def ids(index, doc_id):
+    return sorted(vid for page in index.list(prefix=doc_id) for vid in page)
+
+
+def upload(index, sections):
+    return utils.process_document(markdown(sections), index, {"email": "a@su.edu"})
+
+
+def test_reupload_replaces_the_previous_chunks():
+    index = LocalIndex("test")
+    first = upload(index, 6)
+    second = upload(index, 2)
+    assert first["upload_id"] != second["upload_id"]
+    assert second["stale_chunks_deleted"] == first["chunks"]
+    assert ids(index, "handbook.md") == [f"handbook.md#{second['upload_id']}#{n}" for n in range(second["chunks"])]
+
+
+def test_legacy_chunk_ids_are_removed():
+    index = LocalIndex("test")
+    index.upsert([("handbook.md_0", [0.1] * 384, {}), ("handbook.md_1", [0.1] * 384, {})])
+    stats = upload(index, 2)
+    assert stats["stale_chunks_deleted"] == 2
+    assert all("#" in vid for vid in ids(index, "handbook.md"))
+
+
+def test_older_upload_does_not_delete_a_newer_one():
+    index = LocalIndex("test")
+    older, newer = utils.new_upload_id(), utils.new_upload_id()
+    assert older < newer
+    index.upsert([(f"handbook.md#{older}#0", [0.1] * 384, {}), (f"handbook.md#{newer}#0", [0.1] * 384, {})])
+    # The older upload finishing last leaves the newer one in place
+    assert utils.delete_stale_document_chunks(index, "handbook.md", older) == 1
+    assert ids(index, "handbook.md") == [f"handbook.md#{newer}#0"]
+
+
+def test_spill_is_reported_from_the_upload_size(monkeypatch):
+    monkeypatch.setattr(utils, "UPLOAD_SPOOL_BYTES", 1024)
+    assert upload(LocalIndex("test"), 1)["spooled_to_disk"] is True
+    monkeypatch.setattr(utils, "UPLOAD_SPOOL_BYTES", 1024 * 1024)
+    assert upload(LocalIndex("test"), 1)["spooled_to_disk"] is False
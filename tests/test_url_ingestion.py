@@ -0,0 +1,70 @@
+import pytest
+
+import url_ingestion
+from local_index import LocalIndex
+
+
+def paragraphs(prefix, n):
+    return "".join(f"<p>{prefix} paragraph {i}: " + " ".join(f"{prefix}{i}w{j}" for j in range(150)) + "</p>"
+                   for i in range(n))
+
+
+@pytest.fixture
+def pages(monkeypatch):
+    site = {}
+
+    def fetch(url, limiter, timeout, public_only=False):
+        return {"data": f"<html><body>{site[url]}</body></html>".encode(), "http_status": 200,
+                "content_type": "text/html"}
+
+    monkeypatch.setattr(url_ingestion, "_fetch", fetch)
+    return site
+
+
+def ids(index, url):
+    return sorted(vid for page in index.list(prefix=f"{url}#", namespace="ns") for vid in page)
+
+
+def ingest(index, urls):
+    return url_ingestion.ingest_urls(index, urls, namespace="ns", concurrency=2, rate=0, max_chunk_size=1000)
+
+
+def test_shrunk_page_loses_its_old_chunks(pages):
+    index = LocalIndex("test")
+    pages["https://su.edu/a"] = paragraphs("alpha", 6)
+    first = ingest(index, ["https://su.edu/a"])["https://su.edu/a"]
+    assert first["status"] == "ok" and first["chunks"] > 2
+
+    pages["https://su.edu/a"] = paragraphs("alpha", 1)
+    second = ingest(index, ["https://su.edu/a"])["https://su.edu/a"]
+    assert second["status"] == "ok"
+    assert len(ids(index, "https://su.edu/a")) == second["chunks"]
+    assert second["stale_chunks_deleted"] == first["chunks"] - second["chunks"]
+
+
+def test_page_turned_duplicate_loses_its_chunks(pages):
+    index = LocalIndex("test")
+    pages["https://su.edu/b"] = paragraphs("beta", 2)
+    ingest(index, ["https://su.edu/b"])
+    assert ids(index, "https://su.edu/b")
+
+    pages["https://su.edu/a"] = paragraphs("gamma", 3)
+    pages["https://su.edu/b"] = paragraphs("gamma", 3)
+    report = ingest(index, ["https://su.edu/a", "https://su.edu/b"])
+    assert report["https://su.edu/b"]["status"] == "duplicate"
+    assert ids(index, "https://su.edu/b") == []
+
+
+def test_fetched_pages_are_extracted_in_the_pool(pages, monkeypatch):
+    calls = []
+    real_submit = url_ingestion.submit_extraction
+
+    def submit(extractor, data, in_pool=None):
+        calls.append(in_pool)
+        return real_submit(extractor, data, in_pool=in_pool)
+
+    monkeypatch.setattr(url_ingestion, "submit_extraction", submit)
+    pages["https://su.edu/c"] = paragraphs("delta", 2)
+    report = ingest(LocalIndex("test"), ["https://su.edu/c"])
+    assert report["https://su.edu/c"]["status"] == "ok"
+    assert calls == [True]
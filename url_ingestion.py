@@ -0,0 +1,444 @@
+"""
+Bulk ingestion of web pages into the website index.
+
+URLs (a list, or a filtered subset of a sitemap) are fetched concurrently
+under a global rate limit, extracted in the document extraction process pool
+(boilerpy3 for HTML, pypdf for PDFs, see extraction.py), chunked, embedded in
+batches and upserted through the one shared index client, with a bounded
+number of upserts in flight while the next batch is embedded. Each URL gets
+its own status in the returned report.
+
+Near-duplicate pages (templated pages, mirrors under several paths) and
+chunks (shared blocks of text) are dropped before embedding (see dedup.py);
+the canonical copy keeps the other URLs in its `aliases` metadata.
+
+    python url_ingestion.py --sitemap https://www.seattleu.edu/sitemap.xml \
+        --include /law/ --limit 300 --concurrency 8 --rate 5 --out law.jsonl
+"""
+import os
+import ipaddress
+import json
+import logging
+import re
+import socket
+import threading
+import time
+import urllib.request
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, Iterable, List, Optional
+from urllib.parse import urlparse
+from xml.etree import ElementTree
+
+import metrics
+from chatbot import bump_index_version, clean_text, get_embed_model, notify_sources_ingested
+from dedup import DEDUP_THRESHOLD, NearDuplicateIndex
+from extraction import extractor_for, submit_extraction
+from utils import pack_paragraphs
+
+logger = logging.getLogger(__name__)
+
+USER_AGENT = os.getenv("INGEST_USER_AGENT", "SU-RAG-Ingest/1.0")
+MAX_PAGE_BYTES = int(os.getenv("INGEST_MAX_PAGE_BYTES", 10 * 1024 * 1024))
+# Metadata text is what the chat prompt sees; keep it well under Pinecone's 40 KB limit
+MAX_CHUNK_CHARS = 1000
+# Alias URLs kept in a canonical chunk's metadata (shared blocks can repeat on hundreds of pages)
+MAX_ALIASES = 20
+
+
+class UnsafeURL(ValueError):
+    """A URL that is not http(s) or resolves to a private, loopback or reserved address."""
+
+
+def check_public_url(url: str) -> None:
+    """
+    Raise UnsafeURL unless `url` is http(s) and every address its host
+    resolves to is globally routable (no internal services, metadata endpoints).
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise UnsafeURL(f"Only http(s) URLs can be ingested: {url}")
+    try:
+        infos = socket.getaddrinfo(parsed.hostname, parsed.port or (443 if parsed.scheme == "https" else 80))
+    except (socket.gaierror, UnicodeError) as e:
+        raise UnsafeURL(f"Cannot resolve {parsed.hostname}: {e}")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%", 1)[0])
+        if not address.is_global:
+            raise UnsafeURL(f"{parsed.hostname} resolves to a non-public address")
+
+
+class _PublicRedirectHandler(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        check_public_url(newurl)
+        return super().redirect_request(req, fp, code, msg, headers, newurl)
+
+
+_public_opener = urllib.request.build_opener(_PublicRedirectHandler)
+
+
+def _open(url: str, timeout: float, public_only: bool):
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    if not public_only:
+        return urllib.request.urlopen(request, timeout=timeout)
+    # Checked again at fetch time, and on every redirect
+    check_public_url(url)
+    return _public_opener.open(request, timeout=timeout)
+
+
+class RateLimiter:
+    """Spaces calls at least 1/rate seconds apart across all threads."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate and rate > 0 else 0.0
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self) -> None:
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next)
+            self._next = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+def load_sitemap(source: str, include: Optional[str] = None, limit: Optional[int] = None,
+                 timeout: float = 20, public_only: bool = False) -> List[str]:
+    """
+    Page URLs from a sitemap (URL or local path), following sitemap indexes
+    one level down. `include` is a regex matched against each URL. With
+    `public_only`, the source must be a public http(s) URL (see `check_public_url`).
+    """
+    if re.match(r"https?://", source):
+        with _open(source, timeout, public_only) as resp:
+            root = ElementTree.fromstring(resp.read(MAX_PAGE_BYTES))
+    elif public_only:
+        raise UnsafeURL(f"Only http(s) sitemaps can be read: {source}")
+    else:
+        root = ElementTree.parse(source).getroot()
+    locs = [el.text.strip() for el in root.iter() if el.tag.endswith("loc") and el.text]
+    if root.tag.endswith("sitemapindex"):
+        return [url for child in locs
+                for url in load_sitemap(child, include, None, timeout, public_only)][:limit]
+    pattern = re.compile(include) if include else None
+    urls = [url for url in locs if pattern is None or pattern.search(url)]
+    return urls[:limit] if limit else urls
+
+
+def _fetch(url: str, limiter: RateLimiter, timeout: float, public_only: bool = False) -> Dict[str, Any]:
+    limiter.wait()
+    with metrics.timer("url_fetch"), _open(url, timeout, public_only) as resp:
+        data = resp.read(MAX_PAGE_BYTES + 1)
+        fetched = {
+            "data": data,
+            "http_status": resp.status,
+            "content_type": resp.headers.get("Content-Type", "text/html"),
+        }
+    if len(data) > MAX_PAGE_BYTES:
+        raise ValueError(f"page is larger than {MAX_PAGE_BYTES} bytes")
+    return fetched
+
+
+def _chunks(sections: Iterable[Any], max_chunk_size: int) -> List[str]:
+    # boilerpy3 separates blocks with single newlines; treat each as a paragraph
+    return [c for c in pack_paragraphs(
+        (line for section in sections for line in section.text.split("\n") if line.strip()), max_chunk_size
+    ) if c]
+
+
+def ingest_urls(
+    index: Any,
+    urls: Iterable[str],
+    namespace: str = "poc_rag",
+    concurrency: int = 8,
+    rate: float = 5.0,
+    batch_size: int = 100,
+    max_inflight_upserts: int = 4,
+    max_chunk_size: int = MAX_CHUNK_CHARS,
+    timeout: float = 20,
+    dedup_threshold: Optional[float] = DEDUP_THRESHOLD,
+    public_only: bool = False
+) -> Dict[str, Dict[str, Any]]:
+    """
+    Fetch, extract, chunk, embed and upsert `urls` into `index`.
+
+    Args:
+        index: VectorStoreIndex from `chatbot.load_index`, or a Pinecone Index
+        urls: Page URLs; duplicates are ingested once
+        namespace: Target namespace (the website pages live in "poc_rag")
+        concurrency: Parallel fetches
+        rate: Fetches started per second, across all threads
+        batch_size: Chunks embedded and upserted together
+        max_inflight_upserts: Upserts allowed to run while the next batch is embedded
+        dedup_threshold: Estimated Jaccard similarity at which a page or chunk
+            counts as a duplicate of an earlier one; None disables dedup
+        public_only: Refuse (fetch_failed) URLs and redirects that are not
+            public http(s), for URLs supplied by API callers
+
+    Returns:
+        url -> {"url", "status", "chunks", "duplicate_chunks", "canonical",
+        "http_status", "error", "seconds", "embedding_seconds_saved"}, where
+        status is ok, duplicate, fetch_failed, extract_failed, empty or
+        upsert_failed. A duplicate page names its `canonical` URL. Chunks are
+        stored as "<url>#<n>"; the old one-vector-per-page record with id
+        "<url>" is deleted once a page is ingested.
+    """
+    index_name = getattr(index, "index_name", None)
+    pinecone_index = getattr(index, "pinecone_index", index)
+    embed_model = get_embed_model()
+    started = time.perf_counter()
+    report = {
+        url: {"url": url, "status": "pending", "chunks": 0, "duplicate_chunks": 0, "canonical": None,
+              "upserted": 0, "stale_chunks_deleted": 0, "http_status": None, "error": None,
+              "seconds": None}
+        for url in dict.fromkeys(urls)
+    }
+    limiter = RateLimiter(rate)
+    buffer: List[tuple] = []  # (url, chunk number, chunk text, title)
+    inflight: List[tuple] = []  # (future, {url: chunks in batch})
+    dedup = dedup_threshold is not None
+    pages = NearDuplicateIndex(dedup_threshold, name="page") if dedup else None
+    chunk_index = NearDuplicateIndex(dedup_threshold, name="chunk") if dedup else None
+    # canonical page url -> duplicate page urls; canonical chunk id -> other urls it appears on
+    page_aliases: Dict[str, List[str]] = {}
+    chunk_aliases: Dict[str, set] = {}
+    embedded = {"chunks": 0, "seconds": 0.0}
+
+    def finish(url: str, status: str, error: Optional[str] = None) -> None:
+        entry = report[url]
+        entry["status"], entry["error"] = status, error
+        entry["seconds"] = time.perf_counter() - started
+        if status != "ok":
+            metrics.inc("url_ingest_total", status=status)
+
+    def upsert(vectors: List[tuple]) -> None:
+        with metrics.timer("vector_upsert"):
+            pinecone_index.upsert(vectors=vectors, namespace=namespace)
+        bump_index_version(index_name, namespace)
+
+    def settle(future: Future, counts: Dict[str, int]) -> None:
+        error = future.exception()
+        for url, count in counts.items():
+            if error is not None:
+                finish(url, "upsert_failed", str(error))
+            else:
+                report[url]["upserted"] += count
+
+    def flush(final: bool = False) -> None:
+        while len(buffer) >= batch_size or (final and buffer):
+            batch = buffer[:batch_size]
+            del buffer[:batch_size]
+            embed_started = time.perf_counter()
+            with metrics.timer("embed_chunks"):
+                embeddings = embed_model.get_text_embedding_batch([clean_text(text) for _, _, text, _ in batch])
+            embedded["chunks"] += len(batch)
+            embedded["seconds"] += time.perf_counter() - embed_started
+            vectors, counts = [], {}
+            for (url, n, text, title), embedding in zip(batch, embeddings):
+                vectors.append((f"{url}#{n}", list(embedding),
+                                {"url": url, "title": title or "", "chunk_id": n, "text": text}))
+                counts[url] = counts.get(url, 0) + 1
+            # Keep a bounded pipeline: wait for the oldest upsert before adding more
+            while len(inflight) >= max_inflight_upserts:
+                future, oldest = inflight.pop(0)
+                wait([future])
+                settle(future, oldest)
+            inflight.append((upsert_pool.submit(upsert, vectors), counts))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="ingest-fetch") as fetch_pool, \
+            ThreadPoolExecutor(max_workers=max_inflight_upserts, thread_name_prefix="ingest-upsert") as upsert_pool:
+        tasks: Dict[Future, tuple] = {
+            fetch_pool.submit(_fetch, url, limiter, timeout, public_only): ("fetch", url) for url in report
+        }
+        while tasks:
+            done, _ = wait(list(tasks), return_when=FIRST_COMPLETED)
+            for future in done:
+                kind, url = tasks.pop(future)
+                if kind == "fetch":
+                    try:
+                        fetched = future.result()
+                        report[url]["http_status"] = fetched["http_status"]
+                        extractor = extractor_for(urlparse(url).path or "index.html", fetched["content_type"])
+                    except Exception as e:
+                        finish(url, "fetch_failed", str(e))
+                        continue
+                    # Pages are parsed in the process pool, in parallel and off this
+                    # thread, which also schedules the embedding and upserts
+                    tasks[submit_extraction(extractor, fetched["data"], in_pool=True)] = ("extract", url)
+                    continue
+                try:
+                    sections = future.result()
+                    chunks = _chunks(sections, max_chunk_size)
+                except Exception as e:
+                    finish(url, "extract_failed", str(e))
+                    continue
+                if not chunks:
+                    finish(url, "empty")
+                    continue
+                if dedup:
+                    canonical = pages.add(url, "\n".join(chunks))
+                    if canonical is not None:
+                        report[url].update(canonical=canonical, duplicate_chunks=len(chunks))
+                        page_aliases.setdefault(canonical, []).append(url)
+                        finish(url, "duplicate")
+                        continue
+                    kept, originals = [], []
+                    for text in chunks:
+                        original = chunk_index.add(f"{url}#{len(kept)}", text)
+                        if original is None:
+                            kept.append(text)
+                            continue
+                        originals.append(original)
+                        if not original.startswith(url + "#"):
+                            chunk_aliases.setdefault(original, set()).add(url)
+                    report[url]["duplicate_chunks"] = len(originals)
+                    if not kept:
+                        # Everything on the page already appears elsewhere
+                        report[url]["canonical"] = originals[0].rsplit("#", 1)[0]
+                        finish(url, "duplicate")
+                        continue
+                    chunks = kept
+                title = next((s.heading for s in sections if s.heading), None)
+                report[url]["chunks"] = len(chunks)
+                buffer.extend((url, n, text, title) for n, text in enumerate(chunks))
+                flush()
+        flush(final=True)
+        for future, counts in inflight:
+            wait([future])
+            settle(future, counts)
+
+    ingested = []
+    for url, entry in report.items():
+        if entry["status"] == "pending":
+            finish(url, "ok")
+            metrics.inc("url_ingest_total", status="ok")
+            ingested.append(url)
+        elif entry["status"] == "duplicate":
+            ingested.append(url)
+    if dedup:
+        _record_aliases(pinecone_index, namespace, report, page_aliases, chunk_aliases)
+        per_chunk = embedded["seconds"] / embedded["chunks"] if embedded["chunks"] else 0.0
+        for entry in report.values():
+            entry["embedding_seconds_saved"] = entry["duplicate_chunks"] * per_chunk
+    # Drop the legacy whole-page vectors that the chunks replace
+    for start in range(0, len(ingested), 1000):
+        try:
+            pinecone_index.delete(ids=ingested[start:start + 1000], namespace=namespace)
+        except Exception as e:
+            logger.warning(f"Could not delete legacy page vectors: {e}")
+    # And chunks from earlier runs beyond the page's current chunk count (all
+    # of them for pages that are now duplicates)
+    stale = [(url, report[url]["chunks"] if report[url]["status"] == "ok" else 0) for url in ingested]
+    if stale:
+        with ThreadPoolExecutor(max_workers=min(concurrency, len(stale)),
+                                thread_name_prefix="ingest-prune") as prune_pool:
+            for url, removed in zip(ingested, prune_pool.map(
+                    lambda entry: _delete_stale_chunks(pinecone_index, namespace, *entry), stale)):
+                report[url]["stale_chunks_deleted"] = removed
+        bump_index_version(index_name, namespace)
+    for entry in report.values():
+        entry.pop("upserted")
+    notify_sources_ingested([url for url, entry in report.items() if entry["status"] == "ok"])
+    return report
+
+
+def _delete_stale_chunks(pinecone_index: Any, namespace: str, url: str, keep: int) -> int:
+    """Delete the `<url>#n` vectors with n >= keep; returns how many were deleted."""
+    try:
+        stale = [vid for page in pinecone_index.list(prefix=f"{url}#", namespace=namespace) for vid in page
+                 if vid.rsplit("#", 1)[-1].isdigit() and int(vid.rsplit("#", 1)[-1]) >= keep]
+        for start in range(0, len(stale), 1000):
+            pinecone_index.delete(ids=stale[start:start + 1000], namespace=namespace)
+        return len(stale)
+    except Exception as e:
+        # Pod-based indexes cannot list ids
+        logger.warning(f"Could not delete stale chunks of {url}: {e}")
+        return 0
+
+
+def _record_aliases(pinecone_index: Any, namespace: str, report: Dict[str, Dict[str, Any]],
+                    page_aliases: Dict[str, List[str]], chunk_aliases: Dict[str, set]) -> None:
+    """Add the URLs of dropped duplicates to the canonical chunks' metadata."""
+    aliases: Dict[str, set] = {}
+    for canonical, urls in page_aliases.items():
+        for n in range(report[canonical]["chunks"]):
+            aliases.setdefault(f"{canonical}#{n}", set()).update(urls)
+    for chunk_id, urls in chunk_aliases.items():
+        aliases.setdefault(chunk_id, set()).update(urls)
+    for chunk_id, urls in aliases.items():
+        if report[chunk_id.rsplit("#", 1)[0]]["status"] != "ok":
+            continue
+        try:
+            pinecone_index.update(
+                id=chunk_id,
+                set_metadata={"aliases": sorted(urls)[:MAX_ALIASES], "alias_count": len(urls)},
+                namespace=namespace,
+            )
+        except Exception as e:
+            logger.warning(f"Could not record aliases on {chunk_id}: {e}")
+
+
+def summarize(report: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+    statuses: Dict[str, int] = {}
+    for entry in report.values():
+        statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+    return {
+        "urls": len(report),
+        "chunks": sum(e["chunks"] for e in report.values() if e["status"] == "ok"),
+        "statuses": statuses,
+        "dedup": {
+            "duplicate_pages": statuses.get("duplicate", 0),
+            "vectors_saved": sum(e.get("duplicate_chunks", 0) for e in report.values()),
+            "embedding_seconds_saved": sum(e.get("embedding_seconds_saved", 0.0) for e in report.values()),
+        },
+        "seconds": max((e["seconds"] or 0 for e in report.values()), default=0),
+    }
+
+
+def main():
+    import argparse
+    from chatbot import INDEX_NAME, PINECONE_API_KEY, init_pinecone_client, load_index
+
+    parser = argparse.ArgumentParser(description="Bulk-ingest web pages into the website index.")
+    parser.add_argument("urls", nargs="*", help="Page URLs")
+    parser.add_argument("--urls-file", help="File with one URL per line")
+    parser.add_argument("--sitemap", help="Sitemap URL or path")
+    parser.add_argument("--include", help="Regex a sitemap URL must match")
+    parser.add_argument("--limit", type=int, help="Max URLs taken from the sitemap")
+    parser.add_argument("--index", default=INDEX_NAME)
+    parser.add_argument("--namespace", default="poc_rag")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--rate", type=float, default=5.0, help="Fetches per second")
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument("--dedup-threshold", type=float, default=DEDUP_THRESHOLD,
+                        help="Near-duplicate similarity (0-1); 0 disables dedup")
+    parser.add_argument("--out", help="Write per-URL status as JSONL here")
+    args = parser.parse_args()
+
+    urls = list(args.urls)
+    if args.urls_file:
+        with open(args.urls_file) as f:
+            urls += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if args.sitemap:
+        urls += load_sitemap(args.sitemap, include=args.include, limit=args.limit)
+    if not urls:
+        parser.error("No URLs: pass URLs, --urls-file or --sitemap")
+
+    index = load_index(init_pinecone_client(PINECONE_API_KEY), args.index)
+    report = ingest_urls(index, urls, namespace=args.namespace, concurrency=args.concurrency,
+                         rate=args.rate, batch_size=args.batch_size,
+                         dedup_threshold=args.dedup_threshold or None)
+    if args.out:
+        with open(args.out, "w") as f:
+            for entry in report.values():
+                f.write(json.dumps(entry) + "\n")
+    for entry in report.values():
+        if entry["status"] != "ok":
+            print(f"{entry['status']:<15} {entry['url']} {entry['error'] or ''}")
+    print(json.dumps(summarize(report), indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,98 @@
-from firebase_admin import credentials, firestore, initialize_app
-from google.cloud.firestore_v1 import SERVER_TIMESTAMP
 import os
+import base64
+import json
+import sys
+import threading
+import uuid
 from dotenv import load_dotenv
-from datetime import datetime
+from datetime import datetime, timezone
+from itertools import islice
 from werkzeug.security import generate_password_hash, check_password_hash
 import logging
-from typing import List
+from tempfile import SpooledTemporaryFile
+from typing import BinaryIO, Dict, Iterable, Iterator, List, Optional, Tuple
 from werkzeug.utils import secure_filename
-from pypdf import PdfReader
 import pinecone
-from sentence_transformers import SentenceTransformer
 
-load_dotenv(dotenv_path=".env.local")
-
-cred_path = os.getenv("FIREBASE_CREDENTIALS_PATH")
-project_id = os.getenv("FIREBASE_PROJECT_ID")
-cred = credentials.Certificate(cred_path)
-initialize_app(cred, {"projectId": project_id})
+import components
+import metrics
+from chatbot import bump_index_version, notify_sources_ingested
+from dedup import NearDuplicateIndex, unique_chunks
+from extraction import extract_pdf, extract_sections, supported_extensions
+from cache import TTLCache
 
+load_dotenv(dotenv_path=".env.local")
 
-db = firestore.client()
 COLLECTION = "chat_logs"
 USERS_COL = "users"
+# Per-file upload limit, and how much of an upload is held in memory before
+# it spills to an anonymous (unnamed, auto-deleted) temporary file
+MAX_UPLOAD_BYTES = int(os.getenv("MAX_UPLOAD_BYTES", 20 * 1024 * 1024))
+UPLOAD_SPOOL_BYTES = int(os.getenv("UPLOAD_SPOOL_BYTES", 8 * 1024 * 1024))
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Initialize the embedding model
-model = SentenceTransformer('all-MiniLM-L6-v2')
+
+def _init_firestore():
+    # Deferred: firebase_admin pulls in grpc and the Firestore client
+    from firebase_admin import credentials, firestore, initialize_app
+
+    cred_path = os.getenv("FIREBASE_CREDENTIALS_PATH")
+    project_id = os.getenv("FIREBASE_PROJECT_ID")
+    cred = credentials.Certificate(cred_path)
+    initialize_app(cred, {"projectId": project_id})
+    return firestore.client()
+
+
+def _init_sentence_model():
+    # Deferred: importing sentence_transformers (torch) alone takes seconds
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer('all-MiniLM-L6-v2')
+
+
+firestore_client = components.register("firestore", _init_firestore)
+# Only document uploads need it, so readiness does not wait for it
+sentence_model = components.register("sentence_model", _init_sentence_model, required=False)
+
+
+def get_db():
+    """Return the Firestore client, initializing Firebase on first use."""
+    return firestore_client.get()
+
+
+def get_model():
+    """Return the SentenceTransformer used to embed uploaded document chunks."""
+    return sentence_model.get()
+
+# email -> user document; only existing users are cached
+user_cache = TTLCache(maxsize=2048, ttl=int(os.getenv("USER_CACHE_TTL", 300)), name="user_profile")
+
+# Fields needed for the chat sidebar; the `chat` transcript is never fetched for listings
+CHAT_LIST_FIELDS = ["userId", "userName", "created_at", "favorite"]
+# user_id -> {"items": [...newest first], "complete": bool}, filled page by page.
+# The cache is per process and only patched by this process's writes, so a chat
+# created through another worker shows up once the listing expires
+chat_listing_cache = TTLCache(maxsize=1024, ttl=int(os.getenv("CHAT_LISTING_TTL", 60)), name="chat_listing")
+_listing_lock = threading.Lock()
+# Flipped off if the (userId, created_at desc, __name__ desc) composite index is missing
+_ordered_listing_supported = True
 
 def get_all_chat_ids() -> list[str]:
     """Return a list of all chat document IDs in Firestore."""
-    docs = db.collection(COLLECTION).stream()
+    # Empty projection: only document names come back, never the transcripts
+    docs = get_db().collection(COLLECTION).select([]).stream()
     return [doc.id for doc in docs]
 
 def create_user(email: str, password: str,name:str, role: str = "user"):
     """Add a new user doc with hashed password and role."""
-    user_ref = db.collection(USERS_COL).document(email)
+    user_ref = get_db().collection(USERS_COL).document(email)
     if user_ref.get().exists:
         raise ValueError("User already exists")
+    from firebase_admin.firestore import SERVER_TIMESTAMP
+
     pw_hash = generate_password_hash(password)
+    user_cache.pop(email)
     user_ref.set({
         "email": email,
         "password_hash": pw_hash,
@@ -48,12 +101,27 @@ def create_user(email: str, password: str,name:str, role: str = "user"):
         "created_at": SERVER_TIMESTAMP
     })
     
+def get_user(email: str) -> dict | None:
+    """Return the user document for `email`, served from a short-lived cache."""
+    data = user_cache.get(email)
+    if data is None:
+        doc = get_db().collection(USERS_COL).document(email).get()
+        if not doc.exists:
+            return None
+        data = doc.to_dict()
+        user_cache.set(email, data)
+    return dict(data)
+
+def update_user(email: str, updates: dict) -> None:
+    """Update fields on a user document and drop its cached copy."""
+    get_db().collection(USERS_COL).document(email).update(updates)
+    user_cache.pop(email)
+
 def authenticate_user(email: str, password: str) -> dict:
     """Verify credentials, return user dict if OK, else None."""
-    doc = db.collection(USERS_COL).document(email).get()
-    if not doc.exists:
+    data = get_user(email)
+    if data is None:
         return None
-    data = doc.to_dict()
     if check_password_hash(data["password_hash"], password):
         return {
             "email": data["email"], 
@@ -64,58 +132,214 @@ def authenticate_user(email: str, password: str) -> dict:
 
 def get_user_role(email: str) -> str | None:
     """Return the role of the user with the given email."""
-    doc = db.collection(USERS_COL).document(email).get()
-    if not doc.exists:
+    data = get_user(email)
+    if data is None:
         return None
-    data = doc.to_dict()
     return data.get("role", None)
 
 
 
+def _listing_item(chat_id: str, data: dict) -> dict:
+    created_at = data.get("created_at")
+    if isinstance(created_at, datetime) and created_at.tzinfo is None:
+        created_at = created_at.replace(tzinfo=timezone.utc)
+    return {
+        "id": chat_id,
+        "created_at": created_at,
+        "userId": data.get("userId"),
+        "userName": data.get("userName"),
+        "favorite": data.get("favorite", False),
+    }
+
+_EPOCH = datetime.min.replace(tzinfo=timezone.utc)
+
+
+class InvalidCursor(ValueError):
+    """A listing cursor that was not issued by `list_chats_page`."""
+
+
+def _position(item: dict) -> Tuple[datetime, str]:
+    return item["created_at"] or _EPOCH, item["id"]
+
+
+def encode_cursor(item: dict) -> str:
+    """Opaque cursor holding the (created_at, id) position of a listing item."""
+    created_at = item["created_at"].isoformat() if item["created_at"] else None
+    raw = json.dumps([created_at, item["id"]]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        created_at, chat_id = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+        return (datetime.fromisoformat(created_at) if created_at else _EPOCH), str(chat_id)
+    except (ValueError, TypeError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor!r}") from e
+
+
+def _query_chat_listing(user_id: str, limit: Optional[int],
+                        start_after: Optional[Tuple[datetime, str]] = None) -> Tuple[List[dict], bool]:
+    """
+    Run one projection-only listing query, newest first, starting after the
+    (created_at, id) position `start_after`.
+    Returns (items, has_more); `limit=None` reads everything.
+    """
+    global _ordered_listing_supported
+    from firebase_admin import firestore
+    from google.api_core.exceptions import FailedPrecondition
+
+    collection = get_db().collection(COLLECTION)
+    base = collection.where("userId", "==", user_id).select(CHAT_LIST_FIELDS)
+    if _ordered_listing_supported:
+        try:
+            # Document id breaks created_at ties, so chats sharing a timestamp
+            # across a page boundary are neither skipped nor repeated
+            query = (base.order_by("created_at", direction=firestore.Query.DESCENDING)
+                     .order_by("__name__", direction=firestore.Query.DESCENDING))
+            if start_after is not None:
+                query = query.start_after({"created_at": start_after[0],
+                                           "__name__": collection.document(start_after[1])})
+            if limit is not None:
+                query = query.limit(limit + 1)
+            items = [_listing_item(doc.id, doc.to_dict()) for doc in query.stream()]
+            if limit is not None and len(items) > limit:
+                return items[:limit], True
+            return items, False
+        except FailedPrecondition as index_error:
+            # Only a missing composite index switches to the scan; anything
+            # else (timeouts, permissions) is raised to the caller
+            logger.warning(f"Index error, falling back to client-side sorting: {index_error}")
+            _ordered_listing_supported = False
+
+    # Without the composite index: one projection-only scan, sorted, cut at
+    # the cursor and limited here
+    items = [_listing_item(doc.id, doc.to_dict()) for doc in base.stream()]
+    items.sort(key=_position, reverse=True)
+    if start_after is not None:
+        items = [item for item in items if _position(item) < start_after]
+    if limit is not None and len(items) > limit:
+        return items[:limit], True
+    return items, False
+
+def list_chats_page(user_id: str, limit: int = 50, cursor: Optional[str] = None) -> Tuple[List[dict], Optional[str]]:
+    """
+    Return one page of chat metadata for a user, newest first, plus the cursor
+    for the next page or None. Pages are served from a per-user listing cache
+    that is extended on demand and patched by create, delete and favorite
+    updates. Cursors carry their (created_at, id) position, so they stay valid
+    after the cache expires or the chat they point at is deleted. Raises
+    InvalidCursor for a cursor this function did not issue.
+    """
+    position = decode_cursor(cursor) if cursor else None
+    with _listing_lock:
+        listing = chat_listing_cache.get(user_id)
+        if listing is None:
+            listing = {"items": [], "complete": False}
+            chat_listing_cache.set(user_id, listing)
+        items = listing["items"]
+        ids = [item["id"] for item in items]
+        start = ids.index(position[1]) + 1 if position and position[1] in ids else 0
+
+    if position and start == 0:
+        # Cursor from before the cache was built (or from another worker):
+        # page straight from Firestore
+        page, has_more = _query_chat_listing(user_id, limit, start_after=position)
+        return page, (encode_cursor(page[-1]) if has_more and page else None)
+
+    while len(items) < start + limit and not listing["complete"]:
+        after = _position(items[-1]) if items else None
+        batch, has_more = _query_chat_listing(user_id, max(limit, 50), start_after=after)
+        with _listing_lock:
+            known = {item["id"] for item in items}
+            items.extend(item for item in batch if item["id"] not in known)
+            listing["complete"] = not has_more
+
+    page = items[start:start + limit]
+    more = start + limit < len(items) or not listing["complete"]
+    return page, (encode_cursor(page[-1]) if more and page else None)
+
+def _patch_listing(user_id: Optional[str], chat_id: str, update: Optional[dict]) -> None:
+    """Apply a create/delete/favorite change to a cached listing, if one exists."""
+    if not user_id:
+        return
+    with _listing_lock:
+        listing = chat_listing_cache.get(user_id)
+        if listing is None:
+            return
+        items = listing["items"]
+        for i, item in enumerate(items):
+            if item["id"] == chat_id:
+                if update is None:
+                    items.pop(i)
+                else:
+                    item.update(update)
+                return
+        if update is not None and "created_at" in update:
+            items.insert(0, update)
+
 def create_chat_log(chat_id: str, user_id: str, user_name: str, created_at: datetime = None):
     """Create a new chat log in Firestore."""
     if created_at is None:
         created_at = datetime.utcnow()
         
-    db.collection(COLLECTION).document(chat_id).set({
+    data = {
         "userId": user_id,
         "userName": user_name,
         "created_at": created_at,
         "favorite": False,
         "chat": []
-    })
+    }
+    get_db().collection(COLLECTION).document(chat_id).set(data)
+    _patch_listing(user_id, chat_id, _listing_item(chat_id, data))
 
-def delete_chat_log(chat_id: str) -> None:
+def set_chat_favorite(chat_id: str, favorite: bool, user_id: Optional[str] = None) -> None:
+    """Set the favorite flag on a chat."""
+    get_db().collection(COLLECTION).document(chat_id).update({"favorite": favorite})
+    _patch_listing(user_id, chat_id, {"favorite": favorite})
+
+def delete_chat_log(chat_id: str, user_id: Optional[str] = None) -> None:
     """Delete the Firestore doc for this chat."""
-    db.collection(COLLECTION).document(chat_id).delete()
+    get_db().collection(COLLECTION).document(chat_id).delete()
+    _patch_listing(user_id, chat_id, None)
 
 
+@metrics.timed("firestore_log")
 def add_message_to_log(chat_id: str, role: str, text: str) -> None:
     """
     Append a single-turn message to the `chat` array.
     We store it as a map whose single key is the role, so:
       { "user": "Hello" }  or  { "assistant": "Hi there" }
     """
+    _append_to_log(chat_id, [{role: text}])
+    logger.info(f"Added {role} message to chat {chat_id}")
+
+
+def add_turn_to_log(chat_id: str, user_text: str, reply: str) -> None:
+    """
+    Append a user message and its reply in one write, so a request that fails
+    before it has a reply leaves no unanswered user turn behind.
+    """
+    _append_to_log(chat_id, [{"user": user_text}, {"assistant": reply}])
+    logger.info(f"Added a turn to chat {chat_id}")
+
+
+def _append_to_log(chat_id: str, messages: List[Dict[str, str]]) -> None:
+    from firebase_admin import firestore
+
     # First get a reference to the document
-    doc_ref = db.collection(COLLECTION).document(chat_id)
-    
-    # Create the message object
-    msg = {role: text}
-    
+    doc_ref = get_db().collection(COLLECTION).document(chat_id)
+
     # Use a transaction to update both the chat array and timestamp
     @firestore.transactional
     def update_in_transaction(transaction, doc_ref):
-        # Add message to chat array
         transaction.update(doc_ref, {
-            "chat": firestore.ArrayUnion([msg]),
-            "updated_at": SERVER_TIMESTAMP
+            "chat": firestore.ArrayUnion(messages),
+            "updated_at": firestore.SERVER_TIMESTAMP
         })
 
     # Start a transaction
-    transaction = db.transaction()
+    transaction = get_db().transaction()
     update_in_transaction(transaction, doc_ref)
-    
-    logger.info(f"Added {role} message to chat {chat_id}")
 
 
 def get_chat_history(chat_id: str) -> list[dict]:
@@ -123,7 +347,7 @@ def get_chat_history(chat_id: str) -> list[dict]:
     Fetch the raw `chat` array from Firestore, e.g.
       [ { "system": "Welcome" }, { "user": "Hi..." }, … ]
     """
-    doc = db.collection(COLLECTION).document(chat_id).get()
+    doc = get_db().collection(COLLECTION).document(chat_id).get()
     if not doc.exists:
         return []
     return doc.to_dict().get("chat", [])
@@ -131,7 +355,8 @@ def get_chat_history(chat_id: str) -> list[dict]:
 def init_document_settings():
     """Initialize document upload settings"""
     UPLOAD_FOLDER = 'uploads'
-    ALLOWED_EXTENSIONS = {'pdf'}
+    # Everything the extractor registry can read (pdf, docx, html, md, txt, csv)
+    ALLOWED_EXTENSIONS = supported_extensions()
     
     if not os.path.exists(UPLOAD_FOLDER):
         os.makedirs(UPLOAD_FOLDER)
@@ -142,32 +367,75 @@ def allowed_file(filename: str, allowed_extensions: set) -> bool:
     """Check if file has an allowed extension"""
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in allowed_extensions
 
-def extract_text_from_pdf(file_path: str, max_chunk_size: int = 1000) -> List[str]:
+class UploadTooLarge(ValueError):
+    """An uploaded file is bigger than MAX_UPLOAD_BYTES."""
+
+
+def open_upload_stream(file, max_bytes: int = MAX_UPLOAD_BYTES) -> Tuple[BinaryIO, int]:
+    """
+    Return a seekable stream over an uploaded file and its size, without
+    writing it to a named path.
+
+    Werkzeug already buffers multipart parts (see app.SpooledUploadRequest), so
+    seekable streams are used in place; anything else is copied into a spooled
+    buffer. Raises UploadTooLarge past `max_bytes`.
+    """
+    stream = file.stream
+    if stream.seekable():
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell()
+        stream.seek(0)
+    else:
+        buffer = SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+        size = 0
+        while True:
+            block = stream.read(64 * 1024)
+            if not block:
+                break
+            size += len(block)
+            if size > max_bytes:
+                break
+            buffer.write(block)
+        buffer.seek(0)
+        stream = buffer
+    if size > max_bytes:
+        raise UploadTooLarge(f"{file.filename} is {size} bytes; the limit is {max_bytes}")
+    return stream, size
+
+
+def extract_text_from_pdf(source, max_chunk_size: int = 1000) -> List[str]:
     """
     Extract text from PDF and split into chunks of appropriate size
     
     Args:
-        file_path: Path to the PDF file
+        source: Path to the PDF file, or a seekable binary stream
         max_chunk_size: Maximum characters in a chunk
     """
-    reader = PdfReader(file_path)
-    raw_text = ""
-    
-    # Extract text from all pages
-    for page in reader.pages:
-        page_text = page.extract_text()
-        if page_text:
-            raw_text += page_text + "\n\n"
-    
-    # Create chunks of appropriate size
-    text_chunks = []
-    paragraphs = raw_text.split("\n\n")
-    
+    return list(iter_page_chunks((section.text for section in extract_pdf(source)), max_chunk_size))
+
+def iter_page_chunks(pages: Iterable[str], max_chunk_size: int = 1000) -> Iterator[str]:
+    """
+    Chunk a stream of page texts as `chunk_paragraphs` would chunk the pages
+    joined by blank lines, yielding each chunk as soon as it is complete.
+    """
+    paragraphs = (paragraph for page_text in pages for paragraph in page_text.split("\n\n"))
+    return pack_paragraphs(paragraphs, max_chunk_size)
+
+
+def chunk_paragraphs(raw_text: str, max_chunk_size: int = 1000) -> List[str]:
+    """
+    Greedily pack blank-line separated paragraphs into chunks of at most
+    `max_chunk_size` characters (a single longer paragraph stays whole).
+    """
+    return list(pack_paragraphs(raw_text.split("\n\n"), max_chunk_size))
+
+def pack_paragraphs(paragraphs: Iterable[str], max_chunk_size: int = 1000) -> Iterator[str]:
+    """Generator behind `chunk_paragraphs`; consumes `paragraphs` lazily."""
     current_chunk = ""
     for paragraph in paragraphs:
         # If adding this paragraph would exceed max size, store current chunk and start a new one
         if len(current_chunk) + len(paragraph) > max_chunk_size and current_chunk:
-            text_chunks.append(current_chunk.strip())
+            yield current_chunk.strip()
             current_chunk = paragraph
         else:
             if current_chunk:
@@ -177,13 +445,26 @@ def extract_text_from_pdf(file_path: str, max_chunk_size: int = 1000) -> List[st
     
     # Don't forget the last chunk
     if current_chunk:
-        text_chunks.append(current_chunk.strip())
-    
-    return text_chunks
+        yield current_chunk.strip()
 
-def embed_and_upload_to_pinecone(text_chunks: List[str], metadata: dict, index: pinecone.Index):
-    """Generate embeddings and upload to Pinecone"""
+def embed_and_upload_to_pinecone(text_chunks: Iterable[str], metadata: dict, index: pinecone.Index,
+                                 index_name: Optional[str] = None) -> int:
+    """
+    Generate embeddings and upload to Pinecone, one batch at a time
+
+    `text_chunks` may be a generator (e.g. from `iter_page_chunks`); it is only
+    pulled one batch ahead. `total_chunks` metadata is only set when the length
+    is known up front: a streamed document's count is not known until its last
+    batch is upserted, and nothing reads the field back (the count is returned,
+    and a document's chunks can be listed by id prefix). Vector ids are
+    "<doc_id>#<upload_id>#<n>" when metadata has an `upload_id`, else
+    "<doc_id>_<n>". Cached retrievals for `index_name` (every index if
+    unknown) are invalidated after each batch. Returns the number of chunks uploaded.
+    """
+    if index_name is None and isinstance(getattr(index, 'name', None), str):
+        index_name = index.name
     batch_size = 100
+    total = len(text_chunks) if hasattr(text_chunks, "__len__") else None
     
     # Clean metadata to ensure no null values
     clean_metadata = {}
@@ -193,52 +474,113 @@ def embed_and_upload_to_pinecone(text_chunks: List[str], metadata: dict, index:
         else:
             clean_metadata[key] = ""  # Replace null with empty string
     
-    for i in range(0, len(text_chunks), batch_size):
-        batch = text_chunks[i:i + batch_size]
+    chunks = iter(text_chunks)
+    i = 0
+    while True:
+        batch = list(islice(chunks, batch_size))
+        if not batch:
+            break
         
         # Generate embeddings
-        embeddings = model.encode(batch)
+        with metrics.timer("embed_chunks"):
+            embeddings = get_model().encode(batch)
         
         # Prepare vectors for Pinecone
         vectors = []
         for j, embedding in enumerate(embeddings):
             chunk_id = i + j
-            vector_id = f"{clean_metadata['doc_id']}_{chunk_id}"
+            if clean_metadata.get('upload_id'):
+                vector_id = f"{clean_metadata['doc_id']}#{clean_metadata['upload_id']}#{chunk_id}"
+            else:
+                vector_id = f"{clean_metadata['doc_id']}_{chunk_id}"
             
             # Create chunk-specific metadata
             chunk_metadata = {
                 **clean_metadata,  # Use the cleaned metadata
                 'chunk_id': chunk_id,
-                'chunk_text': batch[j],
-                'total_chunks': len(text_chunks)
+                'chunk_text': batch[j]
             }
+            if total is not None:
+                chunk_metadata['total_chunks'] = total
             
             vectors.append((vector_id, embedding.tolist(), chunk_metadata))
         
         # Upsert to Pinecone
-        index.upsert(vectors=vectors)
-        print(f"Uploaded batch {i//batch_size + 1}/{(len(text_chunks) + batch_size - 1)//batch_size}")
+        with metrics.timer("vector_upsert"):
+            index.upsert(vectors=vectors)
+        bump_index_version(index_name)
+        batches = f"/{(total + batch_size - 1)//batch_size}" if total is not None else ""
+        print(f"Uploaded batch {i//batch_size + 1}{batches}")
+        i += len(batch)
+    return i
+
+def new_upload_id() -> str:
+    """Time-ordered id for one upload of a document (sorts by start time)."""
+    return f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:6]}"
 
-def process_document(file, upload_folder: str, index, user_data: dict) -> str:
+def delete_stale_document_chunks(index, doc_id: str, upload_id: str) -> int:
     """
-    Process a single document file
-    
+    Delete every chunk of `doc_id` that is not from its newest upload, which
+    is `upload_id` unless a later upload of the same name has already written
+    chunks; legacy "<doc_id>_<n>" vectors go too. Returns how many were deleted.
+    """
+    try:
+        current = [vid for page in index.list(prefix=f"{doc_id}#") for vid in page]
+        newest = max([vid.split("#")[1] for vid in current] + [upload_id])
+        stale = [vid for vid in current if vid.split("#")[1] != newest]
+        stale += [vid for page in index.list(prefix=f"{doc_id}_") for vid in page
+                  if vid[len(doc_id) + 1:].isdigit()]
+        for start in range(0, len(stale), 1000):
+            index.delete(ids=stale[start:start + 1000])
+        return len(stale)
+    except Exception as e:
+        # Pod-based indexes cannot list ids
+        logger.warning(f"Could not delete stale chunks of {doc_id}: {e}")
+        return 0
+
+def _peak_rss_bytes() -> int:
+    """High-water mark of this process's resident memory (0 where unsupported)."""
+    try:
+        import resource
+    except ImportError:
+        return 0
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak if sys.platform == "darwin" else peak * 1024
+
+@metrics.timed("process_document")
+def process_document(file, index, user_data: dict) -> dict:
+    """
+    Process a single uploaded document straight from the request stream
+
+    Nothing is written to the uploads folder: the registered extractor for
+    the file type yields pages/sections one at a time (from the process pool
+    for large files), which are fed through the chunker into batched
+    embedding and upserts.
+
     Args:
         file: The uploaded file object
-        upload_folder: Path to save temporary files
         index: Pinecone Index or VectorStoreIndex 
         user_data: Dictionary containing user details
+
+    Each upload gets its own `upload_id` in its vector ids, so two uploads
+    with the same sanitized name never overwrite each other's chunks; once
+    the new chunks are in, those of earlier uploads are deleted.
+
+    Returns:
+        Upload stats: filename, upload id, size, chunk count, near-duplicate
+        chunks skipped, stale chunks deleted, whether the upload spilled
+        from memory to an anonymous temp file, and peak RSS growth
     """
     filename = secure_filename(file.filename)
-    file_path = os.path.join(upload_folder, filename)
-    file.save(file_path)
-    
-    # Extract text from PDF with controlled chunk size
-    text_chunks = extract_text_from_pdf(file_path, max_chunk_size=1000)
+    peak_before = _peak_rss_bytes()
+    stream, size = open_upload_stream(file)
     
     # Prepare base metadata with user details - ensure no null values
+    upload_id = new_upload_id()
     metadata = {
         'doc_id': filename,
+        'upload_id': upload_id,
         'filename': filename,
         'upload_date': datetime.now().isoformat(),
         'uploader_email': user_data.get('email') or "",
@@ -254,10 +596,34 @@ def process_document(file, upload_folder: str, index, user_data: dict) -> str:
         # If it's already a Pinecone index, use it directly
         pinecone_index = index
     
-    # Upload to Pinecone with text in metadata
-    embed_and_upload_to_pinecone(text_chunks, metadata, pinecone_index)
+    # Extract, chunk and upload with text in metadata, section by section;
+    # repeated blocks (page headers, disclaimers, boilerplate) are embedded once
+    sections = extract_sections(stream, filename, mimetype=file.mimetype, size=size)
+    duplicates = NearDuplicateIndex(name="upload_chunk")
+    chunks = unique_chunks(
+        iter_page_chunks((section.text for section in sections), max_chunk_size=1000), duplicates
+    )
+    index_name = getattr(index, 'index_name', None)
+    chunk_count = embed_and_upload_to_pinecone(chunks, metadata, pinecone_index, index_name=index_name)
+    # Chunks of earlier uploads of this document (which may have had more of them)
+    stale_chunks = delete_stale_document_chunks(pinecone_index, filename, upload_id)
+    if stale_chunks:
+        bump_index_version(index_name)
+    notify_sources_ingested([filename])
     
-    # Clean up uploaded file
-    os.remove(file_path)
-    
-    return filename
\ No newline at end of file
+    stats = {
+        'filename': filename,
+        'upload_id': upload_id,
+        'bytes': size,
+        'chunks': chunk_count,
+        'duplicate_chunks': duplicates.duplicates,
+        'stale_chunks_deleted': stale_chunks,
+        # Both the request parser (app.SpooledUploadRequest) and
+        # open_upload_stream spool up to UPLOAD_SPOOL_BYTES in memory
+        'spooled_to_disk': size > UPLOAD_SPOOL_BYTES,
+        'peak_rss_growth_bytes': max(0, _peak_rss_bytes() - peak_before),
+    }
+    metrics.observe("upload_size_bytes", size)
+    metrics.observe("upload_peak_rss_growth_bytes", stats['peak_rss_growth_bytes'])
+    logger.info(f"Processed upload {stats}")
+    return stats